@@ -0,0 +1,59 @@
+"""
+Measure construction and arithmetic speed of the geometry classes.
+
+Reports the operations per second of frequent Matrix, Point, Rect, IRect and
+Quad operations.
+
+Usage: python geometry_speed.py [--number N] [--repeat N]
+"""
+from __future__ import print_function
+
+import argparse
+import timeit
+
+import fitz
+
+SETUP = """
+import fitz
+m = fitz.Matrix(1, 0.5, -0.5, 1, 10, 20)
+p = fitz.Point(3, 4)
+r = fitz.Rect(10, 20, 110, 220)
+ir = fitz.IRect(10, 20, 110, 220)
+q = r.quad
+"""
+
+CASES = [
+    "fitz.Matrix(1, 2, 3, 4, 5, 6)",
+    "fitz.Matrix(45)",
+    "m * m",
+    "fitz.Point(1, 2)",
+    "p + p",
+    "p * m",
+    "abs(p)",
+    "fitz.Rect(1, 2, 3, 4)",
+    "r * m",
+    "r | p",
+    "r & ir",
+    "p in r",
+    "r.round()",
+    "fitz.IRect(1, 2, 3, 4)",
+    "fitz.Quad(r)",
+    "q * m",
+    "q.rect",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("PyMuPDF", fitz.VersionBind)
+    for stmt in CASES:
+        t = min(timeit.repeat(stmt, SETUP, repeat=args.repeat, number=args.number))
+        print("%-30s %12.0f ops/s" % (stmt, args.number / t))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Measure the drawing throughput of Shape.
+
+Draws many rectangles and lines on one page, with a finish() call every
+'--batch' elements, and reports the elements drawn per second. For
+comparison, the same is measured with a buffer that concatenates strings,
+like Shape did before it used io buffers.
+
+Usage: python shape_throughput.py [--count N] [--batch N] [--repeat N]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import fitz
+
+
+class ConcatBuffer(object):
+    """String concatenation with the buffer interface used by Shape."""
+
+    def __init__(self):
+        self.s = ""
+
+    def write(self, s):
+        self.s += s
+
+    def getvalue(self):
+        return self.s
+
+    def tell(self):
+        return len(self.s)
+
+
+def draw(count, batch, batched_api):
+    doc = fitz.open()
+    page = doc.newPage()
+    shape = page.newShape()
+    t0 = time.time()
+    for start in range(0, count, batch):
+        n = min(batch, count - start)
+        rects = [fitz.Rect(i % 500, i % 700, i % 500 + 10, i % 700 + 5) for i in range(start, start + n)]
+        if batched_api:
+            shape.draw_rects(rects)
+            shape.draw_lines([(r.tl, r.br) for r in rects])
+        else:
+            for r in rects:
+                shape.drawRect(r)
+                shape.drawLine(r.tl, r.br)
+        shape.finish(color=(0, 0, 1))
+    shape.commit()
+    return 2 * count / (time.time() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    buffer_type = fitz.utils.Shape._buffer_type
+    cases = [
+        ("io buffer, drawRect/drawLine", buffer_type, False),
+        ("io buffer, draw_rects/draw_lines", buffer_type, True),
+        ("str concatenation, drawRect/drawLine", ConcatBuffer, False),
+    ]
+    for name, buf, batched_api in cases:
+        fitz.utils.Shape._buffer_type = buf
+        rate = max(draw(args.count, args.batch, batched_api) for _ in range(args.repeat))
+        print("%-40s %12.0f elements/s" % (name, rate))
+    fitz.utils.Shape._buffer_type = buffer_type
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,8 @@ import fitz.utils
 # Document
 # ------------------------------------------------------------------------------
 fitz.open = fitz.Document
+fitz.TextIndex = fitz.utils.TextIndex
+fitz.SpatialIndex = fitz.utils.SpatialIndex
 fitz.Document.getToC = fitz.utils.getToC
 fitz.Document._do_links = fitz.utils.do_links
 fitz.Document.getPagePixmap = fitz.utils.getPagePixmap
@@ -38,10 +40,12 @@ fitz.Document.getPageText = fitz.utils.getPageText
 fitz.Document.setMetadata = fitz.utils.setMetadata
 fitz.Document.setToC = fitz.utils.setToC
 fitz.Document.searchPageFor = fitz.utils.searchPageFor
+fitz.Document.search = fitz.utils.search
 fitz.Document.newPage = fitz.utils.newPage
 fitz.Document.insertPage = fitz.utils.insertPage
 fitz.Document.getCharWidths = fitz.utils.getCharWidths
 fitz.Document.scrub = fitz.utils.scrub
+fitz.Document.subset_fonts = fitz.utils.subset_fonts
 
 # ------------------------------------------------------------------------------
 # Page
@@ -70,6 +74,7 @@ fitz.Page.insertTextbox = fitz.utils.insertTextbox
 fitz.Page.newShape = lambda x: fitz.utils.Shape(x)
 fitz.Page.searchFor = fitz.utils.searchFor
 fitz.Page.showPDFpage = fitz.utils.showPDFpage
+fitz.Page.spatial_index = fitz.utils.spatial_index
 fitz.Page.updateLink = fitz.utils.updateLink
 fitz.Page.writeText = fitz.utils.writeText
 # ------------------------------------------------------------------------------
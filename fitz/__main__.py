@@ -81,10 +81,16 @@ def print_xref(doc, xref):
     Simulate the PDF source in "pretty" format.
     For a stream also print its size.
     """
+    print_xref_item(doc.xref_objects([xref])[0])
+
+
+def print_xref_item(item):
+    """Print an object given as an item of Document.xref_objects().
+    """
+    xref, isstream, xref_str, _ = item
     print("%i 0 obj" % xref)
-    xref_str = doc.xrefObject(xref)
     print(xref_str)
-    if doc.isStream(xref):
+    if isstream:
         temp = xref_str.split()
         try:
             idx = temp.index("/Length") + 1
@@ -189,9 +195,10 @@ def show(args):
     if args.xrefs:
         print(mycenter("object information"))
         xrefl = get_list(args.xrefs, doc._getXrefLength(), what="xref")
-        for xref in xrefl:
-            print_xref(doc, xref)
-            print()
+        for i in range(0, len(xrefl), 256):  # read objects in batches
+            for item in doc.xref_objects(xrefl[i : i + 256]):
+                print_xref_item(item)
+                print()
     if args.pages:
         print(mycenter("page information"))
         pagel = get_list(args.pages, doc.pageCount + 1)
@@ -497,48 +504,34 @@ def extract_objects(args):
         if not (os.path.exists(out_dir) and os.path.isdir(out_dir)):
             sys.exit("output directory %s does not exist" % out_dir)
 
-    font_xrefs = set()  # already saved fonts
-    image_xrefs = set()  # already saved images
+    # fonts and images of all pages, with shared resources scanned once
+    inventory = doc.get_resource_inventory([pno - 1 for pno in pages])
+    font_xrefs = sorted(inventory["fonts"].keys()) if args.fonts else []
+    image_xrefs = sorted(inventory["images"].keys()) if args.images else []
 
-    for pno in pages:
-        if args.fonts:
-            itemlist = doc.getPageFontList(pno - 1)
-            for item in itemlist:
-                xref = item[0]
-                if xref not in font_xrefs:
-                    font_xrefs.add(xref)
-                    fontname, ext, _, buffer = doc.extractFont(xref)
-                    if ext == "n/a" or not buffer:
-                        continue
-                    outname = os.path.join(
-                        out_dir, fontname.replace(" ", "-") + "." + ext
-                    )
-                    outfile = open(outname, "wb")
-                    outfile.write(buffer)
-                    outfile.close()
-                    buffer = None
-        if args.images:
-            itemlist = doc.getPageImageList(pno - 1)
-            for item in itemlist:
-                xref = item[0]
-                if xref not in image_xrefs:
-                    image_xrefs.add(xref)
-                    pix = recoverpix(doc, item)
-                    if type(pix) is dict:
-                        ext = pix["ext"]
-                        imgdata = pix["image"]
-                        outname = os.path.join(out_dir, "img-%i.%s" % (xref, ext))
-                        outfile = open(outname, "wb")
-                        outfile.write(imgdata)
-                        outfile.close()
-                    else:
-                        outname = os.path.join(out_dir, "img-%i.png" % xref)
-                        pix2 = (
-                            pix
-                            if pix.colorspace.n < 4
-                            else fitz.Pixmap(fitz.csRGB, pix)
-                        )
-                        pix2.writeImage(outname)
+    for xref in font_xrefs:
+        fontname, ext, _, buffer = doc.extractFont(xref)
+        if ext == "n/a" or not buffer:
+            continue
+        outname = os.path.join(out_dir, fontname.replace(" ", "-") + "." + ext)
+        outfile = open(outname, "wb")
+        outfile.write(buffer)
+        outfile.close()
+        buffer = None
+
+    for xref in image_xrefs:
+        pix = recoverpix(doc, inventory["images"][xref])
+        if type(pix) is dict:
+            ext = pix["ext"]
+            imgdata = pix["image"]
+            outname = os.path.join(out_dir, "img-%i.%s" % (xref, ext))
+            outfile = open(outname, "wb")
+            outfile.write(imgdata)
+            outfile.close()
+        else:
+            outname = os.path.join(out_dir, "img-%i.png" % xref)
+            pix2 = pix if pix.colorspace.n < 4 else fitz.Pixmap(fitz.csRGB, pix)
+            pix2.writeImage(outname)
 
     if args.fonts:
         print("saved %i fonts to '%s'" % (len(font_xrefs), out_dir))
@@ -547,6 +540,27 @@ def extract_objects(args):
     doc.close()
 
 
+def extract_text(args):
+    """Write the plain text of a document to a file.
+    """
+    doc = open_file(args.input, args.password, pdf=False)
+
+    if args.pages:
+        pages = get_list(args.pages, doc.pageCount + 1)
+    else:
+        pages = range(1, doc.pageCount + 1)
+
+    if args.output:
+        outname = args.output
+    else:
+        outname = os.path.splitext(args.input)[0] + ".txt"
+    separator = "" if args.noformfeed else "\f"
+
+    count = doc.export_text(outname, [pno - 1 for pno in pages], separator=separator)
+    print("saved text of %i pages to '%s'" % (count, outname))
+    doc.close()
+
+
 def main():
     """Define command configurations.
     """
@@ -670,6 +684,25 @@ def main():
     )
     ps_extract.set_defaults(func=extract_objects)
 
+    # -------------------------------------------------------------------------
+    # 'text' command
+    # -------------------------------------------------------------------------
+    ps_text = subps.add_parser(
+        "text", description=mycenter("extract plain text to a file")
+    )
+    ps_text.add_argument("input", type=str, help="input document filename")
+    ps_text.add_argument("-password", help="password")
+    ps_text.add_argument(
+        "-pages", type=str, help="consider these pages only, format: 1,5-7,50-N"
+    )
+    ps_text.add_argument(
+        "-output", help="output filename, default is input with extension '.txt'"
+    )
+    ps_text.add_argument(
+        "-noformfeed", action="store_true", help="do not separate pages by form feeds"
+    )
+    ps_text.set_defaults(func=extract_text)
+
     # -------------------------------------------------------------------------
     # 'embed-info'
     # -------------------------------------------------------------------------
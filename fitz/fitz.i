@@ -183,6 +183,15 @@ dictkey_wmode = PyString_InternFromString("wmode");
 dictkey_xref = PyString_InternFromString("xref");
 dictkey_xres = PyString_InternFromString("xres");
 dictkey_yres = PyString_InternFromString("yres");
+//-----------------------------------------------------------------------------
+// init struct sequence types
+//-----------------------------------------------------------------------------
+PyStructSequence_InitType(&JM_TextSpanType, &JM_TextSpan_desc);
+PyStructSequence_InitType(&JM_TextCharType, &JM_TextChar_desc);
+Py_INCREF((PyObject *) &JM_TextSpanType);
+Py_INCREF((PyObject *) &JM_TextCharType);
+PyDict_SetItemString(d, "TextSpan", (PyObject *) &JM_TextSpanType);
+PyDict_SetItemString(d, "TextChar", (PyObject *) &JM_TextCharType);
 %}
 
 %header %{
@@ -199,6 +208,10 @@ struct DeviceWrapper {
 // include version information and several other helpers
 //-----------------------------------------------------------------------------
 %pythoncode %{
+import array
+import codecs
+import decimal
+import hashlib
 import io
 import math
 import os
@@ -207,6 +220,10 @@ from binascii import hexlify
 
 fitz_py2 = str is bytes  # if true, this is Python 2
 string_types = (str, unicode) if fitz_py2 else (str,)
+
+# struct sequence types of compact text extraction output
+TextSpan = _fitz.TextSpan
+TextChar = _fitz.TextChar
 %}
 %include version.i
 %include helper-defines.i
@@ -292,6 +309,9 @@ struct Document
         self.FontInfos   = []
         self.Graftmaps   = {}
         self.ShownPages  = {}
+        self._fontext_cache = {}  # font file extensions by xref
+        self._font_registry = {}  # xrefs of fonts inserted by insertFont
+        self._subset_fonts = set()  # xrefs of fonts reduced by subset_fonts
         self._page_refs  = weakref.WeakValueDictionary()%}
 
         %pythonappend Document %{
@@ -369,6 +389,9 @@ struct Document
             self.stream      = None
             self.isClosed    = True
             self.FontInfos   = []
+            self._fontext_cache = {}
+            self._font_registry = {}
+            self._subset_fonts = set()
             for gmap in self.Graftmaps:
                 self.Graftmaps[gmap] = None
             self.Graftmaps = {}
@@ -1214,6 +1237,10 @@ struct Document
         }
 
         FITZEXCEPTION(_deleteObject, !result)
+        %pythonappend _deleteObject %{
+        self._fontext_cache.clear()
+        self._font_registry.clear()
+        self._reset_textpages()%}
         CLOSECHECK0(_deleteObject, """Delete object.""")
         PyObject *_deleteObject(int xref)
         {
@@ -1345,6 +1372,9 @@ struct Document
         // save PDF file
         //---------------------------------------------------------------------
         FITZEXCEPTION(save, !result)
+        %pythonappend save %{
+        self._fontext_cache.clear()
+        self._font_registry.clear()%}
         %pythonprepend save %{
         """Save PDF to filename."""
         if self.isClosed or self.isEncrypted:
@@ -1362,6 +1392,10 @@ struct Document
         if incremental:
             if self.name != filename or self.stream:
                 raise ValueError("incremental needs original file")
+        if garbage >= 3 and not incremental:
+            # hash-based replacement of MuPDF's pairwise object comparison
+            self.dedupe_objects(streams=garbage >= 4)
+            garbage = 2
         %}
 
         PyObject *save(char *filename, int garbage=0, int clean=0, int deflate=0, int incremental=0, int ascii=0, int expand=0, int linear=0, int pretty=0, int encryption=1, int permissions=-1, char *owner_pw=NULL, char *user_pw=NULL)
@@ -1407,12 +1441,19 @@ struct Document
         // write document to memory
         //---------------------------------------------------------------------
         FITZEXCEPTION(write, !result)
+        %pythonappend write %{
+        self._fontext_cache.clear()
+        self._font_registry.clear()%}
         %pythonprepend write %{
         """Write the PDF to a bytes object."""
         if self.isClosed or self.isEncrypted:
             raise ValueError("document closed or encrypted")
         if self.pageCount < 1:
-            raise ValueError("cannot write with zero pages")%}
+            raise ValueError("cannot write with zero pages")
+        if garbage >= 3:
+            # hash-based replacement of MuPDF's pairwise object comparison
+            self.dedupe_objects(streams=garbage >= 4)
+            garbage = 2%}
 
         PyObject *write(int garbage=0, int clean=0, int deflate=0,
                         int ascii=0, int expand=0, int linear=0, int pretty=0,
@@ -1762,7 +1803,7 @@ if len(pyliste) == 0 or min(pyliste) not in range(len(self)) or max(pyliste) not
 
         FITZEXCEPTION(_getPageInfo, !result)
         CLOSECHECK(_getPageInfo, """List fonts, images, XObjects used on a page.""")
-        PyObject *_getPageInfo(int pno, int what)
+        PyObject *_getPageInfo(int pno, int what, PyObject *fontext=NULL)
         {
             fz_document *doc = (fz_document *) $self;
             pdf_document *pdf = pdf_specifics(gctx, doc);
@@ -1779,7 +1820,7 @@ if len(pyliste) == 0 or min(pyliste) not in range(len(self)) or max(pyliste) not
                 rsrc = pdf_dict_get_inheritable(gctx, pageref, PDF_NAME(Resources));
                 if (!pageref || !rsrc) THROWMSG("cannot retrieve page info");
                 liste = PyList_New(0);
-                JM_scan_resources(gctx, pdf, rsrc, liste, what, 0);
+                JM_scan_resources(gctx, pdf, rsrc, liste, what, 0, fontext);
             }
             fz_catch(gctx)
             {
@@ -1789,9 +1830,144 @@ if len(pyliste) == 0 or min(pyliste) not in range(len(self)) or max(pyliste) not
             return liste;
         }
 
-        FITZEXCEPTION(extractFont, !result)
-        CLOSECHECK(extractFont, """Get a font by xref.""")
-        PyObject *extractFont(int xref = 0, int info_only = 0)
+        FITZEXCEPTION(_getResourceInventory, !result)
+        CLOSECHECK(_getResourceInventory, """List fonts, images, XObjects of several pages.""")
+        PyObject *_getResourceInventory(PyObject *pages, PyObject *fontext=NULL)
+        {
+            fz_document *doc = (fz_document *) $self;
+            pdf_document *pdf = pdf_specifics(gctx, doc);
+            int pageCount = fz_count_pages(gctx, doc);
+            pdf_obj *pageref, *rsrc;
+            PyObject *seq = NULL, *memo = NULL, *pagelist = NULL, *tables[3] = {NULL, NULL, NULL};
+            PyObject *rc = NULL, *entry;
+            Py_ssize_t i, n;
+            int k, pno;
+            fz_var(seq);
+            fz_var(memo);
+            fz_var(pagelist);
+            fz_try(gctx) {
+                ASSERT_PDF(pdf);
+                seq = PySequence_Fast(pages, "");
+                if (!seq) {
+                    PyErr_Clear();
+                    THROWMSG("pages must be a sequence");
+                }
+                memo = PyDict_New();
+                for (k = 0; k < 3; k++) tables[k] = PyDict_New();
+                pagelist = PyList_New(0);
+                n = PySequence_Fast_GET_SIZE(seq);
+                for (i = 0; i < n; i++) {
+                    pno = (int) PyLong_AsLong(PySequence_Fast_GET_ITEM(seq, i));
+                    if (PyErr_Occurred()) {
+                        PyErr_Clear();
+                        THROWMSG("bad page number(s)");
+                    }
+                    if (!INRANGE(pno, 0, pageCount - 1))
+                        THROWMSG("bad page number(s)");
+                    pageref = pdf_lookup_page_obj(gctx, pdf, pno);
+                    rsrc = pdf_dict_get_inheritable(gctx, pageref, PDF_NAME(Resources));
+                    if (!pageref || !rsrc) {
+                        entry = Py_BuildValue("NNN", PySet_New(NULL),
+                                              PySet_New(NULL), PySet_New(NULL));
+                    } else {
+                        entry = JM_resource_inventory(gctx, pdf, rsrc, memo, tables, 0, fontext);
+                    }
+                    LIST_APPEND_DROP(pagelist, entry);
+                }
+                rc = Py_BuildValue("OOOO", pagelist, tables[0], tables[1], tables[2]);
+            }
+            fz_always(gctx) {
+                Py_CLEAR(seq);
+                Py_CLEAR(memo);
+                Py_CLEAR(pagelist);
+                for (k = 0; k < 3; k++) Py_CLEAR(tables[k]);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        FITZEXCEPTION(_exportText, !result)
+        CLOSECHECK(_exportText, """Write plain text of several pages to a file.""")
+        PyObject *_exportText(PyObject *pages, PyObject *fileobj=NULL, char *filename=NULL, char *separator=NULL, int flags=0)
+        {
+            fz_document *doc = (fz_document *) $self;
+            int pageCount = fz_count_pages(gctx, doc);
+            fz_output *out = NULL;
+            fz_page *page = NULL;
+            fz_stext_page *tpage = NULL;
+            PyObject *seq = NULL;
+            Py_ssize_t i, n = 0;
+            int pno;
+            fz_var(out);
+            fz_var(page);
+            fz_var(tpage);
+            fz_var(seq);
+            fz_try(gctx) {
+                seq = PySequence_Fast(pages, "");
+                if (!seq) {
+                    PyErr_Clear();
+                    THROWMSG("pages must be a sequence");
+                }
+                if (fileobj && fileobj != Py_None) {
+                    out = JM_new_output_pyfile(gctx, fileobj);
+                } else {
+                    out = fz_new_output_with_path(gctx, filename, 0);
+                }
+                n = PySequence_Fast_GET_SIZE(seq);
+                for (i = 0; i < n; i++) {
+                    pno = (int) PyLong_AsLong(PySequence_Fast_GET_ITEM(seq, i));
+                    if (PyErr_Occurred()) {
+                        PyErr_Clear();
+                        THROWMSG("bad page number(s)");
+                    }
+                    if (!INRANGE(pno, 0, pageCount - 1))
+                        THROWMSG("bad page number(s)");
+                    page = fz_load_page(gctx, doc, pno);
+                    tpage = JM_new_stext_page_from_page(gctx, page, flags, fz_infinite_rect);
+                    JM_print_stext_page_as_text(gctx, out, tpage, 1);
+                    if (separator) fz_write_string(gctx, out, separator);
+                    fz_drop_stext_page(gctx, tpage);
+                    tpage = NULL;
+                    fz_drop_page(gctx, page);
+                    page = NULL;
+                }
+                fz_close_output(gctx, out);  // report errors of final write
+            }
+            fz_always(gctx) {
+                fz_drop_stext_page(gctx, tpage);
+                fz_drop_page(gctx, page);
+                fz_try(gctx) {  // also close the output after errors
+                    fz_close_output(gctx, out);
+                }
+                fz_catch(gctx) {;}
+                fz_drop_output(gctx, out);
+                Py_CLEAR(seq);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return Py_BuildValue("n", n);
+        }
+
+        FITZEXCEPTION(_getGlyphUsage, !result)
+        CLOSECHECK(_getGlyphUsage, """Get the glyphs used with font files.""")
+        PyObject *_getGlyphUsage(PyObject *xrefs)
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_glyph_usage(gctx, (fz_document *) $self, xrefs);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        FITZEXCEPTION(_extractFont, !result)
+        CLOSECHECK(_extractFont, """Get a font by xref.""")
+        PyObject *_extractFont(int xref = 0, int info_only = 0, PyObject *fontext = NULL)
         {
             pdf_document *pdf = pdf_specifics(gctx, (fz_document *) $self);
 
@@ -1805,7 +1981,7 @@ if len(pyliste) == 0 or min(pyliste) not in range(len(self)) or max(pyliste) not
             fz_buffer *buffer = NULL;
             pdf_obj *obj, *basefont, *bname;
             PyObject *bytes = PyBytes_FromString("");
-            char *ext = NULL;
+            PyObject *ext = NULL;
             char *fontname = NULL;
             PyObject *nulltuple = Py_BuildValue("sssO", "", "", "", bytes);
             PyObject *tuple;
@@ -1822,8 +1998,11 @@ if len(pyliste) == 0 or min(pyliste) not in range(len(self)) or max(pyliste) not
                         bname = pdf_dict_get(gctx, obj, PDF_NAME(Name));
                     else
                         bname = basefont;
-                    ext = JM_get_fontextension(gctx, pdf, xref);
-                    if (strcmp(ext, "n/a") != 0 && !info_only)
+                    ext = JM_get_fontextension_cached(gctx, pdf, xref, fontext);
+                    PyObject *na = JM_UnicodeFromStr("n/a");
+                    int has_file = !PyObject_RichCompareBool(ext, na, Py_EQ);
+                    Py_DECREF(na);
+                    if (has_file && !info_only)
                     {
                         buffer = JM_get_fontbuffer(gctx, pdf, xref);
                         bytes = JM_BinFromBuffer(gctx, buffer);
@@ -1831,7 +2010,7 @@ if len(pyliste) == 0 or min(pyliste) not in range(len(self)) or max(pyliste) not
                     }
                     tuple = PyTuple_New(4);
                     PyTuple_SET_ITEM(tuple, 0, JM_EscapeStrFromStr(pdf_to_name(gctx, bname)));
-                    PyTuple_SET_ITEM(tuple, 1, JM_UnicodeFromStr(ext));
+                    PyTuple_SET_ITEM(tuple, 1, ext);
                     PyTuple_SET_ITEM(tuple, 2, JM_UnicodeFromStr(pdf_to_name(gctx, subtype)));
                     PyTuple_SET_ITEM(tuple, 3, bytes);
                 }
@@ -2210,6 +2389,49 @@ if not self.isFormPDF:
             return Py_BuildValue("i", xreflen);
         }
 
+        //---------------------------------------------------------------------
+        // Merge duplicate objects and streams
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(dedupe_objects, !result)
+        %pythonappend dedupe_objects %{
+        self._fontext_cache.clear()
+        self._font_registry.clear()%}
+        %pythonprepend dedupe_objects %{
+        """Merge identical objects and (optionally) streams.
+
+        Notes:
+            Objects are compared via a hash of their source, so runtime
+            grows about linearly with the number of objects. References
+            are redirected to the lowest xref of each group of duplicates,
+            and the duplicates are deleted.
+        Args:
+            streams: (bool) also merge identical stream objects.
+        Returns:
+            A dictionary with the number of inspected objects, and merged
+            objects and streams.
+        """
+        if self.isClosed or self.isEncrypted:
+            raise ValueError("document closed or encrypted")
+        if not self.isPDF:
+            raise ValueError("not a PDF")%}
+        PyObject *dedupe_objects(int streams=1)
+        {
+            pdf_document *pdf = pdf_specifics(gctx, (fz_document *) $self);
+            int objects = 0, dupes = 0, dupe_streams = 0;
+            fz_try(gctx) {
+                ASSERT_PDF(pdf);
+                JM_dedupe_objects(gctx, pdf, streams, &objects, &dupes, &dupe_streams);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            if (dupes + dupe_streams > 0) pdf->dirty = 1;
+            return Py_BuildValue("{s:i,s:i,s:i}",
+                                 "objects", objects,
+                                 "duplicates", dupes,
+                                 "streams", dupe_streams);
+        }
+
         //---------------------------------------------------------------------
         // Get XML Metadata xref
         //---------------------------------------------------------------------
@@ -2279,6 +2501,170 @@ if not self.isFormPDF:
             return text;
         }
 
+        //---------------------------------------------------------------------
+        // Get source and stream of several xrefs
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_getXrefObjects, !result)
+        CLOSECHECK(_getXrefObjects, """Get list of (xref, isstream, source, stream).""")
+        PyObject *_getXrefObjects(PyObject *xrefs, int streams=0, int compressed=0, int ascii=0)
+        {
+            pdf_document *pdf = pdf_specifics(gctx, (fz_document *) $self);
+            PyObject *seq = NULL, *rc = NULL;
+            Py_ssize_t i, n;
+            int xref;
+            fz_try(gctx) {
+                ASSERT_PDF(pdf);
+                seq = PySequence_Fast(xrefs, "");
+                if (!seq) {
+                    PyErr_Clear();
+                    THROWMSG("xrefs must be a sequence");
+                }
+                int xreflen = pdf_xref_len(gctx, pdf);
+                n = PySequence_Fast_GET_SIZE(seq);
+                rc = PyList_New(0);
+                for (i = 0; i < n; i++) {
+                    xref = (int) PyLong_AsLong(PySequence_Fast_GET_ITEM(seq, i));
+                    if (PyErr_Occurred()) {
+                        PyErr_Clear();
+                        THROWMSG("xrefs must be integers");
+                    }
+                    if (!INRANGE(xref, 1, xreflen-1))
+                        THROWMSG("xref out of range");
+                    LIST_APPEND_DROP(rc, JM_xref_object_tuple(gctx, pdf, xref,
+                                     streams, compressed, ascii));
+                }
+            }
+            fz_always(gctx) {
+                Py_XDECREF(seq);
+            }
+            fz_catch(gctx) {
+                Py_CLEAR(rc);
+                return NULL;
+            }
+            return rc;
+        }
+
+        //---------------------------------------------------------------------
+        // Get type and value of an object's key
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_xrefGetKey, !result)
+        CLOSECHECK(_xrefGetKey, """Get (type, value) of a key of an xref.""")
+        PyObject *_xrefGetKey(int xref, char *key)
+        {
+            pdf_document *pdf = pdf_specifics(gctx, (fz_document *) $self);
+            pdf_obj *obj = NULL;
+            PyObject *rc = NULL;
+            fz_var(obj);
+            fz_try(gctx) {
+                ASSERT_PDF(pdf);
+                obj = JM_load_xref_or_trailer(gctx, pdf, xref);
+                rc = JM_obj_type_value(gctx, JM_obj_at_path(gctx, obj, key));
+            }
+            fz_always(gctx) {
+                pdf_drop_obj(gctx, obj);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        //---------------------------------------------------------------------
+        // Get the keys of a dictionary below an object
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_xrefGetKeys, !result)
+        CLOSECHECK(_xrefGetKeys, """Get the keys of a dictionary of an xref.""")
+        PyObject *_xrefGetKeys(int xref, char *key)
+        {
+            pdf_document *pdf = pdf_specifics(gctx, (fz_document *) $self);
+            pdf_obj *obj = NULL, *dict;
+            PyObject *rc = NULL;
+            int i, n;
+            fz_var(obj);
+            fz_var(rc);
+            fz_try(gctx) {
+                ASSERT_PDF(pdf);
+                obj = JM_load_xref_or_trailer(gctx, pdf, xref);
+                dict = pdf_resolve_indirect(gctx, JM_obj_at_path(gctx, obj, key));
+                n = pdf_dict_len(gctx, dict);
+                rc = PyTuple_New((Py_ssize_t) n);
+                for (i = 0; i < n; i++) {
+                    PyTuple_SET_ITEM(rc, i, JM_EscapeStrFromStr(
+                            pdf_to_name(gctx, pdf_dict_get_key(gctx, dict, i))));
+                }
+            }
+            fz_always(gctx) {
+                pdf_drop_obj(gctx, obj);
+            }
+            fz_catch(gctx) {
+                Py_CLEAR(rc);
+                return NULL;
+            }
+            return rc;
+        }
+
+        //---------------------------------------------------------------------
+        // Set a key of an object to a value given as PDF source
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_xrefSetKey, !result)
+        %pythonappend _xrefSetKey %{
+        self._fontext_cache.clear()
+        self._font_registry.clear()
+        self._reset_textpages()%}
+        CLOSECHECK(_xrefSetKey, """Set a key of an xref to a PDF source value.""")
+        PyObject *_xrefSetKey(int xref, char *key, char *value)
+        {
+            pdf_document *pdf = pdf_specifics(gctx, (fz_document *) $self);
+            pdf_obj *obj = NULL, *parent, *new_obj = NULL;
+            char *path = NULL, *item;
+            fz_var(obj);
+            fz_var(new_obj);
+            fz_var(path);
+            fz_try(gctx) {
+                ASSERT_PDF(pdf);
+                if (!key || !key[0]) THROWMSG("bad key");
+                obj = JM_load_xref_or_trailer(gctx, pdf, xref);
+                path = fz_strdup(gctx, key);
+                item = strrchr(path, '/');
+                if (item) {
+                    *item = 0;
+                    item += 1;
+                    parent = pdf_resolve_indirect(gctx, JM_obj_at_path(gctx, obj, path));
+                } else {
+                    item = path;
+                    parent = obj;
+                }
+                if (!item[0]) THROWMSG("bad key");
+                new_obj = JM_pdf_obj_from_str(gctx, pdf, value);
+                if (pdf_is_dict(gctx, parent)) {
+                    if (pdf_is_null(gctx, new_obj))
+                        pdf_dict_dels(gctx, parent, item);
+                    else
+                        pdf_dict_puts(gctx, parent, item, new_obj);
+                }
+                else if (pdf_is_array(gctx, parent)) {
+                    char *end;
+                    long i = strtol(item, &end, 10);
+                    if (*end || i < 0 || i >= pdf_array_len(gctx, parent))
+                        THROWMSG("bad array index");
+                    pdf_array_put(gctx, parent, (int) i, new_obj);
+                }
+                else {
+                    THROWMSG("key not found");
+                }
+            }
+            fz_always(gctx) {
+                fz_free(gctx, path);
+                pdf_drop_obj(gctx, new_obj);
+                pdf_drop_obj(gctx, obj);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            pdf->dirty = 1;
+            return_none;
+        }
+
         //---------------------------------------------------------------------
         // Get String of PDF trailer
         //---------------------------------------------------------------------
@@ -2383,6 +2769,10 @@ if not self.isFormPDF:
         // Update an Xref number with a new object given as a string
         //---------------------------------------------------------------------
         FITZEXCEPTION(_updateObject, !result)
+        %pythonappend _updateObject %{
+        self._fontext_cache.clear()
+        self._font_registry.clear()
+        self._reset_textpages()%}
         CLOSECHECK(_updateObject, """Replace object definition source.""")
         PyObject *_updateObject(int xref, char *text, struct Page *page = NULL)
         {
@@ -2411,6 +2801,10 @@ if not self.isFormPDF:
         // Update a stream identified by its xref
         //---------------------------------------------------------------------
         FITZEXCEPTION(_updateStream, !result)
+        %pythonappend _updateStream %{
+        self._fontext_cache.clear()
+        self._font_registry.clear()
+        self._reset_textpages()%}
         CLOSECHECK(_updateStream, """Replace xref stream part.""")
         PyObject *_updateStream(int xref = 0, PyObject *stream = NULL, int new = 0)
         {
@@ -2686,12 +3080,22 @@ if not self.isFormPDF:
                     raise ValueError("document closed or encrypted")
                 if not self.isPDF:
                     return ()
-                val = self._getPageInfo(pno, 1)
+                val = self._getPageInfo(pno, 1, self._fontext_cache)
                 if full is False:
                     return [v[:-1] for v in val]
                 return val
 
 
+            def extractFont(self, xref=0, info_only=False):
+                """Get a font by xref.
+
+                Returns:
+                    A tuple (basename, ext, subtype, buffer). Font file
+                    extensions are cached in the document by xref.
+                """
+                return self._extractFont(xref, info_only, self._fontext_cache)
+
+
             def getPageImageList(self, pno, full=False):
                 """Retrieve a list of images used on a page.
                 """
@@ -2716,6 +3120,79 @@ if not self.isFormPDF:
                 return val
 
 
+            def get_resource_inventory(self, pages=None):
+                """Retrieve fonts, images and XObjects of several pages at once.
+
+                Notes:
+                    The page tree is walked once and resources shared between
+                    pages are scanned only once.
+                Args:
+                    pages: sequence of page numbers, default is all pages.
+                Returns:
+                    A dictionary with keys 'pages', 'fonts', 'images' and
+                    'xobjects'. 'pages' maps every page number to a tuple
+                    (font_xrefs, image_xrefs, xobject_xrefs) of sorted tuples.
+                    The other items map the xrefs to the respective entries of
+                    getPageFontList, getPageImageList, getPageXObjectList
+                    (all with full=True).
+                """
+                if self.isClosed or self.isEncrypted:
+                    raise ValueError("document closed or encrypted")
+                if not self.isPDF:
+                    raise ValueError("not a PDF")
+                if pages is None:
+                    pages = range(self.pageCount)
+                else:
+                    pages = [p + self.pageCount if p < 0 else p for p in pages]
+                pagelist, fonts, images, xobjects = self._getResourceInventory(pages, self._fontext_cache)
+                inventory = {}
+                for pno, item in zip(pages, pagelist):
+                    inventory[pno] = tuple([tuple(sorted(x)) for x in item])
+                return {
+                    "pages": inventory,
+                    "fonts": fonts,
+                    "images": images,
+                    "xobjects": xobjects,
+                }
+
+
+            def export_text(self, output, pages=None, separator="\f", flags=None):
+                """Write the plain text of several pages to a file.
+
+                Notes:
+                    Pages are loaded, extracted and written one at a time via
+                    one output stream, so memory use does not depend on the
+                    number of pages. Text is written UTF-8 encoded to paths
+                    and binary files, and as str to text files.
+                Args:
+                    output: file path or file object with a 'write' method,
+                        binary or text (io.TextIOBase, e.g. io.StringIO).
+                    pages: sequence of page numbers, default is all pages.
+                    separator: string written after each page.
+                    flags: text extraction flags.
+                Returns:
+                    The number of pages written.
+                """
+                if self.isClosed or self.isEncrypted:
+                    raise ValueError("document closed or encrypted")
+                if pages is None:
+                    pages = range(self.pageCount)
+                else:
+                    pages = [p + self.pageCount if p < 0 else p for p in pages]
+                if flags is None:
+                    flags = TEXT_PRESERVE_LIGATURES | TEXT_PRESERVE_WHITESPACE
+                if separator == "":
+                    separator = None
+                if isinstance(output, io.TextIOBase):
+                    writer = _TextFileWriter(output)
+                    rc = self._exportText(pages, fileobj=writer, separator=separator, flags=flags)
+                    writer.close()
+                    return rc
+                if hasattr(output, "write"):
+                    return self._exportText(pages, fileobj=output, separator=separator, flags=flags)
+                return self._exportText(pages, filename=str(output), separator=separator, flags=flags)
+
+
             def copyPage(self, pno, to=-1):
                 """Copy a page within a PDF document.
 
@@ -2836,6 +3313,83 @@ if not self.isFormPDF:
                 return self._getXrefString(xref, compressed, ascii)
 
 
+            def xref_objects(self, xrefs, streams=False, compressed=False, ascii=False):
+                """Return the definitions of several xrefs in one call.
+
+                Args:
+                    xrefs: sequence of xref numbers.
+                    streams: (bool) also return the decompressed streams.
+                    compressed, ascii: as in 'get_pdf_object'.
+                Returns:
+                    A list of tuples (xref, isstream, source, stream). Item
+                    'stream' is None if not requested or no stream object.
+                """
+                return self._getXrefObjects(xrefs, streams, compressed, ascii)
+
+
+            def iter_xrefs(self, start=1, stop=None, streams=False, compressed=False, ascii=False, batch=256):
+                """Generate the definitions of xrefs in range(start, stop).
+
+                Objects are read in batches of size 'batch' to limit memory use.
+                Generated items equal those of 'xref_objects'.
+                """
+                xreflen = self.xrefLength()
+                if stop is None or stop > xreflen:
+                    stop = xreflen
+                start = max(start, 1)
+                batch = max(batch, 1)
+                for first in range(start, stop, batch):
+                    xrefs = range(first, min(first + batch, stop))
+                    for item in self._getXrefObjects(xrefs, streams, compressed, ascii):
+                        yield item
+
+
+            def xref_get_key(self, xref, key):
+                """Get type and value of a key of an xref.
+
+                Args:
+                    xref: (int) xref number, -1 means the PDF trailer.
+                    key: (str) a key name, or a path like 'Resources/Font/F1'.
+                        Array items are given by their index, e.g. 'Kids/0'.
+                Returns:
+                    A tuple (type, value). Type is one of 'null', 'bool', 'int',
+                    'float', 'name', 'string', 'xref', 'array' or 'dict'. The
+                    value of 'array' and 'dict' is their number of items, the
+                    value of 'xref' is the xref number.
+                """
+                return self._xrefGetKey(xref, key)
+
+
+            def xref_get_keys(self, xref, key=""):
+                """Get the keys of the dictionary at xref (or below it, via key)."""
+                return self._xrefGetKeys(xref, key)
+
+
+            def xref_set_key(self, xref, key, value):
+                """Set a key of an xref to a value given as PDF source.
+
+                Notes:
+                    The parent of the key must exist. Value 'null' deletes
+                    a dictionary key. See 'PDFSource' to convert Python values.
+                """
+                return self._xrefSetKey(xref, key, value)
+
+
+            def xref_view(self, xref):
+                """Return a PDFDict or PDFArray view of the object at xref.
+
+                Notes:
+                    Keys are read and written on access, without converting
+                    the object to and from its source. Use -1 for the trailer.
+                """
+                t, _ = self._xrefGetKey(xref, "")
+                if t == "dict":
+                    return PDFDict(self, xref)
+                if t == "array":
+                    return PDFArray(self, xref)
+                raise ValueError("xref is no dictionary or array")
+
+
             def updateObject(self, xref, text, page=None):
                 """Repleace the object at xref with text.
 
@@ -2975,6 +3529,12 @@ if not self.isFormPDF:
                 if pid in self._page_refs:
                     self._page_refs[pid] = None
 
+            def _reset_textpages(self):
+                """Empty the TextPage caches of all pages."""
+                for page in self._page_refs.values():
+                    if page:
+                        page._reset_textpages()
+
             def _reset_page_refs(self):
                 """Invalidate all pages in document dictionary."""
                 if self.isClosed:
@@ -3104,11 +3664,11 @@ struct Page {
         //---------------------------------------------------------------------
         FITZEXCEPTION(_get_text_page, !result)
         struct TextPage *
-        _get_text_page(int flags=0)
+        _get_text_page(int flags=0, PyObject *clip=NULL)
         {
             fz_stext_page *textpage=NULL;
             fz_try(gctx) {
-                textpage = JM_new_stext_page_from_page(gctx, (fz_page *) $self, flags);
+                textpage = JM_new_stext_page_from_page(gctx, (fz_page *) $self, flags, JM_rect_from_py(clip));
             }
             fz_catch(gctx) {
                 return NULL;
@@ -3116,17 +3676,53 @@ struct Page {
             return (struct TextPage *) textpage;
         }
         %pythoncode %{
-        def getTextPage(self, flags=0):
+        def getTextPage(self, flags=0, clip=None):
+            """Create a TextPage, or reuse a cached one (see 'cache_textpages').
+
+            Notes:
+                If 'clip' is given, only text and images inside this rectangle
+                (in unrotated page coordinates) are collected. Such textpages
+                are never cached.
+            """
             CheckParent(self)
+            cache = getattr(self, "_textpages", None)
+            if clip is not None:
+                clip = tuple(Rect(clip))
+                cache = None
+            if cache is not None and flags in cache:
+                return cache[flags]
             old_rotation = self.rotation
             if old_rotation != 0:
                 self.setRotation(0)
             try:
-                textpage = self._get_text_page(flags=flags)
+                textpage = self._get_text_page(flags=flags, clip=clip)
             finally:
                 if old_rotation != 0:
                     self.setRotation(old_rotation)
+            if cache is not None:
+                cache[flags] = textpage
             return textpage
+
+        def cache_textpages(self, on=True):
+            """Switch caching of TextPages on or off.
+
+            Notes:
+                If on, the most recent TextPage of each flags value is kept,
+                and 'getTextPage' (thus also 'getText', 'searchFor', etc.)
+                returns it instead of parsing the page again. The cache is
+                emptied when page contents are changed by PyMuPDF methods.
+                Switching off empties the cache.
+            """
+            if on:
+                if getattr(self, "_textpages", None) is None:
+                    self._textpages = {}
+            else:
+                self._textpages = None
+
+        def _reset_textpages(self):
+            """Empty the TextPage cache after content changes."""
+            if getattr(self, "_textpages", None):
+                self._textpages.clear()
         %}
 
         //---------------------------------------------------------------------
@@ -4070,6 +4666,7 @@ struct Page {
         // Page apply redactions
         //---------------------------------------------------------------------
         FITZEXCEPTION(_apply_redactions, !result)
+        %pythonappend _apply_redactions %{self._reset_textpages()%}
         PyObject *_apply_redactions()
         {
             pdf_page *page = pdf_page_from_fz_page(gctx, (fz_page *) $self);
@@ -4115,6 +4712,7 @@ struct Page {
         // Page.setMediaBox
         //---------------------------------------------------------------------
         FITZEXCEPTION(setMediaBox, !result)
+        %pythonappend setMediaBox %{self._reset_textpages()%}
         PARENTCHECK(setMediaBox, """Set the MediaBox.""")
         PyObject *setMediaBox(PyObject *rect)
         {
@@ -4141,6 +4739,7 @@ struct Page {
         // ATTENTION: This will also change the value returned by Page.bound()
         //---------------------------------------------------------------------
         FITZEXCEPTION(setCropBox, !result)
+        %pythonappend setCropBox %{self._reset_textpages()%}
         PARENTCHECK(setCropBox, """Set the CropBox.""")
         PyObject *setCropBox(PyObject *rect)
         {
@@ -4492,6 +5091,7 @@ except:
         // Page clean contents stream
         //---------------------------------------------------------------------
         PARENTCHECK(_cleanContents, """Clean page /Contents object(s).""")
+        %pythonappend _cleanContents %{self._reset_textpages()%}
         PyObject *_cleanContents()
         {
             pdf_page *page = pdf_page_from_fz_page(gctx, (fz_page *) $self);
@@ -4524,6 +5124,7 @@ except:
         // Show a PDF page
         //---------------------------------------------------------------------
         FITZEXCEPTION(_showPDFpage, !result)
+        %pythonappend _showPDFpage %{self._reset_textpages()%}
         PyObject *_showPDFpage(struct Page *fz_srcpage, int overlay=1, PyObject *matrix=NULL, int xref=0, PyObject *clip = NULL, struct Graftmap *graftmap = NULL, char *_imgname = NULL)
         {
             pdf_obj *xobj1, *xobj2, *resources;
@@ -4596,6 +5197,7 @@ except:
         // insert an image
         //---------------------------------------------------------------------
         FITZEXCEPTION(_insertImage, !result)
+        %pythonappend _insertImage %{self._reset_textpages()%}
         PyObject *_insertImage(const char *filename=NULL, struct Pixmap *pixmap=NULL, PyObject *stream=NULL, int overlay=1, PyObject *matrix=NULL,
         const char *_imgname=NULL, PyObject *_imgpointer=NULL)
         {
@@ -4730,6 +5332,8 @@ def insertFont(self, fontname="helv", fontfile=None, fontbuffer=None,
     font = CheckFont(self, fontname)
     if font is not None:                    # font already in font list of page
         xref = font[0]                      # this is the xref
+        if xref in doc._subset_fonts:       # may lack glyphs: never reuse
+            raise ValueError("font '%s' has been subset" % fontname)
         if CheckFontInfo(doc, xref):        # also in our document font list?
             return xref                     # yes: we are done
         # need to build the doc FontInfo entry - done via getCharWidths
@@ -4760,14 +5364,34 @@ def insertFont(self, fontname="helv", fontfile=None, fontbuffer=None,
         except:
             pass
 
+    # fonts inserted before are identified by file name or buffer MD5
+    if fontfile:
+        source = fontfile
+    elif fontbuffer:
+        if type(fontbuffer) is not bytes:  # need bytes for hashing
+            if hasattr(fontbuffer, "getvalue"):
+                fontbuffer = fontbuffer.getvalue()
+            fontbuffer = bytes(fontbuffer)
+        source = hashlib.md5(fontbuffer).digest()
+    else:
+        source = None
+    key = (bfname, CJK_number, serif, source, bool(set_simple), idx, wmode, encoding)
+    xref = doc._font_registry.get(key, 0)
+    if xref in doc._subset_fonts:
+        xref = 0
+    if xref > 0 and CheckFontInfo(doc, xref):  # font exists in document
+        self._insertFontRef(fontname, xref)  # only refer to it from the page
+        return xref
+
     # install the font for the page
     val = self._insertFont(fontname, bfname, fontfile, fontbuffer, set_simple, idx,
-                           wmode, serif, encoding, CJK_number)
+                           wmode, serif, encoding, CJK_number, doc._subset_fonts)
 
     if not val:                   # did not work, error return
         return val
 
     xref = val[0]                 # xref of installed font
+    doc._font_registry[key] = xref
 
     if CheckFontInfo(doc, xref):  # check again: document already has this font
         return xref               # we are done
@@ -4784,7 +5408,8 @@ def insertFont(self, fontname="helv", fontfile=None, fontbuffer=None,
                              PyObject *fontbuffer,
                              int set_simple, int idx,
                              int wmode, int serif,
-                             int encoding, int ordering)
+                             int encoding, int ordering,
+                             PyObject *subset_fonts = NULL)
         {
             pdf_page *page = pdf_page_from_fz_page(gctx, (fz_page *) $self);
             pdf_document *pdf;
@@ -4792,9 +5417,9 @@ def insertFont(self, fontname="helv", fontfile=None, fontbuffer=None,
             fz_font *font = NULL;
             fz_buffer *res = NULL;
             const unsigned char *data = NULL;
-            int size, ixref = 0, index = 0, simple = 0;
+            int size, ixref = 0, index = 0, simple = 0, found;
             PyObject *value;
-            PyObject *exto = NULL;
+            PyObject *exto = NULL, *key;
             fz_try(gctx) {
                 ASSERT_PDF(page);
                 pdf = page->doc;
@@ -4848,9 +5473,26 @@ def insertFont(self, fontname="helv", fontfile=None, fontbuffer=None,
 
                 weiter: ;
                 ixref = pdf_to_num(gctx, font_obj);
+                const char *bfont = pdf_to_name(gctx,
+                            pdf_dict_get(gctx, font_obj, PDF_NAME(BaseFont)));
+
+                // MuPDF may find this font among the ones it added before,
+                // but Document.subset_fonts has reduced it since: never reuse
+                if (subset_fonts && subset_fonts != Py_None) {
+                    key = Py_BuildValue("i", ixref);
+                    found = PySequence_Contains(subset_fonts, key);
+                    Py_DECREF(key);
+                    if (found != 0) {
+                        pdf_drop_obj(gctx, font_obj);
+                        if (found < 0) {
+                            PyErr_Clear();
+                            THROWMSG("bad subset_fonts");
+                        }
+                        THROWMSG("font has been subset: reopen document to insert it again");
+                    }
+                }
 
-                PyObject *name = JM_EscapeStrFromStr(pdf_to_name(gctx,
-                            pdf_dict_get(gctx, font_obj, PDF_NAME(BaseFont))));
+                PyObject *name = JM_EscapeStrFromStr(bfont);
 
                 PyObject *subt = JM_UnicodeFromStr(pdf_to_name(gctx,
                             pdf_dict_get(gctx, font_obj, PDF_NAME(Subtype))));
@@ -4883,6 +5525,35 @@ def insertFont(self, fontname="helv", fontfile=None, fontbuffer=None,
             return value;
         }
 
+        //---------------------------------------------------------------------
+        // insert a reference to an existing font
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_insertFontRef, !result)
+        PyObject *_insertFontRef(char *fontname, int xref)
+        {
+            pdf_page *page = pdf_page_from_fz_page(gctx, (fz_page *) $self);
+            pdf_document *pdf;
+            pdf_obj *resources, *fonts;
+            fz_try(gctx) {
+                ASSERT_PDF(page);
+                pdf = page->doc;
+                if (!INRANGE(xref, 1, pdf_xref_len(gctx, pdf) - 1))
+                    THROWMSG("bad xref");
+                resources = pdf_dict_get_inheritable(gctx, page->obj, PDF_NAME(Resources));
+                fonts = pdf_dict_get(gctx, resources, PDF_NAME(Font));
+                if (!fonts) {  // page has no fonts yet
+                    fonts = pdf_new_dict(gctx, pdf, 10);
+                    pdf_dict_putl_drop(gctx, page->obj, fonts, PDF_NAME(Resources), PDF_NAME(Font), NULL);
+                }
+                pdf_dict_puts_drop(gctx, fonts, fontname, pdf_new_indirect(gctx, pdf, xref, 0));
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            pdf->dirty = 1;
+            return_none;
+        }
+
         //---------------------------------------------------------------------
         // Get page transformation matrix
         //---------------------------------------------------------------------
@@ -4949,6 +5620,7 @@ def insertFont(self, fontname="helv", fontfile=None, fontbuffer=None,
         // Set given object as the /Contents of a page
         //---------------------------------------------------------------------
         FITZEXCEPTION(_setContents, !result)
+        %pythonappend _setContents %{self._reset_textpages()%}
         PARENTCHECK(_setContents, """Set bytes as the (only) /Contents object.""")
         PyObject *_setContents(int xref = 0)
         {
@@ -5074,6 +5746,7 @@ def insertFont(self, fontname="helv", fontfile=None, fontbuffer=None,
 
         def _erase(self):
             self._reset_annot_refs()
+            self._textpages = None
             try:
                 self.parent._forget_page(self)
             except:
@@ -7964,7 +8637,7 @@ struct DisplayList {
             fz_stext_page *tp = NULL;
             fz_try(gctx) {
                 fz_stext_options stext_options = { 0 };
-                stext_options.flags = flags;
+                stext_options.flags = flags & ~JM_TEXT_IGNORE_GRAPHICS;
                 tp = fz_new_stext_page_from_display_list(gctx, this_dl, &stext_options);
             }
             fz_catch(gctx) {
@@ -7988,6 +8661,7 @@ struct TextPage {
         ~TextPage()
         {
             DEBUGMSG1("TextPage");
+            JM_stext_forget((fz_stext_page *) $self);
             fz_drop_stext_page(gctx, (fz_stext_page *) $self);
             DEBUGMSG2;
         }
@@ -8010,7 +8684,11 @@ struct TextPage {
         //---------------------------------------------------------------------
         FITZEXCEPTION(search, !result)
         %pythonprepend search
-        %{"""Locate up to 'hit_max' 'needle' occurrences returning rects or quads."""%}
+        %{"""Locate up to 'hit_max' 'needle' occurrences returning rects or quads.
+
+        Notes:
+            If 'hit_max' is less than 1, all occurrences are returned.
+        """%}
         %pythonappend search %{
         if not val:
             return val
@@ -8027,13 +8705,19 @@ struct TextPage {
         {
             fz_quad *result = NULL;
             PyObject *liste = NULL;
-            int i, mymax = hit_max;
-            if (mymax < 1) mymax = 16;
+            int i, count, mymax = hit_max;
+            if (mymax < 1) mymax = 32;  // no limit: grow until all fit
             fz_try(gctx) {
                 liste = PyList_New(0);
-                result = JM_Alloc(fz_quad, (mymax + 1));
+                while (1) {
+                    result = JM_Alloc(fz_quad, (mymax + 1));
+                    count = fz_search_stext_page(gctx, (fz_stext_page *) $self, needle, result, mymax);
+                    if (hit_max > 0 || count < mymax) break;
+                    JM_Free(result);
+                    result = NULL;
+                    mymax *= 2;
+                }
                 fz_quad *quad = (fz_quad *) result;
-                int count = fz_search_stext_page(gctx, (fz_stext_page *) $self, needle, result, hit_max);
                 for (i = 0; i < count; i++) {
                     LIST_APPEND_DROP(liste, JM_py_from_quad(*quad));
                     quad += 1;
@@ -8055,10 +8739,10 @@ struct TextPage {
         //---------------------------------------------------------------------
         FITZEXCEPTION(_getNewBlockList, !result)
         PyObject *
-        _getNewBlockList(PyObject *page_dict, int raw)
+        _getNewBlockList(PyObject *page_dict, int raw, int compact=0)
         {
             fz_try(gctx) {
-                JM_make_textpage_dict(gctx, (fz_stext_page *) $self, page_dict, raw);
+                JM_make_textpage_dict(gctx, (fz_stext_page *) $self, page_dict, raw, compact);
             }
             fz_catch(gctx) {
                 return NULL;
@@ -8067,13 +8751,205 @@ struct TextPage {
         }
 
         %pythoncode %{
-        def _textpage_dict(self, raw = False):
+        def _textpage_dict(self, raw = False, compact = False):
             page_dict = {"width": self.rect.width, "height": self.rect.height}
-            self._getNewBlockList(page_dict, raw)
+            self._getNewBlockList(page_dict, raw, compact)
             return page_dict
         %}
 
 
+        //---------------------------------------------------------------------
+        // Lazy access to blocks, lines and spans
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_blockInfos, !result)
+        PyObject *_blockInfos()
+        {
+            fz_stext_block *block;
+            PyObject *block_list = PyList_New(0), *block_dict;
+            int block_n = 0;
+            for (block = ((fz_stext_page *) $self)->first_block; block; block = block->next) {
+                block_dict = PyDict_New();
+                DICT_SETITEMSTR_DROP(block_dict, "number", Py_BuildValue("i", block_n));
+                DICT_SETITEM_DROP(block_dict, dictkey_type, Py_BuildValue("i", block->type));
+                DICT_SETITEM_DROP(block_dict, dictkey_bbox, JM_py_from_rect(block->bbox));
+                LIST_APPEND_DROP(block_list, block_dict);
+                block_n++;
+            }
+            return block_list;
+        }
+
+        FITZEXCEPTION(_imageBlock, !result)
+        PyObject *_imageBlock(int block_n)
+        {
+            fz_stext_block *block = JM_stext_block((fz_stext_page *) $self, block_n);
+            PyObject *block_dict = NULL;
+            fz_try(gctx) {
+                if (!block || block->type != FZ_STEXT_BLOCK_IMAGE)
+                    THROWMSG("not an image block");
+                block_dict = PyDict_New();
+                JM_make_image_block(gctx, block, block_dict);
+            }
+            fz_catch(gctx) {
+                Py_CLEAR(block_dict);
+                return NULL;
+            }
+            return block_dict;
+        }
+
+        FITZEXCEPTION(_blockTypes, !result)
+        PyObject *_blockTypes()
+        {
+            fz_stext_block *block;
+            fz_buffer *res = NULL;
+            PyObject *rc;
+            fz_try(gctx) {
+                res = fz_new_buffer(gctx, 256);
+                for (block = ((fz_stext_page *) $self)->first_block; block; block = block->next)
+                    fz_append_byte(gctx, res, block->type);
+                rc = JM_BinFromBuffer(gctx, res);
+            }
+            fz_always(gctx) {
+                fz_drop_buffer(gctx, res);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        FITZEXCEPTION(_lineInfos, !result)
+        PyObject *_lineInfos(int block_n, int spans=0, int raw=0, int compact=0)
+        {
+            fz_stext_block *block = JM_stext_block((fz_stext_page *) $self, block_n);
+            fz_stext_line *line;
+            fz_buffer *buff = NULL;
+            PyObject *line_list = NULL, *line_dict;
+            int line_n = 0;
+            fz_var(buff);
+            fz_var(line_list);
+            fz_try(gctx) {
+                if (!block || block->type != FZ_STEXT_BLOCK_TEXT)
+                    THROWMSG("not a text block");
+                line_list = PyList_New(0);
+                for (line = block->u.t.first_line; line; line = line->next) {
+                    line_dict = PyDict_New();
+                    DICT_SETITEMSTR_DROP(line_dict, "block", Py_BuildValue("i", block_n));
+                    DICT_SETITEMSTR_DROP(line_dict, "number", Py_BuildValue("i", line_n));
+                    DICT_SETITEM_DROP(line_dict, dictkey_wmode,
+                                  Py_BuildValue("i", line->wmode));
+                    DICT_SETITEM_DROP(line_dict, dictkey_dir,
+                                  Py_BuildValue("ff", line->dir.x, line->dir.y));
+                    DICT_SETITEM_DROP(line_dict, dictkey_bbox,
+                                  JM_py_from_rect(line->bbox));
+                    if (spans) {
+                        if (!buff) buff = fz_new_buffer(gctx, 64);
+                        DICT_SETITEM_DROP(line_dict, dictkey_spans,
+                                  JM_make_spanlist(gctx, line, raw, buff, compact));
+                    }
+                    LIST_APPEND_DROP(line_list, line_dict);
+                    line_n++;
+                }
+            }
+            fz_always(gctx) {
+                fz_drop_buffer(gctx, buff);
+            }
+            fz_catch(gctx) {
+                Py_CLEAR(line_list);
+                return NULL;
+            }
+            return line_list;
+        }
+
+        FITZEXCEPTION(_lineSpans, !result)
+        PyObject *_lineSpans(int block_n, int line_n, int raw=0, int compact=0)
+        {
+            fz_stext_block *block = JM_stext_block((fz_stext_page *) $self, block_n);
+            fz_stext_line *line = JM_stext_line(block, line_n);
+            fz_buffer *buff = NULL;
+            PyObject *span_list = NULL;
+            fz_var(buff);
+            fz_try(gctx) {
+                if (!line) THROWMSG("line not found");
+                buff = fz_new_buffer(gctx, 64);
+                span_list = JM_make_spanlist(gctx, line, raw, buff, compact);
+            }
+            fz_always(gctx) {
+                fz_drop_buffer(gctx, buff);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return span_list;
+        }
+
+        %pythoncode %{
+        def iter_blocks(self, images=False):
+            """Generate the blocks of the page, without their lines.
+
+            Notes:
+                Items are dicts with keys 'number', 'type' and 'bbox'. If
+                'images' is true, image blocks also contain the image and its
+                properties like in 'extractDICT'.
+            """
+            for block in self._blockInfos():
+                if images and block["type"] == 1:
+                    block.update(self._imageBlock(block["number"]))
+                yield block
+
+        def iter_lines(self, block=None):
+            """Generate the lines of a text block, or of all text blocks.
+
+            Notes:
+                'block' is a block number or an item of 'iter_blocks'. Items
+                are dicts with keys 'block', 'number', 'wmode', 'dir' and
+                'bbox' - without the spans of the line.
+            """
+            if block is None:
+                blocks = self._textBlockNumbers()
+            elif type(block) is dict:
+                blocks = [block["number"]]
+            else:
+                blocks = [block]
+            for block_n in blocks:
+                for line in self._lineInfos(block_n):
+                    yield line
+
+        def _textBlockNumbers(self):
+            """Generate the numbers of the text blocks."""
+            for block_n, block_type in enumerate(bytearray(self._blockTypes())):
+                if block_type == 0:
+                    yield block_n
+
+        def iter_spans(self, line=None, raw=False, compact=False):
+            """Generate the spans of a line, or of all lines of the page.
+
+            Notes:
+                'line' is an item of 'iter_lines'. Spans look like in
+                'extractDICT', or like in 'extractRAWDICT' if 'raw' is true.
+                They are created one text block at a time. For 'compact'
+                see 'extractDICT'.
+            """
+            if line is not None:
+                for span in self._lineSpans(line["block"], line["number"], raw, compact):
+                    yield span
+                return
+            for block_n in self._textBlockNumbers():
+                for line in self._lineInfos(block_n, 1, raw, compact):
+                    for span in line["spans"]:
+                        yield span
+
+        def iter_chars(self, line=None, compact=False):
+            """Generate the characters of a line, or of all lines of the page.
+
+            Notes:
+                Items are the character dicts of 'extractRAWDICT', or
+                TextChar items if 'compact' is true.
+            """
+            for span in self.iter_spans(line, raw=True, compact=compact):
+                for char in (span.chars if compact else span["chars"]):
+                    yield char
+        %}
+
         //---------------------------------------------------------------------
         // Get text blocks with their bbox and concatenated lines
         // as a Python list
@@ -8216,6 +9092,136 @@ struct TextPage {
             return_none;
         }
 
+        //---------------------------------------------------------------------
+        // Get words or characters as columns of binary arrays
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_extractColumns, !result)
+        PyObject *_extractColumns(int chars=0)
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_extract_columns(gctx, (fz_stext_page *) $self, chars);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        %pythoncode %{
+        def _columns(self, chars):
+            import array
+            n, bboxes, indices, text, offsets = self._extractColumns(chars)
+
+            def make_array(code, data):
+                a = array.array(code)
+                if fitz_py2:
+                    a.fromstring(data)
+                else:
+                    a.frombytes(data)
+                return a
+
+            return {
+                "count": n,
+                "bbox": make_array("f", bboxes),
+                "index": make_array("i", indices),
+                "text": text,
+                "offsets": make_array("i", offsets),
+            }
+
+        def extract_words_arrays(self):
+            """Return the words of the page as columns of flat arrays.
+
+            Notes:
+                Words are those of 'extractWORDS'. For n words, the result is
+                a dict with 'count' (n), 'bbox' (float32 array of 4n values
+                x0, y0, x1, y1), 'index' (int32 array of 3n values block,
+                line, word number), 'text' (all words concatenated) and
+                'offsets' (int32 array of n + 1 values). Word i is
+                text[offsets[i]:offsets[i+1]]. Arrays support the buffer
+                protocol, e.g. numpy.frombuffer(d["bbox"], numpy.float32).
+            """
+            return self._columns(0)
+
+        def extract_chars_arrays(self):
+            """Return the characters of the page as columns of flat arrays.
+
+            Notes:
+                Same as 'extract_words_arrays', with one item per character.
+                The third index number is the character number in its line.
+            """
+            return self._columns(1)
+        %}
+
+        //---------------------------------------------------------------------
+        // Linear text and mapping of its character ranges to quads
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_linearText, !result)
+        PyObject *_linearText()
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_linear_text(gctx, (fz_stext_page *) $self);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        FITZEXCEPTION(_linearQuads, !result)
+        PyObject *_linearQuads(PyObject *spans)
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_linear_quads(gctx, (fz_stext_page *) $self, spans);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        %pythoncode %{
+        def search_regex(self, pattern, flags=0, quads=False, ignore_accents=False):
+            """Locate regular expression matches returning rects or quads.
+
+            Notes:
+                The pattern is matched against the text of all lines, each
+                followed by a line break. Every match delivers a list with
+                one item per line touched by it. Empty matches and matches
+                consisting of line breaks only are ignored.
+            Args:
+                pattern: (str) regular expression, or a compiled one.
+                flags: (int) flags of module 're', e.g. re.IGNORECASE. Not
+                    allowed with a compiled pattern.
+                quads: (bool) return quads instead of rectangles.
+                ignore_accents: (bool) ignore diacritical marks of characters.
+            Returns:
+                A list of lists of rects or quads, one list per match.
+            """
+            import re
+            if hasattr(pattern, "pattern"):
+                if flags:
+                    raise ValueError("flags not allowed with compiled pattern")
+            text = self._linearText()
+            if ignore_accents:
+                text = _strip_accents(text)
+                if not hasattr(pattern, "pattern"):
+                    pattern = _strip_accents(pattern)
+            if not hasattr(pattern, "pattern"):
+                pattern = re.compile(pattern, flags)
+            spans = []
+            for m in pattern.finditer(text):
+                if m.end() > m.start():
+                    spans.extend(m.span())
+            # matches of line breaks only have no quads
+            hits = [hit for hit in self._linearQuads(spans) if hit]
+            if quads:
+                return [[Quad(q) for q in hit] for hit in hits]
+            return [[Quad(q).rect for q in hit] for hit in hits]
+        %}
+
         //---------------------------------------------------------------------
         // TextPage rectangle
         //---------------------------------------------------------------------
@@ -8256,7 +9262,7 @@ struct TextPage {
                         fz_print_stext_page_as_xhtml(gctx, out, this_tpage, 0);
                         break;
                     default:
-                        JM_print_stext_page_as_text(gctx, out, this_tpage);
+                        JM_print_stext_page_as_text(gctx, out, this_tpage, 0);
                         text = JM_EscapeStrFromBuffer(gctx, res);
                         break;
                 }
@@ -8308,13 +9314,23 @@ struct TextPage {
                 """Return page content as a XHTML string."""
                 return self._extractText(4)
 
-            def extractDICT(self):
-                """Return page content as a Python dict of images and text spans."""
-                return self._textpage_dict(raw=False)
+            def extractDICT(self, compact=False):
+                """Return page content as a Python dict of images and text spans.
+
+                Notes:
+                    If 'compact' is true, spans are TextSpan struct sequences
+                    instead of dicts, with attribute names equal to the keys.
+                """
+                return self._textpage_dict(raw=False, compact=compact)
 
-            def extractRAWDICT(self):
-                """Return page content as a Python dict of images and text characters."""
-                return self._textpage_dict(raw=True)
+            def extractRAWDICT(self, compact=False):
+                """Return page content as a Python dict of images and text characters.
+
+                Notes:
+                    If 'compact' is true, spans are TextSpan and characters
+                    TextChar struct sequences instead of dicts.
+                """
+                return self._textpage_dict(raw=True, compact=compact)
 
             def __del__(self):
                 if not type(self) is TextPage: return
@@ -8589,16 +9605,8 @@ struct Font
             except ValueError:
                 ordering = -1
             if fontname.lower().startswith(("fig", "fim")):
-                try:
-                    import pymupdf_fonts  # optional fonts
-                    fontbuffer = pymupdf_fonts.myfont(fontname)[:]  # make a copy
-                    fontname = None  # ensure using fontbuffer only
-                    del pymupdf_fonts  # remove package again
-                except Exception as exc:
-                    if repr(exc).startswith(("ImportError", "AttributeError")):
-                        raise ImportError("Optional package 'pymupdf_fonts' not installed")
-                    else:
-                        raise exc
+                fontbuffer = _pymupdf_fonts_buffer(fontname)
+                fontname = None  # ensure using fontbuffer only
             elif ordering < 0:
                 fontname = Base14_fontdict.get(fontname.lower(), fontname)
         %}
@@ -8610,7 +9618,7 @@ struct Font
             fz_font *font = NULL;
             fz_try(gctx) {
                 fz_text_language lang = fz_text_language_from_string(language);
-                font = JM_get_font(gctx, fontname, fontfile,
+                font = JM_get_font_cached(gctx, fontname, fontfile,
                            fontbuffer, script, lang, ordering,
                            is_bold, is_italic, is_serif);
             }
@@ -8698,10 +9706,73 @@ struct Font
             return JM_py_from_rect(fz_font_bbox(gctx, this_font));
         }
 
+        FITZEXCEPTION(_text_lengths, !result)
+        PyObject *_text_lengths(PyObject *texts, float fontsize, PyObject *bmp,
+                                PyObject *other, char *language=NULL,
+                                int script=0, int wmode=0)
+        {
+            fz_text_language lang = fz_text_language_from_string(language);
+            Py_buffer view;
+            int have_view = 0;
+            PyObject *rc = NULL;
+            fz_var(have_view);
+            fz_try(gctx) {
+                if (!PyDict_Check(other) ||
+                    PyObject_GetBuffer(bmp, &view, PyBUF_WRITABLE) < 0) {
+                    PyErr_Clear();
+                    THROWMSG("bad advance cache");
+                }
+                have_view = 1;
+                if (view.len < 65536 * (Py_ssize_t) sizeof(float)) {
+                    THROWMSG("bad advance cache");
+                }
+                rc = JM_text_lengths(gctx, (fz_font *) $self, texts, fontsize,
+                                     (float *) view.buf, other, lang, script, wmode);
+            }
+            fz_always(gctx) {
+                if (have_view) PyBuffer_Release(&view);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        PyObject *_advance_caches()
+        {
+            return JM_font_advances((fz_font *) $self);
+        }
+
         %pythoncode %{
+            def _advance_cache(self, language, script, wmode):
+                """Return the cached glyph advances for these parameters."""
+                caches = self._advance_caches()  # shared by equal fonts
+                if caches is None:  # font is not in the font cache
+                    caches = getattr(self, "_advances", None)
+                    if caches is None:
+                        caches = self._advances = {}
+                key = (language, script, wmode)
+                cache = caches.get(key)
+                if cache is None:
+                    # 65536 NaN floats for the BMP, a dict for the rest
+                    cache = caches[key] = (bytearray(b"\xff" * 262144), {})
+                return cache
+
+            def text_lengths(self, texts, fontsize=11, language=None, script=0, wmode=0):
+                """Calculate the lengths of several strings for this font.
+
+                Notes:
+                    Glyph advances are cached with the font, so measuring
+                    text again does not need any glyph lookups.
+                Returns:
+                    A list of floats, one per string.
+                """
+                bmp, other = self._advance_cache(language, script, wmode)
+                return self._text_lengths(texts, fontsize, bmp, other, language, script, wmode)
+
             def text_length(self, text, fontsize=11, wmode=0):
                 """Calculate the length of a string for this font."""
-                return fontsize * sum([self.glyph_advance(ord(c), wmode=wmode) for c in text])
+                return self.text_lengths((text,), fontsize, wmode=wmode)[0]
 
             def __repr__(self):
                 return "Font('%s')" % self.name
@@ -8808,6 +9879,41 @@ struct Tools
         }
 
 
+        %pythonprepend show_font_cache
+        %{"""Show font cache size and usage statistics."""%}
+        %pythonappend show_font_cache %{
+        temp = {"size": val[0], "maxsize": val[1], "hits": val[2], "misses": val[3]}
+        val = temp%}
+        PyObject *show_font_cache()
+        {
+            return Py_BuildValue("iiii", JM_font_cache_len, JM_font_cache_max,
+                                 JM_font_cache_hits, JM_font_cache_misses);
+        }
+
+
+        %pythonprepend set_font_cache
+        %{"""Set the maximum number of cached fonts."""%}
+        void set_font_cache(int maxsize)
+        {
+            if (maxsize < 0) maxsize = 0;
+            if (maxsize > JM_FONT_CACHE_LIMIT) maxsize = JM_FONT_CACHE_LIMIT;
+            JM_font_cache_max = maxsize;
+            JM_font_cache_shrink(gctx, maxsize);
+        }
+
+
+        %pythonprepend purge_font_cache
+        %{"""Empty the font cache."""%}
+        %pythonappend purge_font_cache %{_pymupdf_fonts_buffers.clear()%}
+        PyObject *purge_font_cache()
+        {
+            int n = JM_font_cache_len;
+            JM_font_cache_shrink(gctx, 0);
+            JM_font_cache_hits = JM_font_cache_misses = 0;
+            return Py_BuildValue("i", n);
+        }
+
+
         %pythonprepend set_graphics_min_line_width
         %{"""Set the graphics minimum line width."""%}
         void set_graphics_min_line_width(float min_line_width)
@@ -9006,6 +10112,7 @@ struct Tools
 
 
         FITZEXCEPTION(_insert_contents, !result)
+        %pythonappend _insert_contents %{page._reset_textpages()%}
         %pythonprepend _insert_contents
         %{"""Add bytes as a new /Contents object for a page, and return its xref."""%}
         PyObject *_insert_contents(struct Page *page, PyObject *newcont, int overlay=1)
@@ -9100,6 +10207,61 @@ struct Tools
                                                  JM_rect_from_py(r2)));
         }
 
+        //---------------------------------------------------------------------
+        // batch operations for RectArray, PointArray and QuadArray
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_transform_floats, !result)
+        PyObject *_transform_floats(PyObject *data, int width, PyObject *matrix)
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_transform_floats(gctx, data, width, JM_matrix_from_py(matrix));
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        FITZEXCEPTION(_combine_rect_floats, !result)
+        PyObject *_combine_rect_floats(PyObject *data, PyObject *rect, int union_=0)
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_combine_rect_floats(gctx, data, JM_rect_from_py(rect), union_);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        FITZEXCEPTION(_rect_floats_contain, !result)
+        PyObject *_rect_floats_contain(PyObject *data, PyObject *point)
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_rect_floats_contain(gctx, data, JM_point_from_py(point));
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
+        FITZEXCEPTION(_rect_floats_area, !result)
+        PyObject *_rect_floats_area(PyObject *data)
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_rect_floats_area(gctx, data);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
         PyObject *_concat_matrix(PyObject *m1, PyObject *m2)
         {
             return JM_py_from_matrix(fz_concat(JM_matrix_from_py(m1),
@@ -9127,11 +10289,33 @@ struct Tools
             return Py_BuildValue("(i, ())", 1);
         }
 
+        //---------------------------------------------------------------------
+        // lay out text lines for Shape.insertTextbox
+        //---------------------------------------------------------------------
+        FITZEXCEPTION(_layout_textbox, !result)
+        PyObject *_layout_textbox(PyObject *lines, PyObject *gids,
+                                  PyObject *widths, int tjmode,
+                                  double fontsize, double maxwidth, int align,
+                                  double pos, double maxpos, double step,
+                                  int progr)
+        {
+            PyObject *rc = NULL;
+            fz_try(gctx) {
+                rc = JM_layout_textbox(gctx, lines, gids, widths, tjmode,
+                                       fontsize, maxwidth, align, pos, maxpos,
+                                       step, progr);
+            }
+            fz_catch(gctx) {
+                return NULL;
+            }
+            return rc;
+        }
+
 
         float _measure_string(const char *text, const char *fontname, float fontsize,
                              int encoding = 0)
         {
-            fz_font *font = fz_new_base14_font(gctx, fontname);
+            fz_font *font = JM_base14_font(gctx, fontname);
             float w = 0;
             while (*text)
             {
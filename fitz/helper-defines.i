@@ -397,4 +397,32 @@ PyObject *dictkey_xref;
 PyObject *dictkey_xres;
 PyObject *dictkey_yres;
 
+// Struct sequence types for compact "dict" / "rawdict" output
+static PyStructSequence_Field JM_TextSpan_fields[] = {
+    {"size", "font size"},
+    {"flags", "font flags"},
+    {"font", "font name"},
+    {"color", "text color in sRGB format"},
+    {"bbox", "span rectangle"},
+    {"text", "span text (not for rawdict)"},
+    {"chars", "tuple of TextChar (rawdict only)"},
+    {NULL, NULL}
+};
+static PyStructSequence_Desc JM_TextSpan_desc = {
+    "fitz.TextSpan", "Text span of compact dict / rawdict output.",
+    JM_TextSpan_fields, 7
+};
+static PyStructSequence_Field JM_TextChar_fields[] = {
+    {"origin", "character origin"},
+    {"bbox", "character rectangle"},
+    {"c", "the character"},
+    {NULL, NULL}
+};
+static PyStructSequence_Desc JM_TextChar_desc = {
+    "fitz.TextChar", "Character of compact rawdict output.",
+    JM_TextChar_fields, 3
+};
+static PyTypeObject JM_TextSpanType;
+static PyTypeObject JM_TextCharType;
+
 %}
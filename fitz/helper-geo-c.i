@@ -193,4 +193,106 @@ JM_py_from_quad(fz_quad quad)
     return pquad;
 }
 
+//-----------------------------------------------------------------------------
+// Batch operations on rectangles or points stored as flat float arrays.
+// Arrays are passed as bytes objects with 4 floats per rectangle or 2 floats
+// per point, i.e. the layout of the "bbox" column of text extraction.
+//-----------------------------------------------------------------------------
+static float *
+JM_floats_from_bytes(fz_context *ctx, PyObject *data, int width, Py_ssize_t *count)
+{
+    char *c = NULL;
+    Py_ssize_t len = 0;
+    if (!PyBytes_Check(data) || PyBytes_AsStringAndSize(data, &c, &len) < 0) {
+        PyErr_Clear();
+        fz_throw(ctx, FZ_ERROR_GENERIC, "bad type: 'data'");
+    }
+    if (len % (width * sizeof(float)) != 0) {
+        fz_throw(ctx, FZ_ERROR_GENERIC, "bad data length");
+    }
+    *count = len / (width * sizeof(float));
+    return (float *) c;
+}
+
+// transform every rectangle (width 4) or point (width 2)
+PyObject *JM_transform_floats(fz_context *ctx, PyObject *data, int width, fz_matrix m)
+{
+    Py_ssize_t i, n = 0;
+    float *src = JM_floats_from_bytes(ctx, data, width, &n);
+    PyObject *rc = PyBytes_FromStringAndSize(NULL, n * width * sizeof(float));
+    float *dst = (float *) PyBytes_AS_STRING(rc);
+    fz_rect r;
+    fz_point p;
+    for (i = 0; i < n; i++, src += width, dst += width) {
+        if (width == 4) {
+            r = fz_transform_rect(fz_make_rect(src[0], src[1], src[2], src[3]), m);
+            dst[0] = r.x0;
+            dst[1] = r.y0;
+            dst[2] = r.x1;
+            dst[3] = r.y1;
+        } else {
+            p = fz_transform_point(fz_make_point(src[0], src[1]), m);
+            dst[0] = p.x;
+            dst[1] = p.y;
+        }
+    }
+    return rc;
+}
+
+// intersect (union = 0) or join (union = 1) every rectangle with rect
+PyObject *JM_combine_rect_floats(fz_context *ctx, PyObject *data, fz_rect rect, int union_)
+{
+    Py_ssize_t i, n = 0;
+    float *src = JM_floats_from_bytes(ctx, data, 4, &n);
+    PyObject *rc = PyBytes_FromStringAndSize(NULL, n * 4 * sizeof(float));
+    float *dst = (float *) PyBytes_AS_STRING(rc);
+    fz_rect r;
+    for (i = 0; i < n; i++, src += 4, dst += 4) {
+        r = fz_make_rect(src[0], src[1], src[2], src[3]);
+        if (union_)
+            r = fz_union_rect(r, rect);
+        else
+            r = fz_intersect_rect(r, rect);
+        dst[0] = r.x0;
+        dst[1] = r.y0;
+        dst[2] = r.x1;
+        dst[3] = r.y1;
+    }
+    return rc;
+}
+
+// one byte per rectangle: 1 if it contains point p, else 0
+PyObject *JM_rect_floats_contain(fz_context *ctx, PyObject *data, fz_point p)
+{
+    Py_ssize_t i, n = 0;
+    float *src = JM_floats_from_bytes(ctx, data, 4, &n);
+    PyObject *rc = PyBytes_FromStringAndSize(NULL, n);
+    char *dst = PyBytes_AS_STRING(rc);
+    fz_rect r;
+    for (i = 0; i < n; i++, src += 4) {
+        r.x0 = fz_min(src[0], src[2]);
+        r.x1 = fz_max(src[0], src[2]);
+        r.y0 = fz_min(src[1], src[3]);
+        r.y1 = fz_max(src[1], src[3]);
+        dst[i] = (r.x0 <= p.x && p.x <= r.x1 && r.y0 <= p.y && p.y <= r.y1);
+    }
+    return rc;
+}
+
+// one float per rectangle: its area, 0 for empty or infinite rectangles
+PyObject *JM_rect_floats_area(fz_context *ctx, PyObject *data)
+{
+    Py_ssize_t i, n = 0;
+    float *src = JM_floats_from_bytes(ctx, data, 4, &n);
+    PyObject *rc = PyBytes_FromStringAndSize(NULL, n * sizeof(float));
+    float *dst = (float *) PyBytes_AS_STRING(rc);
+    for (i = 0; i < n; i++, src += 4) {
+        if (src[0] >= src[2] || src[1] >= src[3])
+            dst[i] = 0;
+        else
+            dst[i] = (src[2] - src[0]) * (src[3] - src[1]);
+    }
+    return rc;
+}
+
 %}
@@ -7,16 +7,19 @@ class Matrix(object):
     Matrix(degree) - rotate
     Matrix(Matrix) - new copy
     Matrix(sequence) - from 'sequence'"""
+    __slots__ = ("a", "b", "c", "d", "e", "f")
+
     def __init__(self, *args):
-        if not args:
+        n = len(args)
+        if n == 6:  # 6 numbers: most frequent case first
+            self.a, self.b, self.c, self.d, self.e, self.f = map(float, args)
+            return None
+        if not n:
             self.a = self.b = self.c = self.d = self.e = self.f = 0.0
             return None
-        if len(args) > 6:
+        if n > 6:
             raise ValueError("bad sequ. length")
-        if len(args) == 6:  # 6 numbers
-            self.a, self.b, self.c, self.d, self.e, self.f = map(float, args)
-            return None
-        if len(args) == 1:  # either an angle or a sequ
+        if n == 1:  # either an angle or a sequ
             if hasattr(args[0], "__float__"):
                 theta = math.radians(args[0])
                 c = round(math.cos(theta), 8)
@@ -29,11 +32,11 @@ class Matrix(object):
             else:
                 self.a, self.b, self.c, self.d, self.e, self.f = map(float, args[0])
                 return None
-        if len(args) == 2 or len(args) == 3 and args[2] == 0:
+        if n == 2 or n == 3 and args[2] == 0:
             self.a, self.b, self.c, self.d, self.e, self.f = float(args[0]), \
                 0.0, 0.0, float(args[1]), 0.0, 0.0
             return None
-        if len(args) == 3 and args[2] == 1:
+        if n == 3 and args[2] == 1:
             self.a, self.b, self.c, self.d, self.e, self.f = 1.0, \
                 float(args[1]), float(args[0]), 1.0, 0.0, 0.0
             return None
@@ -134,6 +137,9 @@ class Matrix(object):
     def __getitem__(self, i):
         return (self.a, self.b, self.c, self.d, self.e, self.f)[i]
 
+    def __iter__(self):
+        return iter((self.a, self.b, self.c, self.d, self.e, self.f))
+
     def __setitem__(self, i, v):
         v = float(v)
         if   i == 0: self.a = v
@@ -152,6 +158,9 @@ class Matrix(object):
     def __repr__(self):
         return "Matrix" + str(tuple(self))
 
+    def __reduce__(self):  # __slots__ classes need this for pickle protocols < 2
+        return (self.__class__, (tuple(self),))
+
     def __invert__(self):
         """Calculate inverted matrix."""
         m1 = Matrix()
@@ -226,15 +235,17 @@ class Matrix(object):
 
 class IdentityMatrix(Matrix):
     """Identity matrix [1, 0, 0, 1, 0, 0]"""
+    __slots__ = ()
+
     def __init__(self):
         Matrix.__init__(self, 1.0, 1.0)
+
     def __setattr__(self, name, value):
         if name in "ad":
-            self.__dict__[name] = 1.0
+            value = 1.0
         elif name in "bcef":
-            self.__dict__[name] = 0.0
-        else:
-            self.__dict__[name] = value
+            value = 0.0
+        object.__setattr__(self, name, value)
 
     def checkargs(*args):
         raise NotImplementedError("Identity is readonly")
@@ -249,6 +260,9 @@ class IdentityMatrix(Matrix):
     def __repr__(self):
         return "IdentityMatrix(1.0, 0.0, 0.0, 1.0, 0.0, 0.0)"
 
+    def __reduce__(self):
+        return (self.__class__, ())
+
     def __hash__(self):
         return hash((1,0,0,1,0,0))
 
@@ -257,19 +271,22 @@ Identity = IdentityMatrix()
 
 class Point(object):
     """Point() - all zeros\nPoint(x, y)\nPoint(Point) - new copy\nPoint(sequence) - from 'sequence'"""
+    __slots__ = ("x", "y")
+
     def __init__(self, *args):
-        if not args:
+        n = len(args)
+        if n == 2:  # 2 numbers: most frequent case first
+            self.x = float(args[0])
+            self.y = float(args[1])
+            return None
+        if not n:
             self.x = 0.0
             self.y = 0.0
             return None
 
-        if len(args) > 2:
+        if n > 2:
             raise ValueError("bad sequ. length")
-        if len(args) == 2:
-            self.x = float(args[0])
-            self.y = float(args[1])
-            return None
-        if len(args) == 1:
+        if n == 1:
             l = args[0]
             if hasattr(l, "__getitem__") is False:
                 raise ValueError("bad Point constructor")
@@ -358,6 +375,9 @@ class Point(object):
     def __getitem__(self, i):
         return (self.x, self.y)[i]
 
+    def __iter__(self):
+        return iter((self.x, self.y))
+
     def __len__(self):
         return 2
 
@@ -372,6 +392,9 @@ class Point(object):
     def __repr__(self):
         return "Point" + str(tuple(self))
 
+    def __reduce__(self):  # __slots__ classes need this for pickle protocols < 2
+        return (self.__class__, (tuple(self),))
+
     def __pos__(self):
         return Point(self)
 
@@ -430,17 +453,20 @@ class Point(object):
 
 class Rect(object):
     """Rect() - all zeros\nRect(x0, y0, x1, y1)\nRect(top-left, x1, y1)\nRect(x0, y0, bottom-right)\nRect(top-left, bottom-right)\nRect(Rect or IRect) - new copy\nRect(sequence) - from 'sequence'"""
+    __slots__ = ("x0", "y0", "x1", "y1")
+
     def __init__(self, *args):
-        if not args:
+        n = len(args)
+        if n == 4:  # 4 numbers: most frequent case first
+            self.x0, self.y0, self.x1, self.y1 = map(float, args)
+            return None
+        if not n:
             self.x0 = self.y0 = self.x1 = self.y1 = 0.0
             return None
 
-        if len(args) > 4:
+        if n > 4:
             raise ValueError("bad sequ. length")
-        if len(args) == 4:
-            self.x0, self.y0, self.x1, self.y1 = map(float, args)
-            return None
-        if len(args) == 1:
+        if n == 1:
             l = args[0]
             if hasattr(l, "__getitem__") is False:
                 raise ValueError("bad Rect constructor")
@@ -448,13 +474,13 @@ class Rect(object):
                 raise ValueError("bad sequ. length")
             self.x0, self.y0, self.x1, self.y1 = map(float, l)
             return None
-        if len(args) == 2:                  # 2 Points provided
+        if n == 2:                          # 2 Points provided
             self.x0 = float(args[0][0])
             self.y0 = float(args[0][1])
             self.x1 = float(args[1][0])
             self.y1 = float(args[1][1])
             return None
-        if len(args) == 3:                  # 2 floats and 1 Point provided
+        if n == 3:                          # 2 floats and 1 Point provided
             a0 = args[0]
             a1 = args[1]
             a2 = args[2]
@@ -570,6 +596,9 @@ class Rect(object):
     def __getitem__(self, i):
         return (self.x0, self.y0, self.x1, self.y1)[i]
 
+    def __iter__(self):
+        return iter((self.x0, self.y0, self.x1, self.y1))
+
     def __len__(self):
         return 4
 
@@ -586,6 +615,9 @@ class Rect(object):
     def __repr__(self):
         return "Rect" + str(tuple(self))
 
+    def __reduce__(self):  # __slots__ classes need this for pickle protocols < 2
+        return (self.__class__, (tuple(self),))
+
     def __pos__(self):
         return Rect(self)
 
@@ -700,6 +732,8 @@ class Rect(object):
 
 class IRect(Rect):
     """IRect() - all zeros\nIRect(x0, y0, x1, y1)\nIRect(Rect or IRect) - new copy\nIRect(sequence) - from 'sequence'"""
+    __slots__ = ()
+
     def __init__(self, *args):
         Rect.__init__(self, *args)
         self.x0 = math.floor(self.x0 + 0.001)
@@ -772,17 +806,20 @@ class IRect(Rect):
 
 class Quad(object):
     """Quad() - all zero points\nQuad(ul, ur, ll, lr)\nQuad(quad) - new copy\nQuad(sequence) - from 'sequence'"""
+    __slots__ = ("ul", "ur", "ll", "lr")
+
     def __init__(self, *args):
-        if not args:
+        n = len(args)
+        if n == 4:  # 4 points: most frequent case first
+            self.ul, self.ur, self.ll, self.lr = map(Point, args)
+            return None
+        if not n:
             self.ul = self.ur = self.ll = self.lr = Point()
             return None
 
-        if len(args) > 4:
+        if n > 4:
             raise ValueError("bad sequ. length")
-        if len(args) == 4:
-            self.ul, self.ur, self.ll, self.lr = map(Point, args)
-            return None
-        if len(args) == 1:
+        if n == 1:
             l = args[0]
             if hasattr(l, "__getitem__") is False:
                 raise ValueError("bad Quad constructor")
@@ -896,6 +933,9 @@ class Quad(object):
     def __getitem__(self, i):
         return (self.ul, self.ur, self.ll, self.lr)[i]
 
+    def __iter__(self):
+        return iter((self.ul, self.ur, self.ll, self.lr))
+
     def __len__(self):
         return 4
 
@@ -911,6 +951,9 @@ class Quad(object):
     def __repr__(self):
         return "Quad" + str(tuple(self))
 
+    def __reduce__(self):  # __slots__ classes need this for pickle protocols < 2
+        return (self.__class__, (tuple(self),))
+
     def __pos__(self):
         return Quad(self)
 
@@ -980,4 +1023,250 @@ class Quad(object):
     def __hash__(self):
         return hash(tuple(self))
 
+
+class _GeoArray(object):
+    """Base class of arrays of rectangles, points or quads.
+
+    Items are stored in 'data', an array.array of 32-bit floats with a fixed
+    number of values per item. It supports the buffer protocol, e.g.
+    numpy.frombuffer(a.data, numpy.float32).reshape(-1, width).
+    """
+    __slots__ = ("data",)
+    _width = 0
+
+    def __init__(self, items=None):
+        self.data = array.array("f")
+        if items is None:
+            return None
+        if isinstance(items, type(self)):
+            self.data.extend(items.data)
+            return None
+        self.extend(items)
+
+    @classmethod
+    def from_floats(cls, data):
+        """Make an array from a flat sequence of floats or a float32 buffer."""
+        a = cls()
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            a.data = _floats_from_bytes(bytes(data))
+        else:
+            a.data = array.array("f", data)
+        if len(a.data) % cls._width:
+            raise ValueError("bad sequ. length")
+        return a
+
+    def _make(self, data):
+        a = self.__class__()
+        a.data = _floats_from_bytes(data)
+        return a
+
+    def tobytes(self):
+        """Return the float32 values as bytes."""
+        return _floats_to_bytes(self.data)
+
+    def append(self, item):
+        """Append one item."""
+        self.data.extend(self._floats(item))
+
+    def extend(self, items):
+        """Append a sequence of items."""
+        f = self._floats
+        d = self.data
+        for item in items:
+            d.extend(f(item))
+
+    def transform(self, m):
+        """Replace all items by their transformation with matrix-like m."""
+        if len(m) != 6:
+            raise ValueError("bad sequ. length")
+        w = self._width if self._width == 4 else 2
+        self.data = _floats_from_bytes(TOOLS._transform_floats(self.tobytes(), w, m))
+        return self
+
+    def __mul__(self, m):
+        return self.__class__(self).transform(m)
+
+    def __len__(self):
+        return len(self.data) // self._width
+
+    def __getitem__(self, i):
+        n = len(self)
+        if isinstance(i, slice):
+            a = self.__class__()
+            w = self._width
+            for j in range(*i.indices(n)):
+                a.data.extend(self.data[j * w : (j + 1) * w])
+            return a
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("index out of range")
+        return self._item(i * self._width)
+
+    def __setitem__(self, i, v):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("index out of range")
+        w = self._width
+        self.data[i * w : (i + 1) * w] = array.array("f", self._floats(v))
+
+    def __iter__(self):
+        w = self._width
+        for j in range(0, len(self.data), w):
+            yield self._item(j)
+
+    def __repr__(self):
+        return "%s(%i items)" % (self.__class__.__name__, len(self))
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+
+class RectArray(_GeoArray):
+    """RectArray() - empty\nRectArray(sequence) - from rect-likes\nRectArray(RectArray) - new copy"""
+    __slots__ = ()
+    _width = 4
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Make an array from the "bbox" column of TextPage.extract_words_arrays."""
+        return cls.from_floats(columns["bbox"])
+
+    def _floats(self, r):
+        if len(r) != 4:
+            raise ValueError("bad sequ. length")
+        return [float(c) for c in r]
+
+    def _item(self, j):
+        d = self.data
+        return Rect(d[j], d[j + 1], d[j + 2], d[j + 3])
+
+    def intersect(self, r):
+        """Restrict all rectangles to their common rect with rect-like r."""
+        if len(r) != 4:
+            raise ValueError("bad sequ. length")
+        self.data = _floats_from_bytes(TOOLS._combine_rect_floats(self.tobytes(), r, 0))
+        return self
+
+    def includeRect(self, r):
+        """Extend all rectangles to include rect-like r."""
+        if len(r) != 4:
+            raise ValueError("bad sequ. length")
+        self.data = _floats_from_bytes(TOOLS._combine_rect_floats(self.tobytes(), r, 1))
+        return self
+
+    def __and__(self, r):
+        return RectArray(self).intersect(r)
+
+    def __or__(self, r):
+        return RectArray(self).includeRect(r)
+
+    def contains(self, p):
+        """Check which rectangles contain point-like p.
+
+        Returns:
+            array.array of unsigned bytes, 1 for every containing rectangle.
+        """
+        if len(p) != 2:
+            raise ValueError("bad sequ. length")
+        rc = array.array("B")
+        data = TOOLS._rect_floats_contain(self.tobytes(), p)
+        if fitz_py2:
+            rc.fromstring(data)
+        else:
+            rc.frombytes(data)
+        return rc
+
+    def area(self):
+        """Return a float32 array of the rectangle areas."""
+        return _floats_from_bytes(TOOLS._rect_floats_area(self.tobytes()))
+
+    @property
+    def quads(self):
+        """Return the QuadArray of the rectangles."""
+        q = QuadArray()
+        d = self.data
+        for j in range(0, len(d), 4):
+            x0, y0, x1, y1 = d[j : j + 4]
+            q.data.extend((x0, y0, x1, y0, x0, y1, x1, y1))
+        return q
+
+
+class PointArray(_GeoArray):
+    """PointArray() - empty\nPointArray(sequence) - from point-likes\nPointArray(PointArray) - new copy"""
+    __slots__ = ()
+    _width = 2
+
+    def _floats(self, p):
+        if len(p) != 2:
+            raise ValueError("bad sequ. length")
+        return [float(p[0]), float(p[1])]
+
+    def _item(self, j):
+        return Point(self.data[j], self.data[j + 1])
+
+    def inside(self, r):
+        """Check which points are contained in rect-like r.
+
+        Returns:
+            array.array of unsigned bytes, 1 for every contained point.
+        """
+        r = Rect(r).normalize()
+        d = self.data
+        rc = array.array("B")
+        for j in range(0, len(d), 2):
+            rc.append(r.x0 <= d[j] <= r.x1 and r.y0 <= d[j + 1] <= r.y1)
+        return rc
+
+
+class QuadArray(_GeoArray):
+    """QuadArray() - empty\nQuadArray(sequence) - from quad-likes\nQuadArray(QuadArray) - new copy"""
+    __slots__ = ()
+    _width = 8
+
+    def _floats(self, q):
+        if len(q) != 4:
+            raise ValueError("bad sequ. length")
+        if hasattr(q[0], "__float__"):  # a rect-like
+            q = Rect(q).quad
+        f = []
+        for p in q:
+            if len(p) != 2:
+                raise ValueError("bad sequ. length")
+            f.extend((float(p[0]), float(p[1])))
+        return f
+
+    def _item(self, j):
+        d = self.data
+        return Quad(Point(d[j], d[j + 1]), Point(d[j + 2], d[j + 3]),
+                    Point(d[j + 4], d[j + 5]), Point(d[j + 6], d[j + 7]))
+
+    @property
+    def rects(self):
+        """Return the RectArray of the quads' envelopping rectangles."""
+        r = RectArray()
+        d = self.data
+        for j in range(0, len(d), 8):
+            x = d[j : j + 8 : 2]
+            y = d[j + 1 : j + 8 : 2]
+            r.data.extend((min(x), min(y), max(x), max(y)))
+        return r
+
+
+def _floats_from_bytes(data):
+    a = array.array("f")
+    if fitz_py2:
+        a.fromstring(data)
+    else:
+        a.frombytes(data)
+    return a
+
+
+def _floats_to_bytes(a):
+    if fitz_py2:
+        return a.tostring()
+    return a.tobytes()
+
 %}
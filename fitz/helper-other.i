@@ -25,6 +25,37 @@ int DICT_SETITEMSTR_DROP(PyObject *dict, const char *key, PyObject *value)
 }
 
 
+//-----------------------------------------------------------------------------
+// fz_output writing to a Python file object via its method 'write(bytes)'
+//-----------------------------------------------------------------------------
+static void
+JM_pyfile_write(fz_context *ctx, void *opaque, const void *data, size_t len)
+{
+    PyObject *b = PyBytes_FromStringAndSize((const char *) data, (Py_ssize_t) len);
+    PyObject *rc = NULL;
+    if (b) rc = PyObject_CallMethod((PyObject *) opaque, "write", "O", b);
+    Py_XDECREF(b);
+    if (!rc) {
+        PyErr_Clear();
+        fz_throw(ctx, FZ_ERROR_GENERIC, "cannot write to file object");
+    }
+    Py_DECREF(rc);
+}
+
+static void
+JM_pyfile_drop(fz_context *ctx, void *opaque)
+{
+    Py_XDECREF((PyObject *) opaque);
+}
+
+fz_output *JM_new_output_pyfile(fz_context *ctx, PyObject *fileobj)
+{
+    fz_output *out = fz_new_output(ctx, 8192, fileobj, JM_pyfile_write, NULL, JM_pyfile_drop);
+    Py_INCREF(fileobj);
+    return out;
+}
+
+
 PyObject *JM_EscapeStrFromBuffer(fz_context *ctx, fz_buffer *buff)
 {
     if (!buff) return PyUnicode_FromString("");
@@ -673,6 +704,27 @@ char *JM_get_fontextension(fz_context *ctx, pdf_document *doc, int xref)
     return "n/a";
 }
 
+//-----------------------------------------------------------------------------
+// Return the file extension of a font as a Python string. If 'cache' is a
+// dict {xref: ext}, it is used for look-up and updated on cache misses.
+//-----------------------------------------------------------------------------
+PyObject *JM_get_fontextension_cached(fz_context *ctx, pdf_document *doc,
+                                      int xref, PyObject *cache)
+{
+    PyObject *key, *ext;
+    if (xref < 1 || !cache || !PyDict_Check(cache))
+        return JM_UnicodeFromStr(JM_get_fontextension(ctx, doc, xref));
+    key = Py_BuildValue("i", xref);
+    ext = PyDict_GetItem(cache, key);
+    if (ext) {
+        Py_INCREF(ext);
+    } else {
+        ext = JM_UnicodeFromStr(JM_get_fontextension(ctx, doc, xref));
+        PyDict_SetItem(cache, key, ext);
+    }
+    Py_DECREF(key);
+    return ext;
+}
 
 //-----------------------------------------------------------------------------
 // create PDF object from given string (new in v1.14.0: MuPDF dropped it)
@@ -865,4 +917,363 @@ struct fz_store
 };
 
 
+//-----------------------------------------------------------------------------
+// Base-14 fonts used by Tools._measure_string, made once per fontname.
+// The fonts are kept for the lifetime of the process.
+//-----------------------------------------------------------------------------
+static struct
+{
+    char name[32];
+    fz_font *font;
+} JM_base14_fonts[14];
+static int JM_base14_fonts_len = 0;
+
+fz_font *JM_base14_font(fz_context *ctx, const char *fontname)
+{
+    fz_font *font;
+    int i;
+    for (i = 0; i < JM_base14_fonts_len; i++) {
+        if (strcmp(JM_base14_fonts[i].name, fontname) == 0) {
+            return JM_base14_fonts[i].font;
+        }
+    }
+    font = fz_new_base14_font(ctx, fontname);
+    if (JM_base14_fonts_len < 14 && strlen(fontname) < 32) {
+        fz_strlcpy(JM_base14_fonts[JM_base14_fonts_len].name, fontname, 32);
+        JM_base14_fonts[JM_base14_fonts_len].font = font;
+        JM_base14_fonts_len++;
+    }
+    return font;
+}
+
+
+//-----------------------------------------------------------------------------
+// Text layout for Shape.insertTextbox.
+// 'lines' is a sequence of text lines. 'gids' and 'widths' are bytes with the
+// glyph ids (int) and widths (float) of Document.getCharWidths, indexed by
+// character code, or None. Without widths, every character has width 1 (CJK
+// fonts). 'tjmode' is the format of the TJ operands as in getTJstr:
+// 0 = 2 hex digits per character code, 1 = 2 hex digits per glyph id,
+// 2 = 4 hex digits per glyph id, 3 = 4 hex digits per character code.
+// Words are separated by single spaces. Words not fitting in the remaining
+// line width start a new line, words longer than 'maxwidth' are broken up
+// between characters. Only lines ended by a word wrap are justified.
+// 'pos' is the position of the first line, 'step' the distance to the next
+// line and 'maxpos' the limit for the last line, all in direction 'progr'.
+// Returns (more, lines). If the last line exceeds 'maxpos' by more than
+// EPSILON, 'more' is the negative excess and 'lines' is None. Otherwise
+// 'more' is the unused space and 'lines' is a list of tuples
+// (tj, shift, spacing) per output line: the TJ operand, the shift of the
+// line start for 'align' and the word spacing for justified text.
+//-----------------------------------------------------------------------------
+typedef struct
+{
+    int *c;
+    int len;
+    int cap;
+} JM_runes;
+
+typedef struct
+{
+    int start;  // index of first character in the rune buffer
+    int len;  // number of characters
+    double width;  // line width
+    int justify;  // line ended by a word wrap
+} JM_textbox_line;
+
+typedef struct
+{
+    JM_textbox_line *l;
+    int len;
+    int cap;
+} JM_textbox_lines;
+
+static void
+JM_runes_add(fz_context *ctx, JM_runes *r, int c)
+{
+    if (r->len == r->cap) {
+        int cap = r->cap ? 2 * r->cap : 256;
+        r->c = fz_realloc(ctx, r->c, cap * sizeof(int));
+        r->cap = cap;
+    }
+    r->c[r->len++] = c;
+}
+
+static double
+JM_rune_width(int c, float *widths, int n)
+{
+    if (!widths) return 1;
+    if (c < 0 || c >= n) return 0;
+    return widths[c];
+}
+
+// end the line starting at index 'start' of the rune buffer
+static void
+JM_end_textbox_line(fz_context *ctx, JM_textbox_lines *lines, JM_runes *out,
+                    int start, int rstrip, int justify, float *widths,
+                    int nwidths, double fontsize)
+{
+    int i, n = out->len - start;
+    double w = 0;
+    if (rstrip) {
+        while (n > 0 && Py_UNICODE_ISSPACE(out->c[start + n - 1])) n--;
+    }
+    for (i = start; i < start + n; i++) {
+        w += JM_rune_width(out->c[i], widths, nwidths);
+    }
+    if (lines->len == lines->cap) {
+        int cap = lines->cap ? 2 * lines->cap : 64;
+        lines->l = fz_realloc(ctx, lines->l, cap * sizeof(JM_textbox_line));
+        lines->cap = cap;
+    }
+    lines->l[lines->len].start = start;
+    lines->l[lines->len].len = n;
+    lines->l[lines->len].width = w * fontsize;
+    lines->l[lines->len].justify = justify;
+    lines->len++;
+}
+
+// write at least 'digits' lower case hex digits
+static char *
+JM_put_hex(char *p, unsigned int v, int digits)
+{
+    static const char hex[] = "0123456789abcdef";
+    char tmp[8];
+    int n = 0;
+    do {
+        tmp[n++] = hex[v & 15];
+        v >>= 4;
+    } while (v);
+    while (n < digits) tmp[n++] = '0';
+    while (n > 0) *p++ = tmp[--n];
+    return p;
+}
+
+// TJ operand of a line, see getTJstr
+static PyObject *
+JM_textbox_tj(fz_context *ctx, int *c, int n, int tjmode, int *gids, int ngids)
+{
+    PyObject *rc = NULL;
+    char *buf = NULL, *p;
+    int i, v;
+    fz_var(buf);
+    fz_try(ctx) {
+        buf = p = fz_malloc(ctx, (size_t) n * (FZ_UTFMAX + 8) + 5);
+        if (n >= 4 && c[0] == '[' && c[1] == '<' &&
+            c[n - 2] == '>' && c[n - 1] == ']') {  // already done
+            for (i = 0; i < n; i++) p += fz_runetochar(p, c[i]);
+        } else {
+            *p++ = '[';
+            *p++ = '<';
+            for (i = 0; i < n; i++) {
+                v = c[i];
+                if (tjmode == 1 || tjmode == 2) {
+                    v = (v >= 0 && v < ngids) ? gids[v] : 0;
+                }
+                if (tjmode >= 2) {
+                    p = JM_put_hex(p, (unsigned int) v, 4);
+                } else if (c[i] < 256) {
+                    p = JM_put_hex(p, (unsigned int) v, 2);
+                } else {
+                    *p++ = 'b';
+                    *p++ = '7';
+                }
+            }
+            *p++ = '>';
+            *p++ = ']';
+        }
+        rc = PyUnicode_DecodeUTF8(buf, (Py_ssize_t) (p - buf), "replace");
+    }
+    fz_always(ctx) {
+        fz_free(ctx, buf);
+    }
+    fz_catch(ctx) {
+        fz_rethrow(ctx);
+    }
+    return rc;
+}
+
+PyObject *
+JM_layout_textbox(fz_context *ctx, PyObject *lines, PyObject *gids,
+                  PyObject *widths, int tjmode, double fontsize,
+                  double maxwidth, int align, double pos, double maxpos,
+                  double step, int progr)
+{
+    PyObject *seq = NULL, *rc = NULL, *list = NULL, *b = NULL, *item;
+    Py_buffer gview, wview;
+    int have_gview = 0, have_wview = 0;
+    JM_runes text = {NULL, 0, 0}, out = {NULL, 0, 0};
+    JM_textbox_lines tl = {NULL, 0, 0};
+    JM_textbox_line *line;
+    float *w = NULL;
+    int *g = NULL;
+    double blen, rest, pl_w, lbw, cw, more, pl, shift, spacing;
+    int nwidths = 0, ngids = 0, i, j, ws, we, c, ls, n, spaces;
+    int last_justify = -1;
+    Py_ssize_t k, nlines, len;
+    char *s, *end;
+    fz_var(seq);
+    fz_var(rc);
+    fz_var(list);
+    fz_var(b);
+    fz_var(gview);
+    fz_var(wview);
+    fz_var(have_gview);
+    fz_var(have_wview);
+    fz_var(text);
+    fz_var(out);
+    fz_var(tl);
+    fz_try(ctx) {
+        if (widths != Py_None) {
+            if (PyObject_GetBuffer(widths, &wview, PyBUF_SIMPLE) < 0) {
+                PyErr_Clear();
+                THROWMSG("bad glyph widths");
+            }
+            have_wview = 1;
+            w = (float *) wview.buf;
+            nwidths = (int) (wview.len / sizeof(float));
+            if (nwidths < 33) THROWMSG("bad glyph widths");
+        }
+        if (gids != Py_None) {
+            if (PyObject_GetBuffer(gids, &gview, PyBUF_SIMPLE) < 0) {
+                PyErr_Clear();
+                THROWMSG("bad glyph ids");
+            }
+            have_gview = 1;
+            g = (int *) gview.buf;
+            ngids = (int) (gview.len / sizeof(int));
+        }
+        if ((tjmode == 1 || tjmode == 2) && !g) THROWMSG("need glyph ids");
+        blen = JM_rune_width(32, w, nwidths) * fontsize;
+        seq = PySequence_Fast(lines, "");
+        if (!seq) {
+            PyErr_Clear();
+            THROWMSG("lines must be a sequence");
+        }
+        nlines = PySequence_Fast_GET_SIZE(seq);
+        for (k = 0; k < nlines; k++) {
+            item = PySequence_Fast_GET_ITEM(seq, k);
+            text.len = 0;
+#if PY_VERSION_HEX < 0x03000000
+            if (PyString_Check(item)) {  // every byte is a character code
+                PyString_AsStringAndSize(item, &s, &len);
+                for (end = s + len; s < end; s++) {
+                    JM_runes_add(ctx, &text, (unsigned char) *s);
+                }
+            } else
+#endif
+            {
+                b = PyUnicode_AsUTF8String(item);
+                if (!b || PyBytes_AsStringAndSize(b, &s, &len) < 0) {
+                    PyErr_Clear();
+                    THROWMSG("lines must be strings");
+                }
+                for (end = s + len; s < end; ) {
+                    s += fz_chartorune(&c, s);
+                    JM_runes_add(ctx, &text, c);
+                }
+                Py_CLEAR(b);
+            }
+            ls = out.len;  // current line is out.c[ls:]
+            rest = maxwidth;
+            for (ws = 0; ws <= text.len; ws = we + 1) {
+                we = ws;  // word is text.c[ws:we]
+                pl_w = 0;
+                while (we < text.len && text.c[we] != 32) {
+                    pl_w += JM_rune_width(text.c[we], w, nwidths);
+                    we++;
+                }
+                pl_w *= fontsize;
+                if (rest >= pl_w) {  // word fits on the line
+                    for (j = ws; j < we; j++) JM_runes_add(ctx, &out, text.c[j]);
+                    JM_runes_add(ctx, &out, 32);
+                    rest -= pl_w + blen;
+                    continue;
+                }
+                if (out.len > ls) {  // line full: end it
+                    JM_end_textbox_line(ctx, &tl, &out, ls, 1, 1, w, nwidths, fontsize);
+                    last_justify = tl.len - 1;
+                    ls = out.len;
+                }
+                rest = maxwidth;
+                if (pl_w <= maxwidth) {  // start the new line with the word
+                    for (j = ws; j < we; j++) JM_runes_add(ctx, &out, text.c[j]);
+                    JM_runes_add(ctx, &out, 32);
+                    rest = maxwidth - pl_w - blen;
+                    continue;
+                }
+                // long word: split across lines between characters
+                if (last_justify >= 0 && last_justify == tl.len - 1) {
+                    tl.l[last_justify].justify = 0;
+                }
+                lbw = 0;
+                for (j = ws; j < we; j++) {
+                    cw = JM_rune_width(text.c[j], w, nwidths);
+                    if (lbw * fontsize <= maxwidth - cw * fontsize) {
+                        JM_runes_add(ctx, &out, text.c[j]);
+                        lbw += cw;
+                    } else {  // line full
+                        JM_end_textbox_line(ctx, &tl, &out, ls, 0, 0, w, nwidths, fontsize);
+                        ls = out.len;
+                        JM_runes_add(ctx, &out, text.c[j]);
+                        lbw = cw;
+                    }
+                }
+                JM_runes_add(ctx, &out, 32);
+                rest = maxwidth - (lbw + JM_rune_width(32, w, nwidths)) * fontsize;
+            }
+            // unprocessed line content
+            JM_end_textbox_line(ctx, &tl, &out, ls, 1, 0, w, nwidths, fontsize);
+        }
+
+        // check if the last line stays inside the limit
+        n = tl.len;
+        more = (pos + step * (n - 1) - maxpos) * progr;
+        if (more > EPSILON) {  // too much outside: no output
+            rc = Py_BuildValue("dO", -more, Py_None);
+        } else {
+            if (more < 0) more = -more;
+            if (more < EPSILON) more = 0;
+            if (n > 0 && tl.l[n - 1].len == 0) n--;  // no trailing empty line
+            list = PyList_New(0);
+            for (i = 0; i < n; i++) {
+                line = &tl.l[i];
+                pl = maxwidth - line->width;  // length of empty line part
+                shift = spacing = 0;
+                if (align == 1) {  // center
+                    shift = pl / 2;
+                } else if (align == 2) {  // right
+                    shift = pl;
+                } else if (align == 3 && line->justify) {
+                    spaces = 0;
+                    for (j = line->start; j < line->start + line->len; j++) {
+                        if (out.c[j] == 32) spaces++;
+                    }
+                    if (spaces > 0) spacing = pl / spaces;
+                }
+                LIST_APPEND_DROP(list, Py_BuildValue("Ndd",
+                        JM_textbox_tj(ctx, out.c + line->start, line->len,
+                                      tjmode, g, ngids),
+                        shift, spacing));
+            }
+            rc = Py_BuildValue("dO", more, list);
+        }
+    }
+    fz_always(ctx) {
+        Py_CLEAR(seq);
+        Py_CLEAR(b);
+        Py_CLEAR(list);
+        if (have_wview) PyBuffer_Release(&wview);
+        if (have_gview) PyBuffer_Release(&gview);
+        fz_free(ctx, text.c);
+        fz_free(ctx, out.c);
+        fz_free(ctx, tl.l);
+    }
+    fz_catch(ctx) {
+        Py_CLEAR(rc);
+        fz_rethrow(ctx);
+    }
+    return rc;
+}
+
 %}
@@ -2,9 +2,10 @@
 
 //-----------------------------------------------------------------------------
 // Store info of a font in Python list
+// Font file extensions are taken from dict 'fontext' if provided.
 //-----------------------------------------------------------------------------
 void JM_gather_fonts(fz_context *ctx, pdf_document *pdf, pdf_obj *dict,
-                    PyObject *fontlist, int stream_xref)
+                    PyObject *fontlist, int stream_xref, PyObject *fontext)
 {
     int i, n;
     n = pdf_dict_len(ctx, dict);
@@ -34,11 +35,9 @@ void JM_gather_fonts(fz_context *ctx, pdf_document *pdf, pdf_obj *dict,
         if (pdf_is_dict(ctx, encoding))
             encoding = pdf_dict_get(ctx, encoding, PDF_NAME(BaseEncoding));
         int xref = pdf_to_num(ctx, fontdict);
-        char *ext = "n/a";
-        if (xref) ext = JM_get_fontextension(ctx, pdf, xref);
         PyObject *entry = PyTuple_New(7);
         PyTuple_SET_ITEM(entry, 0, Py_BuildValue("i", xref));
-        PyTuple_SET_ITEM(entry, 1, Py_BuildValue("s", ext));
+        PyTuple_SET_ITEM(entry, 1, JM_get_fontextension_cached(ctx, pdf, xref, fontext));
         PyTuple_SET_ITEM(entry, 2, Py_BuildValue("s", pdf_to_name(ctx, subtype)));
         PyTuple_SET_ITEM(entry, 3, JM_EscapeStrFromStr(pdf_to_name(ctx, name)));
         PyTuple_SET_ITEM(entry, 4, Py_BuildValue("s", pdf_to_name(ctx, refname)));
@@ -176,7 +175,7 @@ void JM_gather_forms(fz_context *ctx, pdf_document *doc, pdf_obj *dict,
 // Step through /Resources, looking up image, xobject or font information
 //-----------------------------------------------------------------------------
 void JM_scan_resources(fz_context *ctx, pdf_document *pdf, pdf_obj *rsrc,
-                 PyObject *liste, int what, int stream_xref)
+                 PyObject *liste, int what, int stream_xref, PyObject *fontext)
 {
     pdf_obj *font, *xobj, *subrsrc;
     int i, n, sxref;
@@ -184,7 +183,7 @@ void JM_scan_resources(fz_context *ctx, pdf_document *pdf, pdf_obj *rsrc,
     fz_try(ctx) {
         if (what == 1) {
             font = pdf_dict_get(ctx, rsrc, PDF_NAME(Font));
-            JM_gather_fonts(ctx, pdf, font, liste, stream_xref);
+            JM_gather_fonts(ctx, pdf, font, liste, stream_xref, fontext);
             n = pdf_dict_len(ctx, font);
             for (i = 0; i < n; i++) {
                 pdf_obj *obj = pdf_dict_get_val(ctx, font, i);
@@ -196,7 +195,7 @@ void JM_scan_resources(fz_context *ctx, pdf_document *pdf, pdf_obj *rsrc,
                 }
                 subrsrc = pdf_dict_get(ctx, obj, PDF_NAME(Resources));
                 if (subrsrc)
-                    JM_scan_resources(ctx, pdf, subrsrc, liste, what, sxref);
+                    JM_scan_resources(ctx, pdf, subrsrc, liste, what, sxref, fontext);
             }
         }
 
@@ -221,11 +220,453 @@ void JM_scan_resources(fz_context *ctx, pdf_document *pdf, pdf_obj *rsrc,
             }
             subrsrc = pdf_dict_get(ctx, obj, PDF_NAME(Resources));
             if (subrsrc)
-                JM_scan_resources(ctx, pdf, subrsrc, liste, what, sxref);
+                JM_scan_resources(ctx, pdf, subrsrc, liste, what, sxref, fontext);
         }
     }
     fz_always(ctx) pdf_unmark_obj(ctx, rsrc);
     fz_catch(ctx)  fz_rethrow(ctx);
 }
 
+//-----------------------------------------------------------------------------
+// Resource inventory: collect the xrefs of fonts, images and form xobjects
+// of a /Resources dictionary (including those of nested resources) into a
+// tuple of 3 sets. Entries of newly found xrefs are stored in the 3 dicts
+// of 'tables'. Results of indirect /Resources are memorized in 'memo'
+// under their xref, so shared resources are scanned only once.
+//-----------------------------------------------------------------------------
+PyObject *JM_resource_inventory(fz_context *ctx, pdf_document *pdf,
+                                pdf_obj *rsrc, PyObject *memo,
+                                PyObject *tables[3], int stream_xref,
+                                PyObject *fontext)
+{
+    PyObject *result = NULL, *liste = NULL, *sub = NULL, *key = NULL;
+    pdf_obj *font, *xobj, *dict, *obj, *subrsrc;
+    Py_ssize_t j;
+    int i, k, n, sxref, rxref = pdf_to_num(ctx, rsrc);
+    if (rxref) {
+        key = Py_BuildValue("i", rxref);
+        result = PyDict_GetItem(memo, key);
+        if (result) {
+            Py_DECREF(key);
+            Py_INCREF(result);
+            return result;
+        }
+    }
+    result = Py_BuildValue("NNN", PySet_New(NULL), PySet_New(NULL), PySet_New(NULL));
+    if (pdf_mark_obj(ctx, rsrc)) {  // stop on cyclic dependencies
+        Py_XDECREF(key);
+        return result;
+    }
+    fz_var(liste);
+    fz_var(sub);
+    fz_try(ctx) {
+        font = pdf_dict_get(ctx, rsrc, PDF_NAME(Font));
+        xobj = pdf_dict_get(ctx, rsrc, PDF_NAME(XObject));
+        for (k = 0; k < 3; k++) {
+            liste = PyList_New(0);
+            if (k == 0)
+                JM_gather_fonts(ctx, pdf, font, liste, stream_xref, fontext);
+            else if (k == 1)
+                JM_gather_images(ctx, pdf, xobj, liste, stream_xref);
+            else
+                JM_gather_forms(ctx, pdf, xobj, liste, stream_xref);
+            for (j = 0; j < PyList_GET_SIZE(liste); j++) {
+                PyObject *item = PyList_GET_ITEM(liste, j);
+                PyObject *xref = PyTuple_GET_ITEM(item, 0);
+                PySet_Add(PyTuple_GET_ITEM(result, k), xref);
+                if (PyLong_AsLong(xref) > 0 && !PyDict_GetItem(tables[k], xref))
+                    PyDict_SetItem(tables[k], xref, item);
+            }
+            Py_CLEAR(liste);
+        }
+
+        // scan resources of Type3 fonts and form xobjects
+        for (k = 0; k < 2; k++) {
+            dict = k ? xobj : font;
+            n = pdf_dict_len(ctx, dict);
+            for (i = 0; i < n; i++) {
+                obj = pdf_dict_get_val(ctx, dict, i);
+                subrsrc = pdf_dict_get(ctx, obj, PDF_NAME(Resources));
+                if (!subrsrc) continue;
+                sxref = pdf_is_stream(ctx, obj) ? pdf_to_num(ctx, obj) : 0;
+                sub = JM_resource_inventory(ctx, pdf, subrsrc, memo, tables, sxref, fontext);
+                for (j = 0; j < 3; j++) {  // in-place union of sets
+                    Py_XDECREF(PyNumber_InPlaceOr(PyTuple_GET_ITEM(result, j),
+                                                  PyTuple_GET_ITEM(sub, j)));
+                }
+                Py_CLEAR(sub);
+            }
+        }
+    }
+    fz_always(ctx) {
+        pdf_unmark_obj(ctx, rsrc);
+    }
+    fz_catch(ctx) {
+        Py_CLEAR(liste);
+        Py_CLEAR(sub);
+        Py_CLEAR(result);
+        Py_CLEAR(key);
+        fz_rethrow(ctx);
+    }
+    if (key) {
+        PyDict_SetItem(memo, key, result);
+        Py_DECREF(key);
+    }
+    return result;
+}
+
+//-----------------------------------------------------------------------------
+// Replace indirect references in a dict or array according to 'map'.
+// Entries of 'map' point to the xref to be used instead.
+//-----------------------------------------------------------------------------
+void JM_renumber_refs(fz_context *ctx, pdf_document *pdf, pdf_obj *obj,
+                      int *map, int xreflen)
+{
+    int i, n, num;
+    pdf_obj *val;
+    if (pdf_is_indirect(ctx, obj)) return;
+    if (pdf_is_dict(ctx, obj)) {
+        n = pdf_dict_len(ctx, obj);
+        for (i = 0; i < n; i++) {
+            val = pdf_dict_get_val(ctx, obj, i);
+            if (pdf_is_indirect(ctx, val)) {
+                num = pdf_to_num(ctx, val);
+                if (num > 0 && num < xreflen && map[num] != num)
+                    pdf_dict_put_drop(ctx, obj, pdf_dict_get_key(ctx, obj, i),
+                                      pdf_new_indirect(ctx, pdf, map[num], 0));
+            }
+            else {
+                JM_renumber_refs(ctx, pdf, val, map, xreflen);
+            }
+        }
+    }
+    else if (pdf_is_array(ctx, obj)) {
+        n = pdf_array_len(ctx, obj);
+        for (i = 0; i < n; i++) {
+            val = pdf_array_get(ctx, obj, i);
+            if (pdf_is_indirect(ctx, val)) {
+                num = pdf_to_num(ctx, val);
+                if (num > 0 && num < xreflen && map[num] != num)
+                    pdf_array_put_drop(ctx, obj, i,
+                                       pdf_new_indirect(ctx, pdf, map[num], 0));
+            }
+            else {
+                JM_renumber_refs(ctx, pdf, val, map, xreflen);
+            }
+        }
+    }
+}
+
+//-----------------------------------------------------------------------------
+// Compute the MD5 of an object's source and (raw) stream.
+// Returns 0 if xref is no candidate for deduplication. Like MuPDF, we never
+// merge pages: identical pages must remain separate objects. Page tree
+// nodes are skipped for the same reason.
+//-----------------------------------------------------------------------------
+int JM_object_digest(fz_context *ctx, pdf_document *pdf, int xref,
+                     int streams, unsigned char digest[16])
+{
+    pdf_xref_entry *entry = pdf_get_xref_entry(ctx, pdf, xref);
+    pdf_obj *obj = NULL, *type;
+    fz_buffer *res = NULL, *stream = NULL;
+    unsigned char *data;
+    size_t len;
+    fz_md5 state;
+    int rc = 0, is_stream = 0;
+    if (!entry || (entry->type != 'n' && entry->type != 'o'))
+        return 0;
+    fz_var(obj);
+    fz_var(res);
+    fz_var(stream);
+    fz_try(ctx) {
+        obj = pdf_load_object(ctx, pdf, xref);
+        if (pdf_is_dict(ctx, obj)) {
+            type = pdf_dict_get(ctx, obj, PDF_NAME(Type));
+            if (pdf_name_eq(ctx, type, PDF_NAME(Page)) ||
+                pdf_name_eq(ctx, type, PDF_NAME(Pages))) {
+                pdf_drop_obj(ctx, obj);
+                obj = NULL;
+            }
+        }
+        if (obj && !pdf_is_null(ctx, obj)) {
+            is_stream = pdf_obj_num_is_stream(ctx, pdf, xref);
+        }
+        if (obj && !pdf_is_null(ctx, obj) && (streams || !is_stream)) {
+            fz_md5_init(&state);
+            res = JM_object_to_buffer(ctx, obj, 1, 0);
+            len = fz_buffer_storage(ctx, res, &data);
+            fz_md5_update(&state, data, len);
+            if (is_stream) {
+                stream = pdf_load_raw_stream_number(ctx, pdf, xref);
+                len = fz_buffer_storage(ctx, stream, &data);
+                fz_md5_update(&state, (unsigned char *) "stream", 6);
+                fz_md5_update(&state, data, len);
+            }
+            fz_md5_final(&state, digest);
+            rc = 1 + is_stream;
+        }
+    }
+    fz_always(ctx) {
+        fz_drop_buffer(ctx, stream);
+        fz_drop_buffer(ctx, res);
+        pdf_drop_obj(ctx, obj);
+    }
+    fz_catch(ctx) {
+        rc = 0;
+    }
+    return rc;
+}
+
+//-----------------------------------------------------------------------------
+// Compare two objects already known to have the same digest
+//-----------------------------------------------------------------------------
+int JM_objects_equal(fz_context *ctx, pdf_document *pdf, int xref1, int xref2)
+{
+    pdf_obj *a = NULL, *b = NULL;
+    fz_buffer *sa = NULL, *sb = NULL;
+    unsigned char *da, *db;
+    size_t la, lb;
+    int rc = 0;
+    fz_var(a);
+    fz_var(b);
+    fz_var(sa);
+    fz_var(sb);
+    fz_try(ctx) {
+        a = pdf_load_object(ctx, pdf, xref1);
+        b = pdf_load_object(ctx, pdf, xref2);
+        if (!pdf_objcmp(ctx, a, b)) {
+            rc = 1;
+            if (pdf_obj_num_is_stream(ctx, pdf, xref1)) {
+                sa = pdf_load_raw_stream_number(ctx, pdf, xref1);
+                sb = pdf_load_raw_stream_number(ctx, pdf, xref2);
+                la = fz_buffer_storage(ctx, sa, &da);
+                lb = fz_buffer_storage(ctx, sb, &db);
+                if (la != lb || memcmp(da, db, la)) rc = 0;
+            }
+        }
+    }
+    fz_always(ctx) {
+        fz_drop_buffer(ctx, sa);
+        fz_drop_buffer(ctx, sb);
+        pdf_drop_obj(ctx, a);
+        pdf_drop_obj(ctx, b);
+    }
+    fz_catch(ctx) {
+        rc = 0;
+    }
+    return rc;
+}
+
+//-----------------------------------------------------------------------------
+// Merge duplicate objects, keeping the lowest xref of each group.
+// Objects are grouped by a hash of their source (and stream) in one pass
+// over the xref. References to duplicates are redirected and the
+// duplicates are deleted. Repeated until nothing changes, because objects
+// pointing to merged duplicates may themselves have become identical.
+// Returns the number of merged objects and streams.
+//-----------------------------------------------------------------------------
+void JM_dedupe_objects(fz_context *ctx, pdf_document *pdf, int streams,
+                       int *objects, int *dupes, int *dupe_streams)
+{
+    int xref, found, kind, *map = NULL, *is_stream = NULL;
+    int xreflen = pdf_xref_len(ctx, pdf);
+    unsigned char digest[16];
+    fz_hash_table *table = NULL;
+    pdf_obj *obj = NULL;
+    fz_var(obj);
+    fz_var(map);
+    fz_var(is_stream);
+    fz_var(table);
+    *objects = *dupes = *dupe_streams = 0;
+    fz_try(ctx) {
+        map = fz_malloc_array(ctx, xreflen, int);
+        is_stream = fz_malloc_array(ctx, xreflen, int);
+        do {
+            found = 0;
+            *objects = 0;
+            table = fz_new_hash_table(ctx, xreflen, 16, -1, NULL);
+            for (xref = 0; xref < xreflen; xref++) {
+                map[xref] = xref;
+                is_stream[xref] = 0;
+            }
+            for (xref = 1; xref < xreflen; xref++) {
+                kind = JM_object_digest(ctx, pdf, xref, streams, digest);
+                if (!kind) continue;
+                *objects += 1;
+                is_stream[xref] = (kind == 2);
+                void *other = fz_hash_insert(ctx, table, digest,
+                                             (void *) (intptr_t) xref);
+                if (!other) continue;
+                if (!JM_objects_equal(ctx, pdf, (int) (intptr_t) other, xref))
+                    continue;
+                map[xref] = (int) (intptr_t) other;
+                found += 1;
+            }
+            fz_drop_hash_table(ctx, table);
+            table = NULL;
+            if (!found) break;
+
+            // redirect references, then delete the duplicates
+            for (xref = 1; xref < xreflen; xref++) {
+                if (map[xref] != xref) continue;
+                pdf_xref_entry *entry = pdf_get_xref_entry(ctx, pdf, xref);
+                if (!entry || (entry->type != 'n' && entry->type != 'o'))
+                    continue;
+                fz_try(ctx) {
+                    obj = pdf_load_object(ctx, pdf, xref);
+                    JM_renumber_refs(ctx, pdf, obj, map, xreflen);
+                }
+                fz_always(ctx) {
+                    pdf_drop_obj(ctx, obj);
+                    obj = NULL;
+                }
+                fz_catch(ctx) {;}  // ignore damaged objects
+            }
+            JM_renumber_refs(ctx, pdf, pdf_trailer(ctx, pdf), map, xreflen);
+            for (xref = 1; xref < xreflen; xref++) {
+                if (map[xref] == xref) continue;
+                pdf_delete_object(ctx, pdf, xref);
+                if (is_stream[xref])
+                    *dupe_streams += 1;
+                else
+                    *dupes += 1;
+            }
+        } while (found);
+    }
+    fz_always(ctx) {
+        fz_drop_hash_table(ctx, table);
+        fz_free(ctx, map);
+        fz_free(ctx, is_stream);
+    }
+    fz_catch(ctx) fz_rethrow(ctx);
+}
+
+//-----------------------------------------------------------------------------
+// Make a tuple (xref, isstream, source, stream) for an xref.
+// Item 'stream' is None unless requested and xref is a stream.
+// Damaged objects deliver an empty source.
+//-----------------------------------------------------------------------------
+PyObject *JM_xref_object_tuple(fz_context *ctx, pdf_document *pdf, int xref,
+                               int streams, int compressed, int ascii)
+{
+    pdf_obj *obj = NULL;
+    fz_buffer *res = NULL, *stream = NULL;
+    PyObject *text = NULL, *data = NULL;
+    int is_stream = 0;
+    fz_var(obj);
+    fz_var(res);
+    fz_var(stream);
+    fz_var(text);
+    fz_var(data);
+    fz_try(ctx) {
+        obj = pdf_load_object(ctx, pdf, xref);
+        is_stream = pdf_obj_num_is_stream(ctx, pdf, xref);
+        res = JM_object_to_buffer(ctx, pdf_resolve_indirect(ctx, obj), compressed, ascii);
+        text = JM_EscapeStrFromBuffer(ctx, res);
+        if (is_stream && streams) {
+            stream = pdf_load_stream_number(ctx, pdf, xref);
+            data = JM_BinFromBuffer(ctx, stream);
+        }
+    }
+    fz_always(ctx) {
+        fz_drop_buffer(ctx, stream);
+        fz_drop_buffer(ctx, res);
+        pdf_drop_obj(ctx, obj);
+    }
+    fz_catch(ctx) {
+        Py_CLEAR(data);
+    }
+    if (!text) text = PyUnicode_FromString("");
+    if (!data) {
+        data = Py_None;
+        Py_INCREF(data);
+    }
+    PyObject *entry = PyTuple_New(4);
+    PyTuple_SET_ITEM(entry, 0, Py_BuildValue("i", xref));
+    PyTuple_SET_ITEM(entry, 1, JM_BOOL(is_stream));
+    PyTuple_SET_ITEM(entry, 2, text);
+    PyTuple_SET_ITEM(entry, 3, data);
+    return entry;
+}
+
+//-----------------------------------------------------------------------------
+// Locate the object at 'path' below 'obj'. Path items are separated by "/".
+// Dictionary keys are given without the leading slash, array items by
+// their index. The object is not resolved if it is an indirect reference.
+// Returns NULL if not found.
+//-----------------------------------------------------------------------------
+pdf_obj *JM_obj_at_path(fz_context *ctx, pdf_obj *obj, const char *path)
+{
+    char *copy = NULL, *p, *item;
+    fz_var(copy);
+    if (!path || !path[0]) return obj;
+    fz_try(ctx) {
+        copy = fz_strdup(ctx, path);
+        p = copy;
+        while (obj && (item = fz_strsep(&p, "/")) != NULL) {
+            if (!item[0]) continue;
+            if (pdf_is_array(ctx, obj)) {
+                char *end;
+                long i = strtol(item, &end, 10);
+                if (*end || i < 0 || i >= pdf_array_len(ctx, obj))
+                    obj = NULL;
+                else
+                    obj = pdf_array_get(ctx, obj, (int) i);
+            }
+            else if (pdf_is_dict(ctx, obj)) {
+                obj = pdf_dict_gets(ctx, obj, item);
+            }
+            else {
+                obj = NULL;
+            }
+        }
+    }
+    fz_always(ctx) {
+        fz_free(ctx, copy);
+    }
+    fz_catch(ctx) fz_rethrow(ctx);
+    return obj;
+}
+
+//-----------------------------------------------------------------------------
+// Make a tuple (type, value) describing a PDF object.
+// Indirect references are not resolved: type "xref", value is the xref.
+// Arrays and dictionaries deliver their number of items as value.
+//-----------------------------------------------------------------------------
+PyObject *JM_obj_type_value(fz_context *ctx, pdf_obj *obj)
+{
+    if (pdf_is_indirect(ctx, obj))
+        return Py_BuildValue("si", "xref", pdf_to_num(ctx, obj));
+    if (!obj || pdf_is_null(ctx, obj))
+        return Py_BuildValue("sO", "null", Py_None);
+    if (pdf_is_bool(ctx, obj))
+        return Py_BuildValue("sO", "bool", pdf_to_bool(ctx, obj) ? Py_True : Py_False);
+    if (pdf_is_int(ctx, obj))
+        return Py_BuildValue("sL", "int", (long long) pdf_to_int64(ctx, obj));
+    if (pdf_is_real(ctx, obj))
+        return Py_BuildValue("sd", "float", (double) pdf_to_real(ctx, obj));
+    if (pdf_is_name(ctx, obj))
+        return Py_BuildValue("sN", "name", JM_EscapeStrFromStr(pdf_to_name(ctx, obj)));
+    if (pdf_is_string(ctx, obj))
+        return Py_BuildValue("sN", "string", JM_UnicodeFromStr(pdf_to_text_string(ctx, obj)));
+    if (pdf_is_array(ctx, obj))
+        return Py_BuildValue("si", "array", pdf_array_len(ctx, obj));
+    if (pdf_is_dict(ctx, obj))
+        return Py_BuildValue("si", "dict", pdf_dict_len(ctx, obj));
+    return Py_BuildValue("sO", "unknown", Py_None);
+}
+
+//-----------------------------------------------------------------------------
+// Load object by xref, or the trailer if xref is -1. The result must be
+// dropped.
+//-----------------------------------------------------------------------------
+pdf_obj *JM_load_xref_or_trailer(fz_context *ctx, pdf_document *pdf, int xref)
+{
+    if (xref == -1)
+        return pdf_keep_obj(ctx, pdf_trailer(ctx, pdf));
+    if (!INRANGE(xref, 1, pdf_xref_len(ctx, pdf) - 1))
+        THROWMSG("xref out of range");
+    return pdf_load_object(ctx, pdf, xref);
+}
+
 %}
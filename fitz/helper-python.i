@@ -34,6 +34,7 @@ TEXT_PRESERVE_LIGATURES = 1
 TEXT_PRESERVE_WHITESPACE = 2
 TEXT_PRESERVE_IMAGES = 4
 TEXT_INHIBIT_SPACES = 8
+TEXT_IGNORE_GRAPHICS = 65536
 
 # ------------------------------------------------------------------------------
 # Simple text encoding options
@@ -97,6 +98,31 @@ Base14_fontdict["tibi"] = "Times-BoldItalic"
 Base14_fontdict["symb"] = "Symbol"
 Base14_fontdict["zadb"] = "ZapfDingbats"
 
+_pymupdf_fonts_buffers = {}  # fonts of package pymupdf_fonts already loaded
+
+
+def _pymupdf_fonts_buffer(fontname):
+    """Return the font buffer of a font in optional package pymupdf_fonts.
+
+    Notes:
+        Buffers are kept after the first look-up. They are released by
+        TOOLS.purge_font_cache().
+    """
+    fontbuffer = _pymupdf_fonts_buffers.get(fontname)
+    if fontbuffer is not None:
+        return fontbuffer
+    try:
+        import pymupdf_fonts  # optional fonts
+        fontbuffer = pymupdf_fonts.myfont(fontname)[:]  # make a copy
+        del pymupdf_fonts  # remove package again
+    except Exception as exc:
+        if repr(exc).startswith(("ImportError", "AttributeError")):
+            raise ImportError("Optional package 'pymupdf_fonts' not installed")
+        else:
+            raise exc
+    _pymupdf_fonts_buffers[fontname] = fontbuffer
+    return fontbuffer
+
 annot_skel = {
     "goto1": "<</A<</S/GoTo/D[%i 0 R/XYZ %g %g 0]>>/Rect[%s]/BS<</W 0>>/Subtype/Link>>",
     "goto2": "<</A<</S/GoTo/D%s>>/Rect[%s]/BS<</W 0>>/Subtype/Link>>",
@@ -1436,4 +1462,218 @@ def repair_mono_font(page, font):
     for xref in xrefs:
         if not TOOLS.set_font_width(doc, xref, width):
             print("Could set width for '%s' in xref %i" % (font.name, xref))
+
+
+_accent_map = {}
+
+
+def _strip_accents(text):
+    """Remove diacritical marks from the characters of a string.
+
+    Notes:
+        Every character is replaced by exactly one character, so positions
+        in the result equal those in the input.
+    """
+    import unicodedata
+
+    chars = []
+    for c in text:
+        b = _accent_map.get(c)
+        if b is None:
+            d = unicodedata.normalize("NFD", c)
+            b = c
+            if len(d) > 1 and all(unicodedata.combining(x) for x in d[1:]):
+                b = d[0]
+            _accent_map[c] = b
+        chars.append(b)
+    return "".join(chars)
+
+
+# -------------------------------------------------------------------------------
+# Structured, lazily evaluated views of PDF objects
+# -------------------------------------------------------------------------------
+class PDFName(str):
+    """A PDF name. The string value excludes the leading slash."""
+
+    def __repr__(self):
+        return "/" + str.__str__(self)
+
+
+_pdf_name_delimiters = bytearray(b"()<>[]{}/%#")
+
+
+def _pdf_name(name):
+    """Return the PDF source of a name, escaping special bytes as '#xx'."""
+    if not isinstance(name, bytes):
+        name = name.encode("utf-8")
+    chars = []
+    for c in bytearray(name):
+        if c < 0x21 or c > 0x7E or c in _pdf_name_delimiters:
+            chars.append("#%02X" % c)
+        else:
+            chars.append(chr(c))
+    return "/" + "".join(chars)
+
+
+def PDFSource(value):
+    """Return the PDF source of a Python value.
+
+    Notes:
+        None is 'null', PDFName a name, str a PDF string, list / tuple an
+        array and dict a dictionary. PDFDict and PDFArray views of
+        complete objects become indirect references.
+    """
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, PDFName):
+        return _pdf_name(value)
+    if isinstance(value, (PDFDict, PDFArray)):
+        if value.path or value.xref < 1:
+            raise ValueError("only complete objects can be referenced")
+        return "%i 0 R" % value.xref
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if math.isinf(value) or math.isnan(value):
+            raise ValueError("bad float %r" % value)
+        s = repr(value)  # shortest exact representation
+        if "e" in s:  # PDF has no exponent notation
+            s = format(decimal.Decimal(s), "f")
+        if "." in s:
+            s = s.rstrip("0").rstrip(".")
+        return s
+    if isinstance(value, str) or fitz_py2 and isinstance(value, unicode):
+        return getPDFstr(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + " ".join([PDFSource(v) for v in value]) + "]"
+    if isinstance(value, dict):
+        items = [_pdf_name(k) + " " + PDFSource(v) for k, v in value.items()]
+        return "<<" + "".join(items) + ">>"
+    raise ValueError("unsupported type %s" % type(value))
+
+
+class _PDFView(object):
+    """Common part of PDFDict and PDFArray.
+
+    Notes:
+        A view only stores the document, an xref (-1 = trailer) and the path
+        of keys leading to the viewed object. Values are read and written on
+        access, so no object source needs to be parsed or generated.
+    """
+
+    def __init__(self, doc, xref, path=""):
+        self.doc = doc
+        self.xref = xref
+        self.path = path
+
+    def _path(self, key):
+        if self.path:
+            return "%s/%s" % (self.path, key)
+        return str(key)
+
+    def _get(self, key):
+        path = self._path(key)
+        t, v = self.doc._xrefGetKey(self.xref, path)
+        if t == "xref":  # follow the reference
+            xref, path = v, ""
+            t, v = self.doc._xrefGetKey(xref, path)
+        else:
+            xref = self.xref
+        if t == "dict":
+            return PDFDict(self.doc, xref, path)
+        if t == "array":
+            return PDFArray(self.doc, xref, path)
+        if t == "name":
+            return PDFName(v)
+        return v
+
+    def _set(self, key, value):
+        self.doc._xrefSetKey(self.xref, self._path(key), PDFSource(value))
+
+    def __len__(self):
+        return self.doc._xrefGetKey(self.xref, self.path)[1]
+
+    def __repr__(self):
+        return "%s(xref=%i, path=%r)" % (self.__class__.__name__, self.xref, self.path)
+
+
+class PDFDict(_PDFView):
+    """Dictionary-like view of a PDF dictionary."""
+
+    def keys(self):
+        return self.doc._xrefGetKeys(self.xref, self.path)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return self.doc._xrefGetKey(self.xref, self._path(key))[0] != "null"
+
+    def __getitem__(self, key):
+        value = self._get(key)
+        if value is None and key not in self:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._get(key)
+        return default if value is None else value
+
+    def __setitem__(self, key, value):
+        self._set(key, value)
+
+    def __delitem__(self, key):
+        self._set(key, None)
+
+    def items(self):
+        return [(k, self._get(k)) for k in self.keys()]
+
+
+class PDFArray(_PDFView):
+    """List-like view of a PDF array."""
+
+    def _index(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("index out of range")
+        return i
+
+    def __getitem__(self, i):
+        return self._get(self._index(i))
+
+    def __setitem__(self, i, value):
+        self._set(self._index(i), value)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+
+class _TextFileWriter(object):
+    """Write UTF-8 encoded bytes to a text file object as str.
+
+    Notes:
+        Data arrive in chunks which may split multi-byte characters, so
+        an incremental decoder is used.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def write(self, data):
+        text = self.decoder.decode(data)
+        if text:
+            self.fileobj.write(text)
+
+    def close(self):
+        text = self.decoder.decode(b"", True)
+        if text:
+            self.fileobj.write(text)
 %}
@@ -1,25 +1,294 @@
 %{
 //-----------------------------------------------------------------------------
-// Make a text page directly from an fz_page
+// Device passing to a target device only text and images inside a clip.
+// Target callbacks are invoked directly: its clip stack is not involved.
 //-----------------------------------------------------------------------------
-fz_stext_page *JM_new_stext_page_from_page(fz_context *ctx, fz_page *page, int flags)
+typedef struct
+{
+    fz_device super;
+    fz_device *target;
+    fz_rect clip;
+} jm_clip_device;
+
+static int JM_rect_touches_clip(fz_rect r, fz_rect clip)
+{
+    return !fz_is_empty_rect(fz_intersect_rect(r, clip));
+}
+
+// a glyph is inside if its bbox touches the clip, a blank if its origin does
+static int JM_glyph_in_clip(fz_context *ctx, fz_font *font, int gid,
+                            fz_matrix trm, fz_matrix ctm, fz_rect clip)
+{
+    fz_rect r = fz_bound_glyph(ctx, font, gid, fz_concat(trm, ctm));
+    if (!fz_is_empty_rect(r))
+        return JM_rect_touches_clip(r, clip);
+    fz_point p = fz_transform_point_xy(trm.e, trm.f, ctm);
+    return (p.x >= clip.x0 && p.x < clip.x1 && p.y >= clip.y0 && p.y < clip.y1);
+}
+
+// return text reduced to the glyphs inside the clip, or NULL if none
+static fz_text *JM_clip_text(fz_context *ctx, const fz_text *text,
+                             fz_matrix ctm, fz_rect clip)
+{
+    fz_text *out = NULL;
+    fz_text_span *span;
+    fz_text_item *item;
+    fz_matrix trm;
+    int i, keep, count = 0;
+    fz_rect r = fz_bound_text(ctx, text, NULL, ctm);
+    if (!JM_rect_touches_clip(r, clip))
+        return NULL;
+    if (fz_contains_rect(clip, r))
+        return fz_keep_text(ctx, text);
+    out = fz_new_text(ctx);
+    fz_try(ctx) {
+        for (span = text->head; span; span = span->next) {
+            trm = span->trm;
+            keep = 0;  // glyphless items never follow a glyph of another span
+            for (i = 0; i < span->len; i++) {
+                item = &span->items[i];
+                trm.e = item->x;
+                trm.f = item->y;
+                // items without glyph (e.g. ligature parts) follow their glyph
+                if (item->gid >= 0)
+                    keep = JM_glyph_in_clip(ctx, span->font, item->gid, trm, ctm, clip);
+                if (!keep) continue;
+                fz_show_glyph(ctx, out, span->font, trm, item->gid, item->ucs,
+                              span->wmode, span->bidi_level, span->markup_dir,
+                              span->language);
+                count++;
+            }
+        }
+    }
+    fz_catch(ctx) {
+        fz_drop_text(ctx, out);
+        fz_rethrow(ctx);
+    }
+    if (!count) {
+        fz_drop_text(ctx, out);
+        return NULL;
+    }
+    return out;
+}
+
+static void
+jm_clip_fill_text(fz_context *ctx, fz_device *dev_, const fz_text *text, fz_matrix ctm,
+        fz_colorspace *cs, const float *color, float alpha, fz_color_params cp)
+{
+    jm_clip_device *dev = (jm_clip_device *) dev_;
+    fz_text *t = JM_clip_text(ctx, text, ctm, dev->clip);
+    if (!t) return;
+    fz_try(ctx) {
+        if (dev->target->fill_text)
+            dev->target->fill_text(ctx, dev->target, t, ctm, cs, color, alpha, cp);
+    }
+    fz_always(ctx) {
+        fz_drop_text(ctx, t);
+    }
+    fz_catch(ctx) {
+        fz_rethrow(ctx);
+    }
+}
+
+static void
+jm_clip_stroke_text(fz_context *ctx, fz_device *dev_, const fz_text *text,
+        const fz_stroke_state *stroke, fz_matrix ctm,
+        fz_colorspace *cs, const float *color, float alpha, fz_color_params cp)
+{
+    jm_clip_device *dev = (jm_clip_device *) dev_;
+    fz_text *t = JM_clip_text(ctx, text, ctm, dev->clip);
+    if (!t) return;
+    fz_try(ctx) {
+        if (dev->target->stroke_text)
+            dev->target->stroke_text(ctx, dev->target, t, stroke, ctm, cs, color, alpha, cp);
+    }
+    fz_always(ctx) {
+        fz_drop_text(ctx, t);
+    }
+    fz_catch(ctx) {
+        fz_rethrow(ctx);
+    }
+}
+
+static void
+jm_clip_clip_text(fz_context *ctx, fz_device *dev_, const fz_text *text, fz_matrix ctm,
+        fz_rect scissor)
+{
+    jm_clip_device *dev = (jm_clip_device *) dev_;
+    fz_text *t = JM_clip_text(ctx, text, ctm, dev->clip);
+    if (!t) return;
+    fz_try(ctx) {
+        if (dev->target->clip_text)
+            dev->target->clip_text(ctx, dev->target, t, ctm, scissor);
+    }
+    fz_always(ctx) {
+        fz_drop_text(ctx, t);
+    }
+    fz_catch(ctx) {
+        fz_rethrow(ctx);
+    }
+}
+
+static void
+jm_clip_clip_stroke_text(fz_context *ctx, fz_device *dev_, const fz_text *text,
+        const fz_stroke_state *stroke, fz_matrix ctm, fz_rect scissor)
+{
+    jm_clip_device *dev = (jm_clip_device *) dev_;
+    fz_text *t = JM_clip_text(ctx, text, ctm, dev->clip);
+    if (!t) return;
+    fz_try(ctx) {
+        if (dev->target->clip_stroke_text)
+            dev->target->clip_stroke_text(ctx, dev->target, t, stroke, ctm, scissor);
+    }
+    fz_always(ctx) {
+        fz_drop_text(ctx, t);
+    }
+    fz_catch(ctx) {
+        fz_rethrow(ctx);
+    }
+}
+
+static void
+jm_clip_ignore_text(fz_context *ctx, fz_device *dev_, const fz_text *text, fz_matrix ctm)
+{
+    jm_clip_device *dev = (jm_clip_device *) dev_;
+    fz_text *t = JM_clip_text(ctx, text, ctm, dev->clip);
+    if (!t) return;
+    fz_try(ctx) {
+        if (dev->target->ignore_text)
+            dev->target->ignore_text(ctx, dev->target, t, ctm);
+    }
+    fz_always(ctx) {
+        fz_drop_text(ctx, t);
+    }
+    fz_catch(ctx) {
+        fz_rethrow(ctx);
+    }
+}
+
+static void
+jm_clip_fill_shade(fz_context *ctx, fz_device *dev_, fz_shade *shade, fz_matrix ctm,
+        float alpha, fz_color_params cp)
+{
+    jm_clip_device *dev = (jm_clip_device *) dev_;
+    if (dev->target->fill_shade &&
+        JM_rect_touches_clip(fz_bound_shade(ctx, shade, ctm), dev->clip))
+        dev->target->fill_shade(ctx, dev->target, shade, ctm, alpha, cp);
+}
+
+static void
+jm_clip_fill_image(fz_context *ctx, fz_device *dev_, fz_image *image, fz_matrix ctm,
+        float alpha, fz_color_params cp)
+{
+    jm_clip_device *dev = (jm_clip_device *) dev_;
+    if (dev->target->fill_image &&
+        JM_rect_touches_clip(fz_transform_rect(fz_unit_rect, ctm), dev->clip))
+        dev->target->fill_image(ctx, dev->target, image, ctm, alpha, cp);
+}
+
+static void
+jm_clip_fill_image_mask(fz_context *ctx, fz_device *dev_, fz_image *image, fz_matrix ctm,
+        fz_colorspace *cs, const float *color, float alpha, fz_color_params cp)
+{
+    jm_clip_device *dev = (jm_clip_device *) dev_;
+    if (dev->target->fill_image_mask &&
+        JM_rect_touches_clip(fz_transform_rect(fz_unit_rect, ctm), dev->clip))
+        dev->target->fill_image_mask(ctx, dev->target, image, ctm, cs, color, alpha, cp);
+}
+
+fz_device *JM_new_clip_device(fz_context *ctx, fz_device *target, fz_rect clip)
+{
+    jm_clip_device *dev = fz_new_derived_device(ctx, jm_clip_device);
+
+    dev->super.fill_text = jm_clip_fill_text;
+    dev->super.stroke_text = jm_clip_stroke_text;
+    dev->super.clip_text = jm_clip_clip_text;
+    dev->super.clip_stroke_text = jm_clip_clip_stroke_text;
+    dev->super.ignore_text = jm_clip_ignore_text;
+    dev->super.fill_shade = jm_clip_fill_shade;
+    dev->super.fill_image = jm_clip_fill_image;
+    dev->super.fill_image_mask = jm_clip_fill_image_mask;
+
+    dev->target = target;
+    dev->clip = clip;
+    return (fz_device *) dev;
+}
+
+//-----------------------------------------------------------------------------
+// Run the contents of a PDF page for text extraction only. Paths are built
+// but never painted, shadings and soft masks are not loaded, and images
+// only if requested.
+//-----------------------------------------------------------------------------
+static void JM_run_pdf_page_text_only(fz_context *ctx, pdf_page *page, fz_device *dev, int images)
+{
+    fz_matrix page_ctm;
+    fz_rect mediabox;
+    pdf_processor *proc = NULL;
+    fz_var(proc);
+    fz_try(ctx) {
+        pdf_page_transform(ctx, page, &mediabox, &page_ctm);
+        proc = pdf_new_run_processor(ctx, dev, page_ctm, "View", NULL, NULL, NULL);
+        if (!images) {  // the interpreter only loads images for these
+            proc->op_BI = NULL;
+            proc->op_Do_image = NULL;
+        }
+        proc->op_sh = NULL;
+        proc->op_gs_SMask = NULL;
+        // painting operators only end the path (and honour W / W*)
+        proc->op_S = proc->op_s = proc->op_n;
+        proc->op_F = proc->op_f = proc->op_fstar = proc->op_n;
+        proc->op_B = proc->op_Bstar = proc->op_b = proc->op_bstar = proc->op_n;
+        pdf_process_contents(ctx, proc, page->doc, pdf_page_resources(ctx, page),
+                             pdf_page_contents(ctx, page), NULL);
+        pdf_close_processor(ctx, proc);
+    }
+    fz_always(ctx) {
+        pdf_drop_processor(ctx, proc);
+    }
+    fz_catch(ctx) {
+        fz_rethrow(ctx);
+    }
+}
+
+//-----------------------------------------------------------------------------
+// Make a text page directly from an fz_page. Unless clip is infinite,
+// only text and images inside it are passed to the stext device.
+// Flag JM_TEXT_IGNORE_GRAPHICS selects the text-only run of PDF pages.
+//-----------------------------------------------------------------------------
+#define JM_TEXT_IGNORE_GRAPHICS 65536
+
+fz_stext_page *JM_new_stext_page_from_page(fz_context *ctx, fz_page *page, int flags, fz_rect clip)
 {
     if (!page) return NULL;
     fz_stext_page *tp = NULL;
     fz_rect rect;
-    fz_device *dev = NULL;
+    fz_device *dev = NULL, *clipdev = NULL, *rundev;
+    pdf_page *pdfpage = pdf_page_from_fz_page(ctx, page);
     fz_var(dev);
+    fz_var(clipdev);
     fz_var(tp);
     fz_stext_options options = { 0 };
-    options.flags = flags;
+    options.flags = flags & ~JM_TEXT_IGNORE_GRAPHICS;
     fz_try(ctx) {
         rect = fz_bound_page(ctx, page);
         tp = fz_new_stext_page(ctx, rect);
         dev = fz_new_stext_device(ctx, tp, &options);
-        fz_run_page_contents(ctx, page, dev, fz_identity, NULL);
+        rundev = dev;
+        if (!fz_is_infinite_rect(clip)) {
+            clipdev = JM_new_clip_device(ctx, dev, clip);
+            rundev = clipdev;
+        }
+        if (pdfpage && (flags & JM_TEXT_IGNORE_GRAPHICS)) {
+            JM_run_pdf_page_text_only(ctx, pdfpage, rundev,
+                                      flags & FZ_STEXT_PRESERVE_IMAGES);
+        } else {
+            fz_run_page_contents(ctx, page, rundev, fz_identity, NULL);
+        }
+        if (clipdev) fz_close_device(ctx, clipdev);
         fz_close_device(ctx, dev);
     }
     fz_always(ctx) {
+        fz_drop_device(ctx, clipdev);
         fz_drop_device(ctx, dev);
     }
     fz_catch(ctx) {
@@ -83,9 +352,11 @@ void JM_write_rune(fz_context *ctx, fz_output *out, int ch)
 // Plain text output. An identical copy of fz_print_stext_page_as_text,
 // but lines within a block are concatenated by space instead a new-line
 // character (which else leads to 2 new-lines).
+// Characters are written as UTF-8 if utf8 is true, else escaped for
+// JM_EscapeStrFromBuffer.
 //-----------------------------------------------------------------------------
 void
-JM_print_stext_page_as_text(fz_context *ctx, fz_output *out, fz_stext_page *page)
+JM_print_stext_page_as_text(fz_context *ctx, fz_output *out, fz_stext_page *page, int utf8)
 {
     fz_stext_block *block = NULL;
     fz_stext_line *line = NULL;
@@ -106,7 +377,10 @@ JM_print_stext_page_as_text(fz_context *ctx, fz_output *out, fz_stext_page *page
                 line_n++;
                 for (ch = line->first_char; ch; ch = ch->next)
                 {
-                    JM_write_rune(ctx, out, ch->c);
+                    if (utf8)
+                        fz_write_rune(ctx, out, ch->c);
+                    else
+                        JM_write_rune(ctx, out, ch->c);
                     last_char = ch->c;
                 }
             }
@@ -150,6 +424,225 @@ fz_rect JM_char_bbox(fz_stext_line *line, fz_stext_char *ch)
     return r;
 }
 
+//-----------------------------------------------------------------------------
+// Functions for columnar (array) output of words or characters.
+// Per item we store its bbox as 4 floats and (block, line, item) numbers
+// as 3 ints in binary buffers. The texts of all items are concatenated in
+// one UTF-8 buffer, item i is text[offsets[i]:offsets[i+1]].
+//-----------------------------------------------------------------------------
+typedef struct
+{
+    fz_buffer *bboxes;
+    fz_buffer *indices;
+    fz_buffer *text;
+    fz_buffer *offsets;
+    int count;                         // number of items
+    int textlen;                       // number of characters in text
+} JM_columns;
+
+static void JM_append_column_rune(fz_context *ctx, JM_columns *cols, int c)
+{
+    if (c < 0 || c > 0x10ffff || (c >= 0xd800 && c <= 0xdfff))
+        c = 0xfffd;                    // not representable in UTF-8
+    fz_append_rune(ctx, cols->text, c);
+    cols->textlen++;
+}
+
+static void JM_append_column_item(fz_context *ctx, JM_columns *cols, fz_rect r,
+                                  int block_n, int line_n, int item_n, int start)
+{
+    float f[4] = {r.x0, r.y0, r.x1, r.y1};
+    int i[3] = {block_n, line_n, item_n};
+    fz_append_data(ctx, cols->bboxes, f, sizeof(f));
+    fz_append_data(ctx, cols->indices, i, sizeof(i));
+    fz_append_data(ctx, cols->offsets, &start, sizeof(int));
+    cols->count++;
+}
+
+PyObject *JM_extract_columns(fz_context *ctx, fz_stext_page *page, int chars)
+{
+    fz_stext_block *block;
+    fz_stext_line *line;
+    fz_stext_char *ch;
+    JM_columns cols = {NULL, NULL, NULL, NULL, 0, 0};
+    PyObject *rc = NULL;
+    int block_n = 0, line_n, item_n, wordlen, start = 0;
+    fz_rect wbbox;
+    unsigned char *data;
+    size_t len;
+    fz_var(cols);
+    fz_try(ctx) {
+        cols.bboxes = fz_new_buffer(ctx, 1024);
+        cols.indices = fz_new_buffer(ctx, 1024);
+        cols.text = fz_new_buffer(ctx, 1024);
+        cols.offsets = fz_new_buffer(ctx, 256);
+        for (block = page->first_block; block; block = block->next) {
+            if (block->type != FZ_STEXT_BLOCK_TEXT) {
+                block_n++;
+                continue;
+            }
+            line_n = 0;
+            for (line = block->u.t.first_line; line; line = line->next) {
+                item_n = 0;
+                wordlen = 0;
+                wbbox = fz_empty_rect;
+                for (ch = line->first_char; ch; ch = ch->next) {
+                    if (chars) {
+                        JM_append_column_item(ctx, &cols, JM_char_bbox(line, ch),
+                                              block_n, line_n, item_n++, cols.textlen);
+                        JM_append_column_rune(ctx, &cols, ch->c);
+                        continue;
+                    }
+                    if (ch->c == 32) {         // a space terminates a word
+                        if (wordlen) {
+                            JM_append_column_item(ctx, &cols, wbbox,
+                                                  block_n, line_n, item_n++, start);
+                            wordlen = 0;
+                        }
+                        continue;
+                    }
+                    if (!wordlen) {            // start a new word
+                        wbbox = fz_empty_rect;
+                        start = cols.textlen;
+                    }
+                    JM_append_column_rune(ctx, &cols, ch->c);
+                    wordlen++;
+                    wbbox = fz_union_rect(wbbox, JM_char_bbox(line, ch));
+                }
+                if (wordlen) {
+                    JM_append_column_item(ctx, &cols, wbbox,
+                                          block_n, line_n, item_n++, start);
+                }
+                line_n++;
+            }
+            block_n++;
+        }
+        fz_append_data(ctx, cols.offsets, &cols.textlen, sizeof(int));
+        len = fz_buffer_storage(ctx, cols.text, &data);
+        rc = PyTuple_New(5);
+        PyTuple_SET_ITEM(rc, 0, Py_BuildValue("i", cols.count));
+        PyTuple_SET_ITEM(rc, 1, JM_BinFromBuffer(ctx, cols.bboxes));
+        PyTuple_SET_ITEM(rc, 2, JM_BinFromBuffer(ctx, cols.indices));
+        PyTuple_SET_ITEM(rc, 3, PyUnicode_DecodeUTF8((const char *) data, (Py_ssize_t) len, "replace"));
+        PyTuple_SET_ITEM(rc, 4, JM_BinFromBuffer(ctx, cols.offsets));
+    }
+    fz_always(ctx) {
+        fz_drop_buffer(ctx, cols.bboxes);
+        fz_drop_buffer(ctx, cols.indices);
+        fz_drop_buffer(ctx, cols.text);
+        fz_drop_buffer(ctx, cols.offsets);
+    }
+    fz_catch(ctx) {
+        Py_CLEAR(rc);
+        fz_rethrow(ctx);
+    }
+    return rc;
+}
+
+//-----------------------------------------------------------------------------
+// Linear text of a page: the characters of all text lines, each line being
+// followed by a line break. Position i of the string belongs to the i-th
+// character (counting the line breaks).
+//-----------------------------------------------------------------------------
+PyObject *JM_linear_text(fz_context *ctx, fz_stext_page *page)
+{
+    fz_stext_block *block;
+    fz_stext_line *line;
+    fz_stext_char *ch;
+    JM_columns cols = {NULL, NULL, NULL, NULL, 0, 0};
+    PyObject *rc = NULL;
+    unsigned char *data;
+    size_t len;
+    fz_var(cols);
+    fz_try(ctx) {
+        cols.text = fz_new_buffer(ctx, 1024);
+        for (block = page->first_block; block; block = block->next) {
+            if (block->type != FZ_STEXT_BLOCK_TEXT) continue;
+            for (line = block->u.t.first_line; line; line = line->next) {
+                for (ch = line->first_char; ch; ch = ch->next) {
+                    JM_append_column_rune(ctx, &cols, ch->c);
+                }
+                JM_append_column_rune(ctx, &cols, 10);
+            }
+        }
+        len = fz_buffer_storage(ctx, cols.text, &data);
+        rc = PyUnicode_DecodeUTF8((const char *) data, (Py_ssize_t) len, "replace");
+    }
+    fz_always(ctx) {
+        fz_drop_buffer(ctx, cols.text);
+    }
+    fz_catch(ctx) {
+        fz_rethrow(ctx);
+    }
+    return rc;
+}
+
+//-----------------------------------------------------------------------------
+// Map character ranges of the linear text to quads. 'spans' is a flat
+// sequence start0, stop0, start1, stop1, ... of ascending, non-overlapping
+// ranges. For each range, a list with one quad per touched line is returned.
+//-----------------------------------------------------------------------------
+PyObject *JM_linear_quads(fz_context *ctx, fz_stext_page *page, PyObject *spans)
+{
+    fz_stext_block *block;
+    fz_stext_line *line;
+    fz_stext_char *ch;
+    fz_quad quad = fz_quad_from_rect(fz_empty_rect);
+    Py_ssize_t i = 0, n = PySequence_Size(spans) / 2;
+    int pos = 0, start = 0, stop = 0, inquad = 0;
+    PyObject *rc = PyList_New(0), *hit = NULL;
+
+    if (n < 1) return rc;
+    if (JM_INT_ITEM(spans, 0, &start) || JM_INT_ITEM(spans, 1, &stop)) {
+        Py_DECREF(rc);
+        fz_throw(ctx, FZ_ERROR_GENERIC, "bad span values");
+    }
+    hit = PyList_New(0);
+    for (block = page->first_block; block && i < n; block = block->next) {
+        if (block->type != FZ_STEXT_BLOCK_TEXT) continue;
+        for (line = block->u.t.first_line; line && i < n; line = line->next) {
+            ch = line->first_char;
+            while (i < n) {
+                while (i < n && pos >= stop) {  // current range is complete
+                    if (inquad) LIST_APPEND_DROP(hit, JM_py_from_quad(quad));
+                    inquad = 0;
+                    LIST_APPEND_DROP(rc, hit);
+                    hit = NULL;
+                    i++;
+                    if (i < n) {
+                        if (JM_INT_ITEM(spans, 2 * i, &start) ||
+                            JM_INT_ITEM(spans, 2 * i + 1, &stop)) {
+                            Py_XDECREF(hit);
+                            Py_DECREF(rc);
+                            fz_throw(ctx, FZ_ERROR_GENERIC, "bad span values");
+                        }
+                        hit = PyList_New(0);
+                    }
+                }
+                if (!ch) break;  // position of the line break
+                if (i < n && pos >= start) {  // character is in range
+                    if (!inquad) {
+                        quad = ch->quad;
+                        inquad = 1;
+                    } else {
+                        quad.ur = ch->quad.ur;
+                        quad.lr = ch->quad.lr;
+                    }
+                }
+                pos++;
+                ch = ch->next;
+            }
+            if (inquad) {  // a range never extends a quad beyond its line
+                LIST_APPEND_DROP(hit, JM_py_from_quad(quad));
+                inquad = 0;
+            }
+            pos++;
+        }
+    }
+    if (hit) LIST_APPEND_DROP(rc, hit);  // range reaching the end of text
+    return rc;
+}
+
 static int detect_super_script(fz_stext_line *line, fz_stext_char *ch)
 {
     if (line->wmode == 0 && line->dir.x == 1 && line->dir.y == 0)
@@ -168,9 +661,39 @@ static int JM_char_font_flags(fz_context *ctx, fz_font *font, fz_stext_line *lin
 }
 
 
-static PyObject *JM_make_spanlist(fz_context *ctx, fz_stext_line *line, int raw, fz_buffer *buff)
+//-----------------------------------------------------------------------------
+// Finish a span: store its text or chars and its bbox, append it to the list.
+// In compact mode, span is a TextSpan struct sequence and chars a tuple.
+//-----------------------------------------------------------------------------
+static void JM_flush_span(fz_context *ctx, PyObject *span_list, PyObject *span,
+                          PyObject *char_list, fz_buffer *buff, fz_rect span_rect,
+                          int raw, int compact)
+{
+    if (compact) {
+        if (raw) {
+            PyStructSequence_SET_ITEM(span, 5, Py_BuildValue("s", NULL));
+            PyStructSequence_SET_ITEM(span, 6, PyList_AsTuple(char_list));
+            Py_DECREF(char_list);
+        } else {
+            PyStructSequence_SET_ITEM(span, 5, JM_EscapeStrFromBuffer(ctx, buff));
+            PyStructSequence_SET_ITEM(span, 6, Py_BuildValue("s", NULL));
+        }
+        PyStructSequence_SET_ITEM(span, 4, JM_py_from_rect(span_rect));
+    } else {
+        if (raw) {  // put character list in the span
+            DICT_SETITEM_DROP(span, dictkey_chars, char_list);
+        } else {  // put text string in the span
+            DICT_SETITEM_DROP(span, dictkey_text, JM_EscapeStrFromBuffer(ctx, buff));
+        }
+        DICT_SETITEM_DROP(span, dictkey_bbox, JM_py_from_rect(span_rect));
+    }
+    fz_clear_buffer(ctx, buff);
+    LIST_APPEND_DROP(span_list, span);
+}
+
+static PyObject *JM_make_spanlist(fz_context *ctx, fz_stext_line *line, int raw, fz_buffer *buff, int compact)
 {
-    PyObject *span = NULL, *char_list = NULL, *char_dict;
+    PyObject *span = NULL, *char_list = NULL, *char_dict, *font;
     PyObject *span_list = PyList_New(0);
     fz_clear_buffer(ctx, buff);
     fz_stext_char *ch;
@@ -196,29 +719,33 @@ static PyObject *JM_make_spanlist(fz_context *ctx, fz_stext_line *line, int raw,
         {
             if (old_style.size >= 0)  // not 1st one, output previous span
             {
-                if (raw)  // put character list in the span
-                {
-                    DICT_SETITEM_DROP(span, dictkey_chars, char_list);
-                    char_list = NULL;
-                }
-                else  // put text string in the span
-                {
-                    DICT_SETITEM_DROP(span, dictkey_text, JM_EscapeStrFromBuffer(ctx, buff));
-                    fz_clear_buffer(ctx, buff);
-                }
-
-                DICT_SETITEM_DROP(span, dictkey_bbox, JM_py_from_rect(span_rect));
-
-                LIST_APPEND_DROP(span_list, span);
+                JM_flush_span(ctx, span_list, span, char_list, buff,
+                              span_rect, raw, compact);
                 span = NULL;
+                char_list = NULL;
             }
 
-            span = PyDict_New();
+            font = JM_EscapeStrFromStr(style.font);
+            if (compact)
+            {
+#if PY_VERSION_HEX >= 0x03000000
+                PyUnicode_InternInPlace(&font);  // share equal font names
+#endif
+                span = PyStructSequence_New(&JM_TextSpanType);
+                PyStructSequence_SET_ITEM(span, 0, Py_BuildValue("f", style.size));
+                PyStructSequence_SET_ITEM(span, 1, Py_BuildValue("i", style.flags));
+                PyStructSequence_SET_ITEM(span, 2, font);
+                PyStructSequence_SET_ITEM(span, 3, Py_BuildValue("i", style.color));
+            }
+            else
+            {
+                span = PyDict_New();
 
-            DICT_SETITEM_DROP(span, dictkey_size, Py_BuildValue("f", style.size));
-            DICT_SETITEM_DROP(span, dictkey_flags, Py_BuildValue("i", style.flags));
-            DICT_SETITEM_DROP(span, dictkey_font, JM_EscapeStrFromStr(style.font));
-            DICT_SETITEM_DROP(span, dictkey_color, Py_BuildValue("i", style.color));
+                DICT_SETITEM_DROP(span, dictkey_size, Py_BuildValue("f", style.size));
+                DICT_SETITEM_DROP(span, dictkey_flags, Py_BuildValue("i", style.flags));
+                DICT_SETITEM_DROP(span, dictkey_font, font);
+                DICT_SETITEM_DROP(span, dictkey_color, Py_BuildValue("i", style.color));
+            }
 
             old_style = style;
             span_rect = r;
@@ -226,16 +753,29 @@ static PyObject *JM_make_spanlist(fz_context *ctx, fz_stext_line *line, int raw,
         span_rect = fz_union_rect(span_rect, r);
         if (raw)  // make and append a char dict
         {
-            char_dict = PyDict_New();
+            if (compact)
+            {
+                char_dict = PyStructSequence_New(&JM_TextCharType);
+                PyStructSequence_SET_ITEM(char_dict, 0,
+                              Py_BuildValue("ff", ch->origin.x, ch->origin.y));
+                PyStructSequence_SET_ITEM(char_dict, 1,
+                              Py_BuildValue("ffff", r.x0, r.y0, r.x1, r.y1));
+                PyStructSequence_SET_ITEM(char_dict, 2,
+                              Py_BuildValue("C", ch->c));
+            }
+            else
+            {
+                char_dict = PyDict_New();
 
-            DICT_SETITEM_DROP(char_dict, dictkey_origin,
-                          Py_BuildValue("ff", ch->origin.x, ch->origin.y));
+                DICT_SETITEM_DROP(char_dict, dictkey_origin,
+                              Py_BuildValue("ff", ch->origin.x, ch->origin.y));
 
-            DICT_SETITEM_DROP(char_dict, dictkey_bbox,
-                          Py_BuildValue("ffff", r.x0, r.y0, r.x1, r.y1));
+                DICT_SETITEM_DROP(char_dict, dictkey_bbox,
+                              Py_BuildValue("ffff", r.x0, r.y0, r.x1, r.y1));
 
-            DICT_SETITEM_DROP(char_dict, dictkey_c,
-                          Py_BuildValue("C", ch->c));
+                DICT_SETITEM_DROP(char_dict, dictkey_c,
+                              Py_BuildValue("C", ch->c));
+            }
 
             if (!char_list)
             {
@@ -251,20 +791,8 @@ static PyObject *JM_make_spanlist(fz_context *ctx, fz_stext_line *line, int raw,
     // all characters processed, now flush remaining span
     if (span)
     {
-        if (raw)
-        {
-            DICT_SETITEM_DROP(span, dictkey_chars, char_list);
-            char_list = NULL;
-        }
-        else
-        {
-            DICT_SETITEM_DROP(span, dictkey_text, JM_EscapeStrFromBuffer(ctx, buff));
-            fz_clear_buffer(ctx, buff);
-        }
-        DICT_SETITEM_DROP(span, dictkey_bbox, JM_py_from_rect(span_rect));
-
-        LIST_APPEND_DROP(span_list, span);
-        span = NULL;
+        JM_flush_span(ctx, span_list, span, char_list, buff,
+                      span_rect, raw, compact);
     }
     return span_list;
 }
@@ -328,7 +856,7 @@ static void JM_make_image_block(fz_context *ctx, fz_stext_block *block, PyObject
     return;
 }
 
-static void JM_make_text_block(fz_context *ctx, fz_stext_block *block, PyObject *block_dict, int raw, fz_buffer *buff)
+static void JM_make_text_block(fz_context *ctx, fz_stext_block *block, PyObject *block_dict, int raw, fz_buffer *buff, int compact)
 {
     fz_stext_line *line;
     PyObject *line_list = PyList_New(0), *line_dict;
@@ -344,7 +872,7 @@ static void JM_make_text_block(fz_context *ctx, fz_stext_block *block, PyObject
         DICT_SETITEM_DROP(line_dict, dictkey_bbox,
                       JM_py_from_rect(line->bbox));
         DICT_SETITEM_DROP(line_dict, dictkey_spans,
-                       JM_make_spanlist(ctx, line, raw, buff));
+                       JM_make_spanlist(ctx, line, raw, buff, compact));
 
         LIST_APPEND_DROP(line_list, line_dict);
     }
@@ -352,7 +880,79 @@ static void JM_make_text_block(fz_context *ctx, fz_stext_block *block, PyObject
     return;
 }
 
-void JM_make_textpage_dict(fz_context *ctx, fz_stext_page *tp, PyObject *page_dict, int raw)
+//-----------------------------------------------------------------------------
+// Functions for lazy access: locate block number n of a text page and line
+// number n of a text block. Return NULL if not existing.
+// The last block and line found are remembered, so looking up the same or
+// following items - which is what the iterators of TextPage do - does not
+// walk the lists from their start again. JM_stext_forget must be called
+// before a text page is dropped.
+//-----------------------------------------------------------------------------
+static struct {
+    fz_stext_page *tp;
+    int block_n;
+    fz_stext_block *block;
+    int line_n;
+    fz_stext_line *line;
+} JM_stext_cursor = {NULL, 0, NULL, 0, NULL};
+
+void JM_stext_forget(fz_stext_page *tp)
+{
+    if (JM_stext_cursor.tp == tp) {
+        JM_stext_cursor.tp = NULL;
+        JM_stext_cursor.block = NULL;
+        JM_stext_cursor.line = NULL;
+    }
+}
+
+fz_stext_block *JM_stext_block(fz_stext_page *tp, int n)
+{
+    fz_stext_block *block = tp->first_block;
+    int i = 0;
+    if (n < 0) return NULL;
+    if (JM_stext_cursor.tp == tp && JM_stext_cursor.block &&
+        JM_stext_cursor.block_n <= n) {
+        block = JM_stext_cursor.block;
+        i = JM_stext_cursor.block_n;
+    }
+    for (; block; block = block->next) {
+        if (i == n) break;
+        i++;
+    }
+    if (!block) return NULL;
+    if (JM_stext_cursor.tp != tp || JM_stext_cursor.block != block) {
+        JM_stext_cursor.line = NULL;  // line cursor belongs to the block
+    }
+    JM_stext_cursor.tp = tp;
+    JM_stext_cursor.block_n = n;
+    JM_stext_cursor.block = block;
+    return block;
+}
+
+// 'block' must have been located by JM_stext_block
+fz_stext_line *JM_stext_line(fz_stext_block *block, int n)
+{
+    fz_stext_line *line;
+    int i = 0;
+    if (!block || block->type != FZ_STEXT_BLOCK_TEXT || n < 0) return NULL;
+    line = block->u.t.first_line;
+    if (JM_stext_cursor.block == block && JM_stext_cursor.line &&
+        JM_stext_cursor.line_n <= n) {
+        line = JM_stext_cursor.line;
+        i = JM_stext_cursor.line_n;
+    }
+    for (; line; line = line->next) {
+        if (i == n) break;
+        i++;
+    }
+    if (line && JM_stext_cursor.block == block) {
+        JM_stext_cursor.line_n = n;
+        JM_stext_cursor.line = line;
+    }
+    return line;
+}
+
+void JM_make_textpage_dict(fz_context *ctx, fz_stext_page *tp, PyObject *page_dict, int raw, int compact)
 {
     fz_stext_block *block;
     fz_buffer *text_buffer = fz_new_buffer(ctx, 64);
@@ -370,7 +970,7 @@ void JM_make_textpage_dict(fz_context *ctx, fz_stext_page *tp, PyObject *page_di
         }
         else
         {
-            JM_make_text_block(ctx, block, block_dict, raw, text_buffer);
+            JM_make_text_block(ctx, block, block_dict, raw, text_buffer, compact);
         }
 
         LIST_APPEND_DROP(block_list, block_dict);
@@ -578,4 +1178,406 @@ fz_font *JM_get_font(fz_context *ctx,
     return font;
 }
 
+//-----------------------------------------------------------------------------
+// Process-wide cache of fonts made by JM_get_font.
+// Entries are identified by the MD5 digest of all arguments, which includes
+// the content of 'fontbuffer' (font files are identified by name only).
+// The cache holds a reference to each font, most recently used first. When
+// it exceeds JM_font_cache_max entries, the least recently used font is
+// dropped.
+//-----------------------------------------------------------------------------
+#define JM_FONT_CACHE_LIMIT 1024
+
+typedef struct
+{
+    unsigned char digest[16];
+    fz_font *font;
+    PyObject *advances;  // glyph advance caches of Font.text_lengths
+} JM_font_cache_entry;
+
+static JM_font_cache_entry JM_font_cache[JM_FONT_CACHE_LIMIT];
+static int JM_font_cache_len = 0;
+static int JM_font_cache_max = 64;
+static int JM_font_cache_hits = 0;
+static int JM_font_cache_misses = 0;
+
+static void
+JM_md5_string(fz_md5 *state, const char *s)
+{
+    if (!s) {  // distinguish NULL from empty strings
+        fz_md5_update(state, (const unsigned char *) "", 1);
+        return;
+    }
+    fz_md5_update(state, (const unsigned char *) "s", 1);
+    fz_md5_update(state, (const unsigned char *) s, strlen(s) + 1);
+}
+
+static void
+JM_font_cache_key(fz_context *ctx, unsigned char digest[16],
+    char *fontname, char *fontfile, PyObject *fontbuffer, int script,
+    int lang, int ordering, int is_bold, int is_italic, int is_serif)
+{
+    fz_md5 state;
+    char text[100];
+    fz_buffer *res = NULL;
+    unsigned char *data;
+    size_t len;
+    fz_md5_init(&state);
+    fz_snprintf(text, sizeof(text), "%d %d %d %d %d %d", script, lang,
+                ordering, is_bold, is_italic, is_serif);
+    JM_md5_string(&state, text);
+    JM_md5_string(&state, fontname);
+    JM_md5_string(&state, fontfile);
+    if (!fontfile && EXISTS(fontbuffer)) {
+        if (PyBytes_Check(fontbuffer)) {
+            fz_md5_update(&state, (unsigned char *) PyBytes_AS_STRING(fontbuffer),
+                          (size_t) PyBytes_GET_SIZE(fontbuffer));
+        } else if (PyByteArray_Check(fontbuffer)) {
+            fz_md5_update(&state, (unsigned char *) PyByteArray_AS_STRING(fontbuffer),
+                          (size_t) PyByteArray_GET_SIZE(fontbuffer));
+        } else {
+            res = JM_BufferFromBytes(ctx, fontbuffer);
+            if (res) {
+                len = fz_buffer_storage(ctx, res, &data);
+                fz_md5_update(&state, data, len);
+                fz_drop_buffer(ctx, res);
+            }
+        }
+    }
+    fz_md5_final(&state, digest);
+}
+
+// drop least recently used fonts until at most 'n' are left
+static void
+JM_font_cache_shrink(fz_context *ctx, int n)
+{
+    if (n < 0) n = 0;
+    while (JM_font_cache_len > n) {
+        JM_font_cache_len--;
+        fz_drop_font(ctx, JM_font_cache[JM_font_cache_len].font);
+        JM_font_cache[JM_font_cache_len].font = NULL;
+        Py_CLEAR(JM_font_cache[JM_font_cache_len].advances);
+    }
+}
+
+fz_font *JM_get_font_cached(fz_context *ctx,
+    char *fontname,
+    char *fontfile,
+    PyObject *fontbuffer,
+    int script,
+    int lang,
+    int ordering,
+    int is_bold,
+    int is_italic,
+    int is_serif)
+{
+    unsigned char digest[16];
+    JM_font_cache_entry entry;
+    fz_font *font;
+    int i;
+    if (JM_font_cache_max < 1) {
+        JM_font_cache_misses++;
+        return JM_get_font(ctx, fontname, fontfile, fontbuffer, script,
+                           lang, ordering, is_bold, is_italic, is_serif);
+    }
+    JM_font_cache_key(ctx, digest, fontname, fontfile, fontbuffer, script,
+                      lang, ordering, is_bold, is_italic, is_serif);
+    for (i = 0; i < JM_font_cache_len; i++) {
+        if (memcmp(JM_font_cache[i].digest, digest, 16) != 0) continue;
+        entry = JM_font_cache[i];  // move to front
+        memmove(&JM_font_cache[1], &JM_font_cache[0], i * sizeof(entry));
+        JM_font_cache[0] = entry;
+        JM_font_cache_hits++;
+        return fz_keep_font(ctx, entry.font);
+    }
+    font = JM_get_font(ctx, fontname, fontfile, fontbuffer, script,
+                       lang, ordering, is_bold, is_italic, is_serif);
+    JM_font_cache_misses++;
+    JM_font_cache_shrink(ctx, JM_font_cache_max - 1);
+    memmove(&JM_font_cache[1], &JM_font_cache[0],
+            JM_font_cache_len * sizeof(entry));
+    memcpy(JM_font_cache[0].digest, digest, 16);
+    JM_font_cache[0].font = fz_keep_font(ctx, font);
+    JM_font_cache[0].advances = NULL;
+    JM_font_cache_len++;
+    return font;
+}
+
+//-----------------------------------------------------------------------------
+// Dict of glyph advance caches shared by all Font objects of a font in the
+// font cache (made on first use), or None if the font is not cached.
+//-----------------------------------------------------------------------------
+PyObject *JM_font_advances(fz_font *font)
+{
+    int i;
+    for (i = 0; i < JM_font_cache_len; i++) {
+        if (JM_font_cache[i].font != font) continue;
+        if (!JM_font_cache[i].advances) {
+            JM_font_cache[i].advances = PyDict_New();
+            if (!JM_font_cache[i].advances) return NULL;
+        }
+        Py_INCREF(JM_font_cache[i].advances);
+        return JM_font_cache[i].advances;
+    }
+    Py_RETURN_NONE;
+}
+
+//-----------------------------------------------------------------------------
+// Advance of a unicode for fontsize 1, using a cache: 'bmp' contains 65536
+// floats (NaN if not yet known), 'other' is a dict for unicodes beyond.
+//-----------------------------------------------------------------------------
+static float
+JM_cached_advance(fz_context *ctx, fz_font *font, int c, float *bmp,
+                  PyObject *other, int lang, int script, int wmode)
+{
+    fz_font *out_font = NULL;
+    PyObject *key = NULL, *val;
+    float adv;
+    int gid;
+    if (c < 65536) {
+        adv = bmp[c];
+        if (adv == adv) return adv;  // not NaN: known
+    } else {
+        key = PyLong_FromLong((long) c);
+        val = PyDict_GetItem(other, key);
+        if (val) {
+            Py_DECREF(key);
+            return (float) PyFloat_AsDouble(val);
+        }
+    }
+    gid = fz_encode_character_with_fallback(ctx, font, c, script, lang, &out_font);
+    adv = fz_advance_glyph(ctx, out_font, gid, wmode);
+    if (c < 65536) {
+        bmp[c] = adv;
+    } else {
+        val = PyFloat_FromDouble((double) adv);
+        PyDict_SetItem(other, key, val);
+        Py_DECREF(val);
+        Py_DECREF(key);
+    }
+    return adv;
+}
+
+//-----------------------------------------------------------------------------
+// List of the lengths of a sequence of strings
+//-----------------------------------------------------------------------------
+PyObject *JM_text_lengths(fz_context *ctx, fz_font *font, PyObject *texts,
+                          float fontsize, float *bmp, PyObject *other,
+                          int lang, int script, int wmode)
+{
+    PyObject *seq = NULL, *rc = NULL, *item, *b = NULL;
+    Py_ssize_t i, n, len = 0;
+    char *s, *end;
+    int c, codes;
+    float w;
+    fz_var(seq);
+    fz_var(rc);
+    fz_var(b);
+    fz_try(ctx) {
+        seq = PySequence_Fast(texts, "");
+        if (!seq) {
+            PyErr_Clear();
+            fz_throw(ctx, FZ_ERROR_GENERIC, "texts must be a sequence");
+        }
+        n = PySequence_Fast_GET_SIZE(seq);
+        rc = PyList_New(n);
+        for (i = 0; i < n; i++) {
+            item = PySequence_Fast_GET_ITEM(seq, i);
+            codes = 0;
+#if PY_VERSION_HEX >= 0x03000000
+            s = (char *) PyUnicode_AsUTF8AndSize(item, &len);
+#else
+            s = NULL;
+            if (PyString_Check(item)) {  // every byte is a character code
+                PyString_AsStringAndSize(item, &s, &len);
+                codes = 1;
+            } else {
+                Py_CLEAR(b);
+                b = PyUnicode_AsUTF8String(item);
+                if (b) PyString_AsStringAndSize(b, &s, &len);
+            }
+#endif
+            if (!s) {
+                PyErr_Clear();
+                fz_throw(ctx, FZ_ERROR_GENERIC, "texts must be strings");
+            }
+            end = s + len;
+            w = 0;
+            while (s < end) {
+                if (codes) {
+                    c = (unsigned char) *s++;
+                } else {
+                    s += fz_chartorune(&c, s);
+                }
+                w += JM_cached_advance(ctx, font, c, bmp, other, lang, script, wmode);
+            }
+            PyList_SET_ITEM(rc, i, PyFloat_FromDouble((double) (w * fontsize)));
+        }
+    }
+    fz_always(ctx) {
+        Py_CLEAR(seq);
+        Py_CLEAR(b);
+    }
+    fz_catch(ctx) {
+        Py_CLEAR(rc);
+        fz_rethrow(ctx);
+    }
+    return rc;
+}
+
+//-----------------------------------------------------------------------------
+// Device recording which glyphs of certain font files are used.
+// Fonts are identified by the MD5 digest of their font file, so glyphs of
+// all font objects made from the same file are recorded together.
+//-----------------------------------------------------------------------------
+typedef struct
+{
+    fz_device super;
+    int n;                          // number of font files
+    unsigned char (*digests)[16];   // their MD5 digests
+    unsigned char *used;            // one bitmap of 65536 glyphs per file
+} jm_glyph_device;
+
+static void
+JM_record_glyphs(fz_context *ctx, fz_device *dev_, const fz_text *text)
+{
+    jm_glyph_device *dev = (jm_glyph_device *) dev_;
+    fz_text_span *span;
+    unsigned char digest[16], *used;
+    int i, k, gid;
+    for (span = text->head; span; span = span->next) {
+        if (!span->font->buffer) continue;  // e.g. Type 3 fonts
+        fz_font_digest(ctx, span->font, digest);
+        for (k = 0; k < dev->n; k++) {
+            if (memcmp(dev->digests[k], digest, 16) != 0) continue;
+            used = dev->used + k * 8192;
+            for (i = 0; i < span->len; i++) {
+                gid = span->items[i].gid;
+                if (gid >= 0 && gid < 65536) used[gid >> 3] |= 1 << (gid & 7);
+            }
+        }
+    }
+}
+
+static void
+jm_glyph_fill_text(fz_context *ctx, fz_device *dev, const fz_text *text, fz_matrix ctm,
+        fz_colorspace *cs, const float *color, float alpha, fz_color_params cp)
+{
+    JM_record_glyphs(ctx, dev, text);
+}
+
+static void
+jm_glyph_stroke_text(fz_context *ctx, fz_device *dev, const fz_text *text,
+        const fz_stroke_state *stroke, fz_matrix ctm,
+        fz_colorspace *cs, const float *color, float alpha, fz_color_params cp)
+{
+    JM_record_glyphs(ctx, dev, text);
+}
+
+static void
+jm_glyph_clip_text(fz_context *ctx, fz_device *dev, const fz_text *text, fz_matrix ctm,
+        fz_rect scissor)
+{
+    JM_record_glyphs(ctx, dev, text);
+}
+
+static void
+jm_glyph_clip_stroke_text(fz_context *ctx, fz_device *dev, const fz_text *text,
+        const fz_stroke_state *stroke, fz_matrix ctm, fz_rect scissor)
+{
+    JM_record_glyphs(ctx, dev, text);
+}
+
+static void
+jm_glyph_ignore_text(fz_context *ctx, fz_device *dev, const fz_text *text, fz_matrix ctm)
+{
+    JM_record_glyphs(ctx, dev, text);
+}
+
+//-----------------------------------------------------------------------------
+// Return the glyphs used on all pages (including annotations) with each of
+// the font files given by their stream xrefs: a list of lists of glyph ids.
+//-----------------------------------------------------------------------------
+PyObject *
+JM_glyph_usage(fz_context *ctx, fz_document *doc, PyObject *xrefs)
+{
+    pdf_document *pdf = pdf_specifics(ctx, doc);
+    jm_glyph_device *dev = NULL;
+    fz_buffer *buf = NULL;
+    fz_page *page = NULL;
+    fz_md5 state;
+    unsigned char (*digests)[16] = NULL, *used = NULL, *data;
+    PyObject *rc = NULL, *gids;
+    size_t len;
+    int i, k, n, xref, pno;
+    fz_var(dev);
+    fz_var(buf);
+    fz_var(page);
+    fz_var(digests);
+    fz_var(used);
+    fz_var(rc);
+    fz_try(ctx) {
+        ASSERT_PDF(pdf);
+        n = (int) PySequence_Size(xrefs);
+        if (n < 0) {
+            PyErr_Clear();
+            THROWMSG("xrefs must be a sequence");
+        }
+        digests = fz_malloc(ctx, (n + 1) * sizeof(*digests));
+        used = fz_calloc(ctx, n + 1, 8192);
+        for (k = 0; k < n; k++) {
+            if (JM_INT_ITEM(xrefs, k, &xref) == 1 ||
+                !INRANGE(xref, 1, pdf_xref_len(ctx, pdf) - 1)) {
+                THROWMSG("bad xref");
+            }
+            buf = pdf_load_stream_number(ctx, pdf, xref);
+            len = fz_buffer_storage(ctx, buf, &data);
+            fz_md5_init(&state);
+            fz_md5_update(&state, data, len);
+            fz_md5_final(&state, digests[k]);
+            fz_drop_buffer(ctx, buf);
+            buf = NULL;
+        }
+
+        dev = fz_new_derived_device(ctx, jm_glyph_device);
+        dev->super.fill_text = jm_glyph_fill_text;
+        dev->super.stroke_text = jm_glyph_stroke_text;
+        dev->super.clip_text = jm_glyph_clip_text;
+        dev->super.clip_stroke_text = jm_glyph_clip_stroke_text;
+        dev->super.ignore_text = jm_glyph_ignore_text;
+        dev->n = n;
+        dev->digests = digests;
+        dev->used = used;
+        for (pno = 0; pno < fz_count_pages(ctx, doc); pno++) {
+            page = fz_load_page(ctx, doc, pno);
+            fz_run_page(ctx, page, (fz_device *) dev, fz_identity, NULL);
+            fz_drop_page(ctx, page);
+            page = NULL;
+        }
+        fz_close_device(ctx, (fz_device *) dev);
+
+        rc = PyList_New((Py_ssize_t) n);
+        for (k = 0; k < n; k++) {
+            gids = PyList_New(0);
+            for (i = 0; i < 65536; i++) {
+                if (used[k * 8192 + (i >> 3)] & (1 << (i & 7)))
+                    LIST_APPEND_DROP(gids, Py_BuildValue("i", i));
+            }
+            PyList_SET_ITEM(rc, k, gids);
+        }
+    }
+    fz_always(ctx) {
+        fz_drop_page(ctx, page);
+        fz_drop_buffer(ctx, buf);
+        fz_drop_device(ctx, (fz_device *) dev);
+        fz_free(ctx, digests);
+        fz_free(ctx, used);
+    }
+    fz_catch(ctx) {
+        Py_CLEAR(rc);
+        fz_rethrow(ctx);
+    }
+    return rc;
+}
+
 %}
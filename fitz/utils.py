@@ -1,8 +1,13 @@
 from __future__ import division
 
+import hashlib
 import io
+import json
 import math
+import mmap
 import os
+import string
+import struct
 import warnings
 
 from fitz import *
@@ -396,13 +401,49 @@ def searchPageFor(doc, pno, text, hit_max=16, quads=False, flags=None):
     return doc[pno].searchFor(text, hit_max=hit_max, quads=quads, flags=flags)
 
 
-def getTextBlocks(page, flags=None):
+def search(doc, needle, pages=None, max_hits=None, flags=None):
+    """Generate the occurrences of a string in a document.
+
+    Notes:
+        Every page with hits yields one item. To distribute work across
+        processes, give each of them a part of the page numbers.
+    Args:
+        needle: (str) string to be searched for.
+        pages: (iterable) page numbers to search, default all pages.
+        max_hits: (int) stop after this many quads, default no limit.
+        flags: (int) control the amount of data parsed into the textpage.
+    Returns:
+        A generator of tuples (pno, quads), quads being a list of Quad
+        objects. There is no limit on the number of hits per page.
+    """
+    if flags is None:
+        flags = TEXT_PRESERVE_LIGATURES | TEXT_PRESERVE_WHITESPACE
+    if pages is None:
+        pages = range(len(doc))
+    if not needle.split():
+        return
+    budget = max_hits
+    for pno in pages:
+        if budget is not None and budget <= 0:
+            return
+        tp = doc[pno].getTextPage(flags)
+        hits = tp.search(needle, hit_max=budget if budget else 0, quads=True)
+        tp = None
+        if not hits:
+            continue
+        if budget is not None:
+            budget -= len(hits)
+        yield pno, hits
+
+
+def getTextBlocks(page, flags=None, clip=None):
     """Return the text blocks on a page.
 
     Notes:
         Lines in a block are concatenated with line breaks.
     Args:
         flags: (int) control the amount of data parsed into the textpage.
+        clip: (rect-like) only consider text inside this area.
     Returns:
         A list of the blocks. Each item contains the containing rectangle
         coordinates, text lines, block type and running block number.
@@ -410,36 +451,38 @@ def getTextBlocks(page, flags=None):
     CheckParent(page)
     if flags is None:
         flags = TEXT_PRESERVE_LIGATURES | TEXT_PRESERVE_WHITESPACE
-    tp = page.getTextPage(flags)
+    tp = page.getTextPage(flags, clip=clip)
     l = []
     tp.extractBLOCKS(l)
     del tp
     return l
 
 
-def getTextWords(page, flags=None):
+def getTextWords(page, flags=None, clip=None):
     """Return the text words as a list with the bbox for each word.
 
     Args:
         flags: (int) control the amount of data parsed into the textpage.
+        clip: (rect-like) only consider text inside this area.
     """
     CheckParent(page)
     if flags is None:
         flags = TEXT_PRESERVE_LIGATURES | TEXT_PRESERVE_WHITESPACE
-    tp = page.getTextPage(flags)
+    tp = page.getTextPage(flags, clip=clip)
     l = []
     tp.extractWORDS(l)
     del tp
     return l
 
 
-def getText(page, option="text", flags=None):
+def getText(page, option="text", flags=None, clip=None):
     """ Extract a document page's text.
 
     This is a unifying wrapper for various methods of Page / TextPage classes.
 
     Args:
         option: (str) text, words, blocks, html, dict, json, rawdict, xhtml or xml.
+        clip: (rect-like) only extract text and images inside this area.
 
     Returns:
         the output of Page methods getTextWords / getTextBlocks or TextPage
@@ -449,9 +492,9 @@ def getText(page, option="text", flags=None):
     """
     option = option.lower()
     if option == "words":
-        return getTextWords(page, flags=flags)
+        return getTextWords(page, flags=flags, clip=clip)
     if option == "blocks":
-        return getTextBlocks(page, flags=flags)
+        return getTextBlocks(page, flags=flags, clip=clip)
     CheckParent(page)
     # available output types
     formats = ("text", "html", "json", "xml", "xhtml", "dict", "rawdict")
@@ -465,7 +508,7 @@ def getText(page, option="text", flags=None):
         if images[f] == 1:
             flags |= TEXT_PRESERVE_IMAGES
 
-    tp = page.getTextPage(flags)  # TextPage with or without images
+    tp = page.getTextPage(flags, clip=clip)  # TextPage with or without images
 
     if f == 2:
         t = tp.extractJSON()
@@ -2359,6 +2402,26 @@ def getCharWidths(doc, xref, limit=256, idx=0):
     return glyphs
 
 
+class _ContentBuffer(object):
+    """Collect strings like io.StringIO, accepting str and unicode."""
+
+    def __init__(self):
+        self._parts = []
+        self._len = 0
+
+    def write(self, s):
+        self._parts.append(s)
+        self._len += len(s)
+
+    def getvalue(self):
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def tell(self):
+        return self._len
+
+
 class Shape(object):
     """Create a new shape."""
 
@@ -2396,12 +2459,49 @@ class Shape(object):
         self.pctm = page.transformationMatrix  # page transf. matrix
         self.ipctm = ~self.pctm  # inverted transf. matrix
 
-        self.draw_cont = ""
-        self.text_cont = ""
-        self.totalcont = ""
+        self._draw_buf = self._new_buffer()
+        self._text_buf = self._new_buffer()
+        self._total_buf = self._new_buffer()
         self.lastPoint = None
         self.rect = None
 
+    # Contents are collected in growable buffers instead of concatenated
+    # strings. Python 2 code may write str and unicode: use a list there.
+    _buffer_type = _ContentBuffer if fitz_py2 else io.StringIO
+
+    def _new_buffer(self, value=""):
+        buf = self._buffer_type()
+        if value:
+            buf.write(value)
+        return buf
+
+    @property
+    def draw_cont(self):
+        """Draw commands since last finish."""
+        return self._draw_buf.getvalue()
+
+    @draw_cont.setter
+    def draw_cont(self, value):
+        self._draw_buf = self._new_buffer(value)
+
+    @property
+    def text_cont(self):
+        """Accumulated text insertions."""
+        return self._text_buf.getvalue()
+
+    @text_cont.setter
+    def text_cont(self, value):
+        self._text_buf = self._new_buffer(value)
+
+    @property
+    def totalcont(self):
+        """Accumulated contents of finished draws."""
+        return self._total_buf.getvalue()
+
+    @totalcont.setter
+    def totalcont(self, value):
+        self._total_buf = self._new_buffer(value)
+
     def updateRect(self, x):
         if self.rect is None:
             if len(x) == 2:
@@ -2429,11 +2529,11 @@ class Shape(object):
         p1 = Point(p1)
         p2 = Point(p2)
         if not (self.lastPoint == p1):
-            self.draw_cont += "%g %g m\n" % JM_TUPLE(p1 * self.ipctm)
+            self._draw_buf.write("%g %g m\n" % JM_TUPLE(p1 * self.ipctm))
             self.lastPoint = p1
             self.updateRect(p1)
 
-        self.draw_cont += "%g %g l\n" % JM_TUPLE(p2 * self.ipctm)
+        self._draw_buf.write("%g %g l\n" % JM_TUPLE(p2 * self.ipctm))
         self.updateRect(p2)
         self.lastPoint = p2
         return self.lastPoint
@@ -2444,10 +2544,10 @@ class Shape(object):
         for i, p in enumerate(points):
             if i == 0:
                 if not (self.lastPoint == Point(p)):
-                    self.draw_cont += "%g %g m\n" % JM_TUPLE(Point(p) * self.ipctm)
+                    self._draw_buf.write("%g %g m\n" % JM_TUPLE(Point(p) * self.ipctm))
                     self.lastPoint = Point(p)
             else:
-                self.draw_cont += "%g %g l\n" % JM_TUPLE(Point(p) * self.ipctm)
+                self._draw_buf.write("%g %g l\n" % JM_TUPLE(Point(p) * self.ipctm))
             self.updateRect(p)
 
         self.lastPoint = Point(points[-1])
@@ -2461,10 +2561,10 @@ class Shape(object):
         p3 = Point(p3)
         p4 = Point(p4)
         if not (self.lastPoint == p1):
-            self.draw_cont += "%g %g m\n" % JM_TUPLE(p1 * self.ipctm)
-        self.draw_cont += "%g %g %g %g %g %g c\n" % JM_TUPLE(
+            self._draw_buf.write("%g %g m\n" % JM_TUPLE(p1 * self.ipctm))
+        self._draw_buf.write("%g %g %g %g %g %g c\n" % JM_TUPLE(
             list(p2 * self.ipctm) + list(p3 * self.ipctm) + list(p4 * self.ipctm)
-        )
+        ))
         self.updateRect(p1)
         self.updateRect(p2)
         self.updateRect(p3)
@@ -2487,7 +2587,7 @@ class Shape(object):
         mb = q.ll + (q.lr - q.ll) * 0.5
         ml = q.ul + (q.ll - q.ul) * 0.5
         if not (self.lastPoint == ml):
-            self.draw_cont += "%g %g m\n" % JM_TUPLE(ml * self.ipctm)
+            self._draw_buf.write("%g %g m\n" % JM_TUPLE(ml * self.ipctm))
             self.lastPoint = ml
         self.drawCurve(ml, q.ll, mb)
         self.drawCurve(mb, q.lr, mr)
@@ -2532,7 +2632,7 @@ class Shape(object):
         while abs(betar) > 2 * math.pi:
             betar += w360  # bring angle below 360 degrees
         if not (self.lastPoint == point):
-            self.draw_cont += l3 % JM_TUPLE(point * self.ipctm)
+            self._draw_buf.write(l3 % JM_TUPLE(point * self.ipctm))
             self.lastPoint = point
         Q = Point(0, 0)  # just make sure it exists
         C = center
@@ -2555,9 +2655,9 @@ class Shape(object):
             kappa = kappah * abs(P - Q)
             cp1 = P + (R - P) * kappa  # control point 1
             cp2 = Q + (R - Q) * kappa  # control point 2
-            self.draw_cont += l4 % JM_TUPLE(
+            self._draw_buf.write(l4 % JM_TUPLE(
                 list(cp1 * self.ipctm) + list(cp2 * self.ipctm) + list(Q * self.ipctm)
-            )
+            ))
 
             betar -= w90  # reduce parm angle by 90 deg
             alfa += w90  # advance start angle by 90 deg
@@ -2576,13 +2676,13 @@ class Shape(object):
             kappa = kappah * abs(P - Q) / (1 - math.cos(betar))
             cp1 = P + (R - P) * kappa  # control point 1
             cp2 = Q + (R - Q) * kappa  # control point 2
-            self.draw_cont += l4 % JM_TUPLE(
+            self._draw_buf.write(l4 % JM_TUPLE(
                 list(cp1 * self.ipctm) + list(cp2 * self.ipctm) + list(Q * self.ipctm)
-            )
+            ))
         if fullSector:
-            self.draw_cont += l3 % JM_TUPLE(point * self.ipctm)
-            self.draw_cont += l5 % JM_TUPLE(center * self.ipctm)
-            self.draw_cont += l5 % JM_TUPLE(Q * self.ipctm)
+            self._draw_buf.write(l3 % JM_TUPLE(point * self.ipctm))
+            self._draw_buf.write(l5 % JM_TUPLE(center * self.ipctm))
+            self._draw_buf.write(l5 % JM_TUPLE(Q * self.ipctm))
         self.lastPoint = Q
         return self.lastPoint
 
@@ -2590,9 +2690,9 @@ class Shape(object):
         """Draw a rectangle.
         """
         r = Rect(rect)
-        self.draw_cont += "%g %g %g %g re\n" % JM_TUPLE(
+        self._draw_buf.write("%g %g %g %g re\n" % JM_TUPLE(
             list(r.bl * self.ipctm) + [r.width, r.height]
-        )
+        ))
         self.updateRect(r)
         self.lastPoint = r.tl
         return self.lastPoint
@@ -2603,6 +2703,147 @@ class Shape(object):
         q = Quad(quad)
         return self.drawPolyline([q.ul, q.ll, q.lr, q.ur, q.ul])
 
+    # ==============================================================================
+    # Batch drawing: coordinates are handled as flat lists of floats
+    # ==============================================================================
+    def _transform_floats(self, v):
+        """Transform flat point coordinates [x0, y0, x1, y1, ...] by ipctm."""
+        a, b, c, d, e, f = self.ipctm
+        xs = v[0::2]
+        ys = v[1::2]
+        t = [0.0] * len(v)
+        t[0::2] = [x * a + y * c + e for x, y in zip(xs, ys)]
+        t[1::2] = [x * b + y * d + f for x, y in zip(xs, ys)]
+        return t
+
+    def _update_rect_floats(self, xs, ys):
+        """Include the coordinates of some points in the shape rectangle."""
+        if xs:
+            self.updateRect(Rect(min(xs), min(ys), max(xs), max(ys)))
+
+    def draw_rects(self, rects):
+        """Draw many rectangles.
+
+        Args:
+            rects: RectArray or sequence of rect-like objects.
+        Returns:
+            Top-left corner of the last rectangle.
+        """
+        if isinstance(rects, RectArray):
+            v = rects.data.tolist()
+        else:
+            v = []
+            for r in rects:
+                if len(r) != 4:
+                    raise ValueError("bad sequ. length")
+                v.extend(r)
+        if not v:
+            return self.lastPoint
+        x0, y0, x1, y1 = v[0::4], v[1::4], v[2::4], v[3::4]
+        bl = [0.0] * (len(v) // 2)  # bottom-left corners
+        bl[0::2] = x0
+        bl[1::2] = y1
+        bl = self._transform_floats(bl)
+        w = [0.0] * len(v)  # the operands of all 're' operators
+        w[0::4] = bl[0::2]
+        w[1::4] = bl[1::2]
+        w[2::4] = [abs(x1[i] - x0[i]) for i in range(len(x0))]
+        w[3::4] = [abs(y1[i] - y0[i]) for i in range(len(y0))]
+        self._draw_buf.write(("%g %g %g %g re\n" * len(x0)) % JM_TUPLE(w))
+        # the union of the normalized rectangles
+        self.updateRect(
+            Rect(
+                min(min(x0), min(x1)),
+                min(min(y0), min(y1)),
+                max(max(x0), max(x1)),
+                max(max(y0), max(y1)),
+            )
+        )
+        self.lastPoint = Point(x0[-1], y0[-1])
+        return self.lastPoint
+
+    def draw_lines(self, lines):
+        """Draw many separate lines.
+
+        Args:
+            lines: sequence of point pairs (p1, p2) or of 4 numbers
+                (x1, y1, x2, y2), or a RectArray with the same layout.
+        Returns:
+            End point of the last line.
+        """
+        if isinstance(lines, RectArray):
+            v = lines.data.tolist()
+        else:
+            v = []
+            for line in lines:
+                if len(line) == 2:
+                    v.extend(line[0])
+                    v.extend(line[1])
+                elif len(line) == 4:
+                    v.extend(line)
+                else:
+                    raise ValueError("bad sequ. length")
+        if not v:
+            return self.lastPoint
+        t = self._transform_floats(v)
+        # like drawLine, only move to a start point that is not the last point
+        templ = []
+        ops = []
+        last = self.lastPoint
+        lx, ly = (None, None) if last is None else last
+        for i in range(0, len(v), 4):
+            if v[i] != lx or v[i + 1] != ly:
+                templ.append("%g %g m\n%g %g l\n")
+                ops.extend(t[i : i + 4])
+            else:
+                templ.append("%g %g l\n")
+                ops.extend(t[i + 2 : i + 4])
+            lx, ly = v[i + 2], v[i + 3]
+        self._draw_buf.write("".join(templ) % JM_TUPLE(ops))
+        self._update_rect_floats(v[0::2], v[1::2])
+        self.lastPoint = Point(v[-2], v[-1])
+        return self.lastPoint
+
+    def draw_polylines(self, polylines):
+        """Draw many separate polylines.
+
+        Args:
+            polylines: sequence of PointArray objects or point sequences.
+        Returns:
+            Last point of the last polyline.
+        """
+        v = []  # all coordinates
+        templ = []  # one operator per point
+        last = self.lastPoint
+        lx, ly = (None, None) if last is None else last
+        for points in polylines:
+            if isinstance(points, PointArray):
+                coords = points.data.tolist()
+            else:
+                coords = []
+                for p in points:
+                    if len(p) != 2:
+                        raise ValueError("bad sequ. length")
+                    coords.extend(p)
+            if not coords:
+                continue
+            if coords[0] != lx or coords[1] != ly:
+                templ.append("%g %g m\n" + "%g %g l\n" * (len(coords) // 2 - 1))
+            else:  # like drawPolyline: no move to the last point
+                templ.append("%g %g l\n" * (len(coords) // 2 - 1))
+                coords = coords[2:]
+                if not coords:
+                    continue
+            v.extend(coords)
+            lx, ly = coords[-2], coords[-1]
+        if not v:
+            return self.lastPoint
+        t = self._transform_floats(v)
+        self._draw_buf.write("".join(templ) % JM_TUPLE(t))
+        self._update_rect_floats(v[0::2], v[1::2])
+        self.lastPoint = Point(v[-2], v[-1])
+        return self.lastPoint
+
     def drawZigzag(self, p1, p2, breadth=2):
         """Draw a zig-zagged line from p1 to p2.
         """
@@ -2814,7 +3055,7 @@ class Shape(object):
         #   end of text insertion
         # =========================================================================
         # update the /Contents object
-        self.text_cont += nres
+        self._text_buf.write(nres)
         return nlines
 
     # ==============================================================================
@@ -2905,7 +3146,7 @@ class Shape(object):
         else:
             t0 = buffer
 
-        maxcode = max([ord(c) for c in t0])
+        maxcode = ord(max(t0))
         # replace invalid char codes for simple fonts
         if simple and maxcode > 255:
             t0 = "".join([c if ord(c) < 256 else "?" for c in t0])
@@ -2913,29 +3154,27 @@ class Shape(object):
         t0 = t0.splitlines()
 
         glyphs = self.doc.getCharWidths(xref, maxcode + 1)
-        if simple and bfname not in ("Symbol", "ZapfDingbats"):
-            tj_glyphs = None
+        # TJ operand format, see getTJstr
+        if simple:
+            tjmode = 0 if bfname not in ("Symbol", "ZapfDingbats") else 1
         else:
-            tj_glyphs = glyphs
-
-        # ----------------------------------------------------------------------
-        # calculate pixel length of a string
-        # ----------------------------------------------------------------------
-        def pixlen(x):
-            """Calculate pixel length of x."""
-            if ordering < 0:
-                return sum([glyphs[ord(c)][1] for c in x]) * fontsize
-            else:
-                return len(x) * fontsize
+            tjmode = 2 if ordering < 0 else 3
 
-        # ----------------------------------------------------------------------
-
-        if ordering < 0:
-            blen = glyphs[32][1] * fontsize  # pixel size of space character
+        # glyph ids and widths packed for C code, kept with the font info
+        if glyphs is None:
+            gids = widths = None
         else:
-            blen = fontsize
+            packed = fontdict.get("_packed")
+            if packed is None or packed[0] is not glyphs:
+                n = len(glyphs)
+                packed = (
+                    glyphs,
+                    struct.pack("%ii" % n, *[g[0] for g in glyphs]),
+                    struct.pack("%if" % n, *[g[1] for g in glyphs]),
+                )
+                fontdict["_packed"] = packed
+            gids, widths = packed[1:]
 
-        text = ""  # output buffer
         lheight = fontsize * 1.2  # line height
         if CheckMorph(morph):
             m1 = Matrix(
@@ -2984,89 +3223,35 @@ class Shape(object):
             cm += cmm90
 
         # =======================================================================
-        # line loop
+        # break lines into words and lines fitting into the rectangle width,
+        # align them and create their TJ operands
         # =======================================================================
-        just_tab = []  # 'justify' indicators per line
-
-        for i, line in enumerate(t0):
-            line_t = line.expandtabs(expandtabs).split(" ")  # split into words
-            lbuff = ""  # init line buffer
-            rest = maxwidth  # available line pixels
-            # ===================================================================
-            # word loop
-            # ===================================================================
-            for word in line_t:
-                pl_w = pixlen(word)  # pixel len of word
-                if rest >= pl_w:  # will it fit on the line?
-                    lbuff += word + " "  # yes, and append word
-                    rest -= pl_w + blen  # update available line space
-                    continue
-                # word won't fit - output line (if not empty)
-                if len(lbuff) > 0:
-                    lbuff = lbuff.rstrip() + "\n"  # line full, append line break
-                    text += lbuff  # append to total text
-                    pos += lheight * progr  # increase line position
-                    just_tab.append(True)  # line is justify candidate
-                    lbuff = ""  # re-init line buffer
-                rest = maxwidth  # re-init avail. space
-                if pl_w <= maxwidth:  # word shorter than 1 line?
-                    lbuff = word + " "  # start the line with it
-                    rest = maxwidth - pl_w - blen  # update free space
-                    continue
-                # long word: split across multiple lines - char by char ...
-                if len(just_tab) > 0:
-                    just_tab[-1] = False  # reset justify indicator
-                for c in word:
-                    if pixlen(lbuff) <= maxwidth - pixlen(c):
-                        lbuff += c
-                    else:  # line full
-                        lbuff += "\n"  # close line
-                        text += lbuff  # append to text
-                        pos += lheight * progr  # increase line position
-                        just_tab.append(False)  # do not justify line
-                        lbuff = c  # start new line with this char
-                lbuff += " "  # finish long word
-                rest = maxwidth - pixlen(lbuff)  # long word stored
-
-            if lbuff != "":  # unprocessed line content?
-                text += lbuff.rstrip()  # append to text
-                just_tab.append(False)  # do not justify line
-            if i < len(t0) - 1:  # not the last line?
-                text += "\n"  # insert line break
-                pos += lheight * progr  # increase line position
-
-        more = (pos - maxpos) * progr  # difference to rect size limit
-
-        if more > EPSILON:  # landed too much outside rect
-            return (-1) * more  # return deficit, don't output
-
-        more = abs(more)
-        if more < EPSILON:
-            more = 0  # don't bother with epsilons
+        more, lines = TOOLS._layout_textbox(
+            [line.expandtabs(expandtabs) for line in t0],
+            gids,
+            widths if ordering < 0 else None,
+            tjmode,
+            fontsize,
+            maxwidth,
+            align,
+            pos,
+            maxpos,
+            lheight * progr,
+            progr,
+        )
+        if lines is None:  # landed too much outside rect
+            return more  # return deficit, don't output
+
         nres = "\nq BT\n" + cm  # initialize output buffer
         templ = "1 0 0 1 %g %g Tm /%s %g Tf "
         # center, right, justify: output each line with its own specifics
-        spacing = 0
-        text_t = text.splitlines()  # split text in lines again
-        for i, t in enumerate(text_t):
-            pl = maxwidth - pixlen(t)  # length of empty line part
+        for i, (tj, shift, spacing) in enumerate(lines):
             pnt = point + c_pnt * (i * 1.2)  # text start of line
-            if align == 1:  # center: right shift by half width
-                if rot in (0, 180):
-                    pnt = pnt + Point(pl / 2, 0) * progr
-                else:
-                    pnt = pnt - Point(0, pl / 2) * progr
-            elif align == 2:  # right: right shift by full width
+            if shift != 0:  # center or right alignment
                 if rot in (0, 180):
-                    pnt = pnt + Point(pl, 0) * progr
+                    pnt = pnt + Point(shift, 0) * progr
                 else:
-                    pnt = pnt - Point(0, pl) * progr
-            elif align == 3:  # justify
-                spaces = t.count(" ")  # number of spaces in line
-                if spaces > 0 and just_tab[i]:  # if any, and we may justify
-                    spacing = pl / spaces  # make every space this much larger
-                else:
-                    spacing = 0  # keep normal space length
+                    pnt = pnt - Point(0, shift) * progr
             top = height - pnt.y - self.y
             left = pnt.x + self.x
             if rot == 90:
@@ -3090,11 +3275,11 @@ class Shape(object):
                 nres += fill_str
             if border_width != 1:
                 nres += "%g w " % border_width
-            nres += "%sTJ\n" % getTJstr(t, tj_glyphs, simple, ordering)
+            nres += "%sTJ\n" % tj
 
         nres += "ET Q\n"
 
-        self.text_cont += nres
+        self._text_buf.write(nres)
         self.updateRect(rect)
         return more
 
@@ -3118,7 +3303,7 @@ class Shape(object):
             morphing. Also determines whether any open path should be closed
             by a connecting line to its start point.
         """
-        if self.draw_cont == "":  # treat empty contents as no-op
+        if not self._draw_buf.tell():  # treat empty contents as no-op
             return
         if roundCap is not None:
             warnings.warn(
@@ -3135,45 +3320,49 @@ class Shape(object):
         fill_str = ColorCode(fill, "f")  # ensure proper fill string
 
         if width not in (0, 1):
-            self.draw_cont += "%g w\n" % width
+            self._draw_buf.write("%g w\n" % width)
 
         if lineCap + lineJoin > 0:
-            self.draw_cont += "%i J %i j\n" % (lineCap, lineJoin)
+            self._draw_buf.write("%i J %i j\n" % (lineCap, lineJoin))
 
         if dashes is not None and len(dashes) > 0:
-            self.draw_cont += "%s d\n" % dashes
+            self._draw_buf.write("%s d\n" % dashes)
 
         if closePath:
-            self.draw_cont += "h\n"
+            self._draw_buf.write("h\n")
             self.lastPoint = None
 
         if color is not None:
-            self.draw_cont += color_str
+            self._draw_buf.write(color_str)
 
         if fill is not None:
-            self.draw_cont += fill_str
+            self._draw_buf.write(fill_str)
             if color is not None:
                 if not even_odd:
-                    self.draw_cont += "B\n"
+                    self._draw_buf.write("B\n")
                 else:
-                    self.draw_cont += "B*\n"
+                    self._draw_buf.write("B*\n")
             else:
                 if not even_odd:
-                    self.draw_cont += "f\n"
+                    self._draw_buf.write("f\n")
                 else:
-                    self.draw_cont += "f*\n"
+                    self._draw_buf.write("f*\n")
         else:
-            self.draw_cont += "S\n"
+            self._draw_buf.write("S\n")
 
         if CheckMorph(morph):
             m1 = Matrix(
                 1, 0, 0, 1, morph[0].x + self.x, self.height - morph[0].y - self.y
             )
             mat = ~m1 * morph[1] * m1
-            self.draw_cont = "%g %g %g %g %g %g cm\n" % JM_TUPLE(mat) + self.draw_cont
+            cm = "%g %g %g %g %g %g cm\n" % JM_TUPLE(mat)
+        else:
+            cm = ""
 
-        self.totalcont += "\nq\n" + self.draw_cont + "Q\n"
-        self.draw_cont = ""
+        self._total_buf.write("\nq\n" + cm)
+        self._total_buf.write(self._draw_buf.getvalue())
+        self._total_buf.write("Q\n")
+        self._draw_buf = self._new_buffer()
         self.lastPoint = None
         return
 
@@ -3181,22 +3370,23 @@ class Shape(object):
         """Update the page's /Contents object with Shape data. The argument controls whether data appear in foreground (default) or background.
         """
         CheckParent(self.page)  # doc may have died meanwhile
-        self.totalcont += self.text_cont
+        self._total_buf.write(self._text_buf.getvalue())
+        totalcont = self._total_buf.getvalue()
 
         if not fitz_py2:  # need bytes if Python > 2
-            self.totalcont = bytes(self.totalcont, "utf-8")
+            totalcont = totalcont.encode("utf-8")
 
-        if self.totalcont != b"":
+        if totalcont != b"":
             # make /Contents object with dummy stream
             xref = TOOLS._insert_contents(self.page, b" ", overlay)
             # update it with potential compression
-            self.doc.updateStream(xref, self.totalcont)
+            self.doc.updateStream(xref, totalcont)
 
         self.lastPoint = None  # clean up ...
         self.rect = None  #
-        self.draw_cont = ""  # for possible ...
-        self.text_cont = ""  # ...
-        self.totalcont = ""  # re-use
+        self._draw_buf = self._new_buffer()  # for possible ...
+        self._text_buf = self._new_buffer()  # ...
+        self._total_buf = self._new_buffer()  # re-use
         return
 
 
@@ -3282,6 +3472,107 @@ def apply_redactions(page):
     return True
 
 
+# ------------------------------------------------------------------------------
+# Reduce embedded fonts to the glyphs actually used
+# ------------------------------------------------------------------------------
+def subset_fonts(doc):
+    """Reduce embedded TrueType and OpenType fonts to the glyphs in use.
+
+    Notes:
+        Requires package fontTools. Subset fonts keep their glyph ids, so
+        page contents need no change. Fonts already subset (name prefix
+        'ABCDEF+') and other font types are left alone. Call this after
+        all text has been inserted: insertFont refuses to reuse subset
+        fonts until the document has been saved and reopened.
+    Returns:
+        A dictionary with two items: "subset" is a dictionary
+        {xref: (old, new)} with the font file sizes of all fonts that have
+        been subset. "failed" is a dictionary {xref: message} of the fonts
+        which fontTools could not subset.
+    """
+    if doc.isClosed or doc.isEncrypted:
+        raise ValueError("document closed or encrypted")
+    if not doc.isPDF:
+        raise ValueError("not a PDF")
+    try:
+        from fontTools import subset, ttLib
+    except ImportError:
+        raise ImportError("Optional package 'fontTools' not installed")
+
+    # collect font files: {font file xref: [font xrefs]}
+    fontfiles = {}
+    seen = set()
+    for pno in range(doc.pageCount):
+        for f in doc.getPageFontList(pno):
+            xref, ext, ftype, basefont = f[:4]
+            if xref in seen:
+                continue
+            seen.add(xref)
+            if ext not in ("ttf", "otf") or basefont[6:7] == "+":
+                continue
+            if ftype == "Type0":
+                path = "DescendantFonts/0/FontDescriptor/"
+            else:
+                path = "FontDescriptor/"
+            path += "FontFile2" if ext == "ttf" else "FontFile3"
+            t, ffxref = doc.xref_get_key(xref, path)
+            if t == "xref":
+                fontfiles.setdefault(ffxref, []).append((xref, ftype))
+
+    ffxrefs = list(fontfiles.keys())
+    usage = doc._getGlyphUsage(ffxrefs)
+
+    done = {}
+    failed = {}
+    for ffxref, gids in zip(ffxrefs, usage):
+        old = doc.xrefStream(ffxref)
+        try:
+            font = ttLib.TTFont(io.BytesIO(old))
+            options = subset.Options()
+            options.retain_gids = True  # glyph ids are used in page contents
+            options.notdef_outline = True
+            # simple TrueType fonts map character codes via these cmaps
+            options.legacy_cmap = options.symbol_cmap = True
+            options.glyph_names = True
+            options.drop_tables += ["GSUB", "GPOS", "GDEF", "BASE", "JSTF", "DSIG"]
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(gids=[0] + gids)
+            subsetter.subset(font)
+            out = io.BytesIO()
+            font.save(out)
+            new = out.getvalue()
+        except Exception as exc:
+            for xref, ftype in fontfiles[ffxref]:
+                failed[xref] = str(exc)
+            continue
+        if len(new) >= len(old):
+            continue
+        doc.updateStream(ffxref, new)
+        if doc.xref_get_key(ffxref, "Length1")[0] != "null":
+            doc.xref_set_key(ffxref, "Length1", str(len(new)))
+
+        # subset font names start with a tag of 6 upper case letters
+        digest = bytearray(hashlib.md5(new).digest()[:6])
+        tag = "".join([chr(65 + b % 26) for b in digest]) + "+"
+        for xref, ftype in fontfiles[ffxref]:
+            keys = ["BaseFont"]
+            if ftype == "Type0":
+                keys.append("DescendantFonts/0/BaseFont")
+                keys.append("DescendantFonts/0/FontDescriptor/FontName")
+            else:
+                keys.append("FontDescriptor/FontName")
+            for key in keys:
+                t, name = doc.xref_get_key(xref, key)
+                if t == "name" and name[6:7] != "+":
+                    doc.xref_set_key(xref, key, PDFSource(PDFName(tag + name)))
+            done[xref] = (len(old), len(new))
+
+    # font infos hold the widths and names of the full fonts
+    doc.FontInfos = [f for f in doc.FontInfos if f[0] not in done]
+    doc._subset_fonts.update(done.keys())
+    return {"subset": done, "failed": failed}
+
+
 # ------------------------------------------------------------------------------
 # Remove potentially sensitive data from a PDF. Corresponds to the Adobe
 # Acrobat 'sanitize' function
@@ -3599,3 +3890,436 @@ def fillTextbox(
 
         idx = i  # number of next word to read
         line_ctr += 1  # line counter
+
+
+class TextIndex(object):
+    """Persistent full-text index of a document.
+
+    Notes:
+        The index is stored in a sidecar file and memory-mapped when opened.
+        It maps every word (lower case, surrounding punctuation removed) to
+        its page numbers and word rectangles. Create it with 'build', open
+        an existing one with 'open', or let 'get' decide.
+    """
+
+    MAGIC = b"FITZIDX1"
+    _HIT = struct.Struct("<iiffff")  # page, word sequence number, rectangle
+    _strip_chars = string.punctuation + u"\u2018\u2019\u201c\u201d\u2013\u2014\u00ab\u00bb"
+
+    @staticmethod
+    def token(word):
+        """Return the index term of a word (empty if there is none)."""
+        return word.strip(TextIndex._strip_chars).lower()
+
+    @staticmethod
+    def doc_key(doc):
+        """Return the values invalidating an index of the document."""
+        key = {"pageCount": len(doc), "id": ""}
+        meta = doc.metadata or {}
+        for k in ("format", "creationDate", "modDate"):
+            key[k] = meta.get(k, "")
+        if doc.isPDF and doc.xref_get_key(-1, "ID")[0] == "array":
+            key["id"] = [doc.xref_get_key(-1, "ID/%i" % i)[1] for i in (0, 1)]
+        return key
+
+    @staticmethod
+    def default_path(doc):
+        if not doc.name:
+            raise ValueError("need index file name for memory documents")
+        return doc.name + ".fitzidx"
+
+    @classmethod
+    def build(cls, doc, path=None, flags=None):
+        """Extract the text of all pages and store the index in a file.
+
+        Args:
+            doc: (Document) the document.
+            path: (str) index file name, default is document name + '.fitzidx'.
+            flags: (int) control the amount of data parsed into the textpages.
+        Returns:
+            The opened TextIndex.
+        """
+        if doc.isClosed or doc.isEncrypted:
+            raise ValueError("document closed or encrypted")
+        if path is None:
+            path = cls.default_path(doc)
+        if flags is None:
+            flags = TEXT_PRESERVE_LIGATURES | TEXT_PRESERVE_WHITESPACE
+        postings = {}
+        hits = 0
+        for pno in range(len(doc)):
+            d = doc[pno].getTextPage(flags).extract_words_arrays()
+            bbox, text, offs = d["bbox"], d["text"], d["offsets"]
+            seq = 0
+            for i in range(d["count"]):
+                term = cls.token(text[offs[i] : offs[i + 1]])
+                if not term:
+                    continue
+                postings.setdefault(term, []).append(
+                    (pno, seq) + tuple(bbox[4 * i : 4 * i + 4])
+                )
+                seq += 1
+                hits += 1
+
+        terms = sorted(postings)
+        blob = io.BytesIO()
+        term_offsets = [0]
+        hit_starts = [0]
+        for term in terms:
+            blob.write(term.encode("utf-8"))
+            term_offsets.append(blob.tell())
+            hit_starts.append(hit_starts[-1] + len(postings[term]))
+        blob = blob.getvalue()
+        blob += b"\0" * (-len(blob) % 4)  # keep hits 4-byte aligned
+        header = json.dumps(
+            {
+                "version": 1,
+                "key": cls.doc_key(doc),
+                "flags": flags,
+                "terms": len(terms),
+                "hits": hits,
+                "blob": len(blob),
+            }
+        ).encode("utf-8")
+        header += b" " * (-len(header) % 4)
+
+        with open(path, "wb") as f:
+            f.write(cls.MAGIC)
+            f.write(struct.pack("<i", len(header)))
+            f.write(header)
+            f.write(struct.pack("<%ii" % len(term_offsets), *term_offsets))
+            f.write(struct.pack("<%ii" % len(hit_starts), *hit_starts))
+            f.write(blob)
+            for term in terms:
+                for hit in postings[term]:
+                    f.write(cls._HIT.pack(*hit))
+        return cls(path)
+
+    @classmethod
+    def open(cls, path, doc=None):
+        """Open an index file, optionally checking that it belongs to doc."""
+        index = cls(path)
+        if doc is not None and not index.is_valid(doc):
+            index.close()
+            raise ValueError("index is outdated")
+        return index
+
+    @classmethod
+    def get(cls, doc, path=None, flags=None):
+        """Open the index of a document, (re-)building it if required."""
+        if path is None:
+            path = cls.default_path(doc)
+        if os.path.exists(path):
+            try:
+                return cls.open(path, doc)
+            except ValueError:
+                pass
+        return cls.build(doc, path, flags)
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:8] != self.MAGIC:
+                raise ValueError("not a text index file")
+            hlen = struct.unpack_from("<i", self._map, 8)[0]
+            header = json.loads(self._map[12 : 12 + hlen].decode("utf-8"))
+        except Exception:
+            self.close()
+            raise
+        self.key = header["key"]
+        self.flags = header["flags"]
+        self.term_count = header["terms"]
+        self.hit_count = header["hits"]
+        self._term_offsets = 12 + hlen
+        self._hit_starts = self._term_offsets + 4 * (self.term_count + 1)
+        self._blob = self._hit_starts + 4 * (self.term_count + 1)
+        self._hits = self._blob + header["blob"]
+
+    def __repr__(self):
+        return "TextIndex('%s')" % self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the memory map and the file."""
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+        self._map = None
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+
+    def is_valid(self, doc):
+        """Check whether the index matches the document."""
+        return self.key == json.loads(json.dumps(self.doc_key(doc)))
+
+    def _int(self, base, i):
+        return struct.unpack_from("<i", self._map, base + 4 * i)[0]
+
+    def _term(self, i):
+        start = self._blob + self._int(self._term_offsets, i)
+        stop = self._blob + self._int(self._term_offsets, i + 1)
+        return self._map[start:stop]
+
+    def _find(self, term):
+        """Binary search of a term, return its number or -1."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count and self._term(lo) == key:
+            return lo
+        return -1
+
+    def _postings(self, term):
+        """Generate (page, seq, rect) of a term."""
+        i = self._find(term)
+        if i < 0:
+            return
+        size = self._HIT.size
+        for k in range(self._int(self._hit_starts, i), self._int(self._hit_starts, i + 1)):
+            hit = self._HIT.unpack_from(self._map, self._hits + k * size)
+            yield hit[0], hit[1], Rect(hit[2:])
+
+    def pages(self, word):
+        """Return the sorted page numbers containing a word."""
+        return sorted(set(p for p, _, _ in self._postings(self.token(word))))
+
+    def search(self, query, pages=None):
+        """Locate a word or a phrase of words.
+
+        Notes:
+            Query words are normalized like indexed words. A phrase matches
+            consecutive words, ignoring punctuation-only words.
+        Args:
+            query: (str) a word or a phrase.
+            pages: (sequence) restrict the result to these page numbers.
+        Returns:
+            A list of tuples (pno, quads), one per occurrence, with one quad
+            per word of the phrase.
+        """
+        if self._map is None:
+            raise ValueError("index is closed")
+        terms = [t for t in (self.token(w) for w in query.split()) if t]
+        if not terms:
+            return []
+        if pages is not None:
+            pages = set(pages)
+        # positions of the following phrase words
+        nexts = []
+        for term in terms[1:]:
+            nexts.append(dict(((p, s), r) for p, s, r in self._postings(term)))
+        result = []
+        for pno, seq, rect in self._postings(terms[0]):
+            if pages is not None and pno not in pages:
+                continue
+            rects = [rect]
+            for k, positions in enumerate(nexts):
+                r = positions.get((pno, seq + k + 1))
+                if r is None:
+                    break
+                rects.append(r)
+            else:
+                result.append((pno, [r.quad for r in rects]))
+        return result
+
+
+
+class SpatialIndex(object):
+    """Grid index of rectangles for fast point and rectangle queries.
+
+    Notes:
+        Every item is a tuple (kind, rect, data). The plane is divided into
+        square cells and each item is registered in every cell its rectangle
+        touches. A query only inspects the items of the cells it touches,
+        so its cost does not depend on the total number of items.
+    """
+
+    def __init__(self, items=None, cell=None):
+        """Create an index.
+
+        Args:
+            items: (sequence) tuples (kind, rect, data) to insert.
+            cell: (float) cell size. Default is derived from the items.
+        """
+        items = [(kind, Rect(r), data) for kind, r, data in items or ()]
+        if cell is None:
+            cell = self._cell_size(items)
+        if cell <= 0:
+            raise ValueError("bad cell size")
+        self.cell = float(cell)
+        self.items = []
+        self._grid = {}
+        for item in items:
+            self._add(item)
+
+    @staticmethod
+    def _cell_size(items):
+        """Cell size: twice the median of item widths and heights."""
+        sizes = []
+        for _, r, _ in items:
+            if not (r.isEmpty or r.isInfinite):
+                sizes.append(max(r.width, r.height))
+        if not sizes:
+            return 16.0
+        sizes.sort()
+        return max(2 * sizes[len(sizes) // 2], 1.0)
+
+    def _cells(self, r):
+        """Cell coordinate ranges touched by rectangle r."""
+        c = self.cell
+        return (
+            range(int(math.floor(r.x0 / c)), int(math.floor(r.x1 / c)) + 1),
+            range(int(math.floor(r.y0 / c)), int(math.floor(r.y1 / c)) + 1),
+        )
+
+    def _add(self, item):
+        r = item[1]
+        if r.isEmpty or r.isInfinite:
+            return
+        n = len(self.items)
+        self.items.append(item)
+        grid = self._grid
+        xs, ys = self._cells(r)
+        for x in xs:
+            for y in ys:
+                cell = grid.get((x, y))
+                if cell is None:
+                    grid[(x, y)] = [n]
+                else:
+                    cell.append(n)
+
+    def insert(self, kind, rect, data=None):
+        """Add an item. Empty or infinite rectangles are ignored."""
+        self._add((kind, Rect(rect), data))
+
+    def __len__(self):
+        return len(self.items)
+
+    def at(self, point, kinds=None):
+        """Return the items whose rectangle contains a point.
+
+        Args:
+            point: (point-like) the point.
+            kinds: (sequence) restrict result to these kinds of items.
+        Returns:
+            A list of items in insertion order.
+        """
+        x, y = float(point[0]), float(point[1])
+        c = self.cell
+        cell = self._grid.get((int(math.floor(x / c)), int(math.floor(y / c))), ())
+        items = self.items
+        result = []
+        for n in cell:
+            item = items[n]
+            if kinds is not None and item[0] not in kinds:
+                continue
+            r = item[1]
+            if r.x0 <= x <= r.x1 and r.y0 <= y <= r.y1:
+                result.append(item)
+        return result
+
+    def in_rect(self, rect, contained=False, kinds=None):
+        """Return the items whose rectangle intersects a rectangle.
+
+        Args:
+            rect: (rect-like) the rectangle.
+            contained: (bool) only return items completely inside rect.
+            kinds: (sequence) restrict result to these kinds of items.
+        Returns:
+            A list of items in insertion order.
+        """
+        rect = Rect(rect).normalize()
+        if rect.isEmpty:
+            return []
+        grid = self._grid
+        found = set()
+        xs, ys = self._cells(rect)
+        if len(xs) * len(ys) > len(grid):  # fewer cells than touched
+            for (x, y), cell in grid.items():
+                if x in xs and y in ys:
+                    found.update(cell)
+        else:
+            for x in xs:
+                for y in ys:
+                    found.update(grid.get((x, y), ()))
+        items = self.items
+        result = []
+        for n in sorted(found):
+            item = items[n]
+            if kinds is not None and item[0] not in kinds:
+                continue
+            r = item[1]
+            if contained:
+                if r in rect:
+                    result.append(item)
+            elif r.x0 < rect.x1 and rect.x0 < r.x1 and r.y0 < rect.y1 and rect.y0 < r.y1:
+                result.append(item)
+        return result
+
+
+def spatial_index(page, words=True, chars=False, annots=True, flags=None, cell=None):
+    """Create a SpatialIndex of the words, characters and annotations of a page.
+
+    Notes:
+        Word items have kind "word" and the data of getTextWords, i.e. a tuple
+        (x0, y0, x1, y1, "word", block_no, line_no, word_no). Character items
+        have kind "char" and the data (x0, y0, x1, y1, "c", block_no, line_no,
+        char_no). Annotation items have kind "annot" and the annotation xref
+        as data, see loadAnnot.
+        All rectangles are in unrotated page coordinates, like those of
+        getTextWords. On rotated pages, multiply points or rectangles in
+        rotated coordinates with page.derotationMatrix before querying.
+    Args:
+        words: (bool) include words.
+        chars: (bool) include characters.
+        annots: (bool) include annotations.
+        flags: (int) text extraction flags.
+        cell: (float) cell size, see SpatialIndex.
+    Returns:
+        A SpatialIndex.
+    """
+    CheckParent(page)
+    items = []
+    if words or chars:
+        if flags is None:
+            flags = TEXT_PRESERVE_LIGATURES | TEXT_PRESERVE_WHITESPACE
+        tp = page.getTextPage(flags)
+        columns = []
+        if words:
+            columns.append(("word", tp.extract_words_arrays()))
+        if chars:
+            columns.append(("char", tp.extract_chars_arrays()))
+        for kind, d in columns:
+            bbox, index, text, offsets = d["bbox"], d["index"], d["text"], d["offsets"]
+            for i in range(d["count"]):
+                r = bbox[4 * i : 4 * i + 4]
+                data = tuple(r) + (
+                    text[offsets[i] : offsets[i + 1]],
+                    index[3 * i],
+                    index[3 * i + 1],
+                    index[3 * i + 2],
+                )
+                items.append((kind, r, data))
+    if annots:
+        # like the TextPage, take annotation rects from the unrotated page
+        old_rotation = page.rotation
+        if old_rotation != 0:
+            page.setRotation(0)
+        try:
+            for annot in page.annots():
+                items.append(("annot", annot.rect, annot.xref))
+        finally:
+            if old_rotation != 0:
+                page.setRotation(old_rotation)
+    return SpatialIndex(items, cell=cell)
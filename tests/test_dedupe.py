@@ -0,0 +1,22 @@
+"""
+Merging duplicate objects must never merge pages.
+"""
+import fitz
+
+
+def test_identical_pages_after_dedupe():
+    doc = fitz.open()
+    doc.newPage()
+    doc.newPage()
+    doc.dedupe_objects()
+    assert doc.pageCount == 2
+    assert doc[0].xref != doc[1].xref
+
+
+def test_identical_pages_after_garbage_3():
+    doc = fitz.open()
+    doc.newPage()
+    doc.newPage()
+    doc = fitz.open("pdf", doc.write(garbage=3))
+    assert doc.pageCount == 2
+    assert doc[0].xref != doc[1].xref
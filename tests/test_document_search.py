@@ -0,0 +1,18 @@
+"""
+Document.search must find the same hits as Page.searchFor on every page.
+"""
+import fitz
+
+
+def test_same_as_search_for():
+    doc = fitz.open()
+    texts = ["confi-\ndential", "CONFIDENTIAL and\nconfidential", "public"]
+    for text in texts:
+        doc.newPage().insertText((72, 72), text)
+    found = dict(doc.search("confidential"))
+    for page in doc:
+        quads = page.searchFor("confidential", hit_max=0, quads=True)
+        if not quads:
+            assert page.number not in found
+            continue
+        assert [tuple(q) for q in found[page.number]] == [tuple(q) for q in quads]
@@ -0,0 +1,29 @@
+"""
+The geometry classes use __slots__ and must still pickle with every protocol.
+"""
+import pickle
+
+import pytest
+
+import fitz
+
+
+OBJECTS = [
+    fitz.Matrix(1, 2, 3, 4, 5, 6),
+    fitz.Identity,
+    fitz.Point(1.5, -2),
+    fitz.Rect(1, 2, 3, 4),
+    fitz.IRect(1, 2, 3, 4),
+    fitz.Quad(fitz.Rect(1, 2, 3, 4)),
+    fitz.RectArray([(1, 2, 3, 4), (5, 6, 7, 8)]),
+    fitz.PointArray([(1, 2), (3, 4)]),
+    fitz.QuadArray([fitz.Rect(1, 2, 3, 4).quad]),
+]
+
+
+@pytest.mark.parametrize("protocol", range(pickle.HIGHEST_PROTOCOL + 1))
+@pytest.mark.parametrize("obj", OBJECTS, ids=lambda o: o.__class__.__name__)
+def test_pickle(obj, protocol):
+    copy = pickle.loads(pickle.dumps(obj, protocol))
+    assert copy.__class__ is obj.__class__
+    assert list(copy) == list(obj)
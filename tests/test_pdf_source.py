@@ -0,0 +1,32 @@
+"""
+PDFSource must produce valid PDF numbers and names.
+"""
+import pytest
+
+import fitz
+
+
+def test_floats():
+    assert fitz.PDFSource(1e-7) == "0.0000001"
+    assert fitz.PDFSource(-2.5e-5) == "-0.000025"
+    assert fitz.PDFSource(1e20) == "100000000000000000000"
+    assert fitz.PDFSource(0.1) == "0.1"
+    assert fitz.PDFSource(3.0) == "3"
+    with pytest.raises(ValueError):
+        fitz.PDFSource(float("nan"))
+
+
+def test_names():
+    assert fitz.PDFSource(fitz.PDFName("A B/C")) == "/A#20B#2FC"
+    assert fitz.PDFSource({"My Key": fitz.PDFName("Val")}) == "<</My#20Key /Val>>"
+
+
+def test_round_trip():
+    doc = fitz.open()
+    doc.newPage()
+    xref = doc[0].xref
+    view = fitz.PDFDict(doc, xref)
+    view["UserUnit"] = 1e-7
+    view["Odd"] = {"A B": fitz.PDFName("x/y")}
+    assert view["UserUnit"] == pytest.approx(1e-7)
+    assert view["Odd"]["A B"] == "x/y"
@@ -0,0 +1,29 @@
+"""
+Regular expression search must only report matches of page characters.
+"""
+import re
+
+import pytest
+
+import fitz
+
+
+def make_textpage():
+    doc = fitz.open()
+    page = doc.newPage()
+    page.insertText((72, 72), "first line\nsecond line")
+    return page.getTextPage()
+
+
+def test_line_breaks_only():
+    tp = make_textpage()
+    assert tp.search_regex(r"\n") == []
+    assert tp.search_regex(r"\s+$", flags=re.M) == []
+    assert len(tp.search_regex("line")) == 2
+
+
+def test_compiled_pattern_with_flags():
+    tp = make_textpage()
+    with pytest.raises(ValueError):
+        tp.search_regex(re.compile("LINE"), flags=re.I)
+    assert len(tp.search_regex(re.compile("LINE", re.I))) == 2
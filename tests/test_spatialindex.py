@@ -0,0 +1,28 @@
+"""
+Words and annotations of a rotated page must be indexed in the same space.
+"""
+import fitz
+
+
+def test_spatial_index_rotated_page():
+    doc = fitz.open()
+    page = doc.newPage()
+    page.insertText((100, 100), "Hello", fontsize=20)
+    word = page.getTextWords()[0]
+    wrect = fitz.Rect(word[:4])
+    annot = page.addRectAnnot(wrect)
+    xref = annot.xref
+    page.setRotation(90)
+
+    index = page.spatial_index()
+    kinds = [item[0] for item in index.at(wrect.center)]
+    assert "word" in kinds
+    assert "annot" in kinds
+    arect = [item[1] for item in index.items if item[0] == "annot"][0]
+    assert (arect - wrect).norm() < 5  # only border width may differ
+    assert page.rotation == 90
+
+    # a point of the rotated page must be derotated first
+    p = wrect.center * page.rotationMatrix
+    found = index.at(p * page.derotationMatrix)
+    assert xref in [item[2] for item in found if item[0] == "annot"]
@@ -0,0 +1,43 @@
+"""
+Subsetting fonts must not change the appearance of pages.
+"""
+import glob
+import os
+
+import pytest
+
+import fitz
+
+pytest.importorskip("fontTools")
+
+
+def find_ttf():
+    for pattern in (
+        "/usr/share/fonts/**/*.ttf",
+        "/Library/Fonts/*.ttf",
+        os.path.expandvars("$WINDIR/Fonts/*.ttf"),
+    ):
+        files = sorted(glob.glob(pattern, recursive=True))
+        if files:
+            return files[0]
+    pytest.skip("no TrueType font file found")
+
+
+def render(doc):
+    doc = fitz.open("pdf", doc.write())
+    return [page.getPixmap().samples for page in doc]
+
+
+@pytest.mark.parametrize("set_simple", [False, True])
+def test_subset_fonts_rendering(set_simple):
+    fontfile = find_ttf()
+    doc = fitz.open()
+    page = doc.newPage()
+    page.insertFont(fontname="F0", fontfile=fontfile, set_simple=set_simple)
+    page.insertText((50, 100), "Hello World 0123456789", fontname="F0", fontsize=20)
+    before = render(doc)
+
+    rc = doc.subset_fonts()
+    assert rc["failed"] == {}
+    assert len(rc["subset"]) == 1
+    assert render(doc) == before
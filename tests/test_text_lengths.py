@@ -0,0 +1,27 @@
+"""
+Font.text_lengths must agree with measuring glyph by glyph.
+"""
+import fitz
+
+
+def test_text_lengths():
+    font = fitz.Font("helv")
+    texts = [u"", u"Hello World", u"\xe4\xf6\xfc \xdf \u20ac", u"\u4e2d\u6587"]
+    lengths = font.text_lengths(texts, fontsize=12)
+    for text, length in zip(texts, lengths):
+        expected = sum(font.glyph_advance(ord(c)) for c in text) * 12
+        assert abs(length - expected) < 1e-4
+
+
+def test_advances_shared():
+    font1 = fitz.Font("helv")
+    font1.text_length(u"shared")
+    font2 = fitz.Font("helv")
+    assert font1._advance_cache(None, 0, 0) is font2._advance_cache(None, 0, 0)
+
+
+def test_byte_strings():
+    # Python 2 str: every byte is a character code
+    font = fitz.Font("helv")
+    if fitz.fitz_py2:
+        assert font.text_lengths([b"\xe4\xdf"]) == font.text_lengths([u"\xe4\xdf"])
@@ -0,0 +1,153 @@
+"""
+The C text layout of insertTextbox must reproduce the former Python code.
+"""
+import random
+
+import pytest
+
+import fitz
+
+
+def old_layout(t0, glyphs, fontsize, maxwidth, align, pos, maxpos, progr, tjmode):
+    """The line loop of insertTextbox before it was moved to C code.
+
+    Returns (more, lines) like TOOLS._layout_textbox.
+    """
+    lheight = fontsize * 1.2
+    if glyphs is None:
+        pixlen = lambda x: len(x) * fontsize
+    else:
+        pixlen = lambda x: sum([glyphs[ord(c)][1] for c in x]) * fontsize
+    blen = pixlen(" ")
+    text = ""
+    just_tab = []
+    for i, line in enumerate(t0):
+        line_t = line.split(" ")
+        lbuff = ""
+        rest = maxwidth
+        for word in line_t:
+            pl_w = pixlen(word)
+            if rest >= pl_w:
+                lbuff += word + " "
+                rest -= pl_w + blen
+                continue
+            if len(lbuff) > 0:
+                lbuff = lbuff.rstrip() + "\n"
+                text += lbuff
+                pos += lheight * progr
+                just_tab.append(True)
+                lbuff = ""
+            rest = maxwidth
+            if pl_w <= maxwidth:
+                lbuff = word + " "
+                rest = maxwidth - pl_w - blen
+                continue
+            if len(just_tab) > 0:
+                just_tab[-1] = False
+            for c in word:
+                if pixlen(lbuff) <= maxwidth - pixlen(c):
+                    lbuff += c
+                else:
+                    lbuff += "\n"
+                    text += lbuff
+                    pos += lheight * progr
+                    just_tab.append(False)
+                    lbuff = c
+            lbuff += " "
+            rest = maxwidth - pixlen(lbuff)
+        if lbuff != "":
+            text += lbuff.rstrip()
+            just_tab.append(False)
+        if i < len(t0) - 1:
+            text += "\n"
+            pos += lheight * progr
+
+    more = (pos - maxpos) * progr
+    if more > fitz.EPSILON:
+        return -more, None
+    more = abs(more)
+    if more < fitz.EPSILON:
+        more = 0
+    simple = tjmode < 2
+    tj_glyphs = glyphs if tjmode in (1, 2) else None
+    ordering = 0 if tjmode == 3 else -1
+    lines = []
+    for i, t in enumerate(text.splitlines()):
+        pl = maxwidth - pixlen(t)
+        shift = spacing = 0
+        if align == 1:
+            shift = pl / 2
+        elif align == 2:
+            shift = pl
+        elif align == 3:
+            spaces = t.count(" ")
+            if spaces > 0 and just_tab[i]:
+                spacing = pl / spaces
+        lines.append((fitz.getTJstr(t, tj_glyphs, simple, ordering), shift, spacing))
+    return more, lines
+
+
+def new_layout(t0, glyphs, fontsize, maxwidth, align, pos, maxpos, progr, tjmode):
+    import struct
+
+    if glyphs is None:
+        gids = widths = None
+    else:
+        n = len(glyphs)
+        gids = struct.pack("%ii" % n, *[g[0] for g in glyphs])
+        widths = struct.pack("%if" % n, *[g[1] for g in glyphs])
+    return fitz.TOOLS._layout_textbox(
+        t0, gids, widths, tjmode, fontsize, maxwidth, align,
+        pos, maxpos, fontsize * 1.2 * progr, progr,
+    )
+
+
+WORDS = ["a", "the", "of", "text", "layout", "justification", "x" * 40, ""]
+
+
+def random_text(rnd):
+    lines = []
+    for _ in range(rnd.randint(1, 6)):
+        lines.append(" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 15))))
+    return lines
+
+
+@pytest.fixture(scope="module")
+def helv_glyphs():
+    doc = fitz.open()
+    page = doc.newPage()
+    xref = page.insertFont("helv")
+    return doc.getCharWidths(xref, 256)
+
+
+@pytest.mark.parametrize("align", [0, 1, 2, 3])
+@pytest.mark.parametrize("cjk", [False, True])
+def test_layout_as_before(helv_glyphs, align, cjk):
+    rnd = random.Random(align)
+    glyphs = None if cjk else helv_glyphs
+    tjmode = 3 if cjk else 0
+    for _ in range(200):
+        t0 = random_text(rnd)
+        fontsize = rnd.choice([8, 11, 14.5])
+        maxwidth = rnd.choice([50, 120.5, 300])
+        maxpos = rnd.choice([100, 400, 1000])  # some texts overflow
+        args = (t0, glyphs, fontsize, maxwidth, align, 50, maxpos, 1, tjmode)
+        more, lines = new_layout(*args)
+        old_more, old_lines = old_layout(*args)
+        assert more == pytest.approx(old_more)
+        if old_lines is None:
+            assert lines is None
+            continue
+        assert len(lines) == len(old_lines)
+        for (tj, shift, spacing), (otj, oshift, ospacing) in zip(lines, old_lines):
+            assert tj == otj
+            assert shift == pytest.approx(oshift)
+            assert spacing == pytest.approx(ospacing)
+
+
+def test_insert_textbox_overflow():
+    doc = fitz.open()
+    page = doc.newPage()
+    rect = fitz.Rect(50, 50, 150, 80)
+    assert page.insertTextbox(rect, "word " * 100) < 0
+    assert page.insertTextbox(rect, "word") > 0
@@ -0,0 +1,26 @@
+"""
+The lazy TextPage iterators must deliver the same items as extractDICT.
+"""
+import fitz
+
+
+def make_textpage():
+    doc = fitz.open()
+    page = doc.newPage()
+    for i in range(20):
+        page.insertText((72, 72 + 30 * i), "line %i\nsecond line %i" % (i, i))
+    return page.getTextPage()
+
+
+def test_iterators_match_dict():
+    tp = make_textpage()
+    blocks = [b for b in tp.extractDICT()["blocks"] if b["type"] == 0]
+    lines = [l for b in blocks for l in b["lines"]]
+    spans = [s for l in lines for s in l["spans"]]
+
+    assert [l["bbox"] for l in tp.iter_lines()] == [l["bbox"] for l in lines]
+    assert list(tp.iter_spans()) == spans
+    # spans line by line, and going back to earlier lines
+    it_lines = list(tp.iter_lines())
+    assert [s for l in it_lines for s in tp.iter_spans(l)] == spans
+    assert list(tp.iter_spans(it_lines[0])) == lines[0]["spans"]